@@ -0,0 +1 @@
+"""Offline benchmarks for the moo plugin (run from the repository root)."""
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Many threads hammering _db_increment on one bot.
+
+Every thread sends its share of moos straight through _db_increment
+(write_behind off, so each one is its own transaction), over a few nicks
+and channels so the threads keep hitting the same rows. Afterwards the
+stored global and channel counts and moo_totals must match exactly what
+was sent, and the new counts handed back must be distinct: two increments
+that saw the same count would have overwritten each other. Runs on both
+DB styles, with UPSERT ... RETURNING and without it (a write, then a read).
+
+    python -m bench.bench_concurrency [--threads 8] [--moos 500]
+
+tests/test_concurrency.py runs the same checks.
+"""
+
+import argparse
+import importlib
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from bench.fakes import FakeBot, ScratchLegacyDB, ScratchSessionDB
+
+import moo
+
+DB_STYLES = {"session": ScratchSessionDB, "connect": ScratchLegacyDB}
+NICKS = ["alice", "bob", "carol"]
+CHANNELS = ["#moo", "#cows"]
+
+
+def hammer(bot, threads, moos):
+    """Run threads × moos increments; returns (sent, counts handed back per key)."""
+    barrier = threading.Barrier(threads)
+    sent = [Counter() for _ in range(threads)]
+    seen = [defaultdict(list) for _ in range(threads)]
+
+    def worker(k):
+        barrier.wait()
+        for i in range(moos):
+            nick, channel = NICKS[(k + i) % len(NICKS)], CHANNELS[i % len(CHANNELS)]
+            g_count, c_count = moo._db_increment(bot, nick, channel, 1)
+            sent[k][nick, channel] += 1
+            seen[k][nick].append(g_count)
+            seen[k][nick, channel].append(c_count)
+
+    workers = [threading.Thread(target=worker, args=(k,)) for k in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+
+    total, returned = Counter(), defaultdict(list)
+    for part in sent:
+        total.update(part)
+    for part in seen:
+        for key, counts in part.items():
+            returned[key].extend(counts)
+    return total, returned
+
+
+def check(store, sent, returned):
+    """What the store lost or mixed up, as a list of messages (empty if nothing)."""
+    errors = []
+    glob, chan, totals = Counter(), Counter(), Counter()
+    for (nick, channel), v in sent.items():
+        glob[nick] += v
+        chan[nick, channel] += v
+        totals[moo.GLOBAL_SCOPE] += v
+        totals[channel] += v
+    for nick, v in glob.items():
+        if store.get(nick) != v:
+            errors.append(f"{nick}: global count {store.get(nick)}, sent {v}")
+    for (nick, channel), v in chan.items():
+        if store.get(nick, channel) != v:
+            errors.append(f"{nick} in {channel}: count {store.get(nick, channel)}, sent {v}")
+    stored = store.totals()
+    if stored != dict(totals):
+        errors.append(f"moo_totals {stored}, sent {dict(totals)}")
+    # Every increment by 1 must have seen its own new count
+    for key, counts in returned.items():
+        want = glob[key] if isinstance(key, str) else chan[key]
+        if sorted(counts) != list(range(1, want + 1)):
+            errors.append(f"{key}: counts handed back aren't 1..{want} once each")
+    return errors
+
+
+def run(style, returning, threads, moos):
+    importlib.reload(moo)
+    bot = FakeBot(DB_STYLES[style](), moo_options={"write_behind": "false",
+                                                   "db_maintenance": "false"})
+    moo.setup(bot)
+    store = moo._store(bot)
+    if not returning:
+        store.returning = False
+    start = time.perf_counter()
+    sent, returned = hammer(bot, threads, moos)
+    elapsed = time.perf_counter() - start
+    errors = check(store, sent, returned)
+    moo.shutdown(bot)
+
+    label = f"{style} returning={'on' if returning else 'off'}"
+    print(f"{label:24s} {threads} threads  {threads * moos / elapsed:8.0f} moos/s  "
+          f"{'OK' if not errors else 'FAILED'}")
+    for error in errors[:10]:
+        print(f"  {error}")
+    return not errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--moos", type=int, default=500, help="per thread")
+    parser.add_argument("--db", default="session,connect")
+    args = parser.parse_args(argv)
+
+    ok = all([run(style, returning, args.threads, args.moos)
+              for style in args.db.split(",") for returning in (True, False)])
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Per-moo DB latency on the legacy (connect()) path, before and after pooling.
+
+"before" replays what every moo used to cost: connect, SELECT, write back,
+commit and close, once for moo_counts and once for moo_counts_chan (the
+per-channel table of the time, recreated for the replay).
+
+    python -m bench.bench_db [iterations]
+"""
+
+import dataclasses
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from bench.fakes import FakeBot, LegacyDB
+
+import moo
+
+
+def _before(db, nick, chan):
+    for table, key_sql, key in (
+        ("moo_counts", "nick = ?", (nick,)),
+        ("moo_counts_chan", "nick = ? AND channel = ?", (nick, chan)),
+    ):
+        conn = db.connect()
+        cur = conn.cursor()
+        cur.execute(f"SELECT count FROM {table} WHERE {key_sql}", key)
+        row = cur.fetchone()
+        new = (row[0] if row else 0) + 1
+        if table == "moo_counts":
+            cur.execute("INSERT OR REPLACE INTO moo_counts (nick, count) VALUES (?, ?)", (nick, new))
+        else:
+            cur.execute(
+                "INSERT OR REPLACE INTO moo_counts_chan (nick, channel, count) VALUES (?, ?, ?)",
+                (nick, chan, new)
+            )
+        conn.commit()
+        conn.close()
+
+
+def _time_calls(fn, iterations):
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "mean_us": statistics.fmean(samples) * 1e6,
+        "p50_us": samples[len(samples) // 2] * 1e6,
+        "p99_us": samples[int(len(samples) * 0.99)] * 1e6,
+    }
+
+
+def main(iterations=2000):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        db = LegacyDB(path)
+        bot = FakeBot(db, moo_options={"write_behind": "false"})
+        moo.setup(bot)
+        conn = db.connect()
+        conn.execute(moo.SQL_CREATE_COUNTS_CHAN)
+        conn.close()
+
+        nicks = [f"nick{i}" for i in range(100)]
+        results = {
+            "before (connect per call)": _time_calls(
+                lambda i: _before(db, nicks[i % 100], "#bench"), iterations),
+            "after (pooled, atomic)": _time_calls(
+                lambda i: moo._db_increment(bot, nicks[i % 100], "#bench", 1), iterations),
+        }
+
+        moo.SETTINGS = dataclasses.replace(moo.SETTINGS, write_behind=True)
+        results["after (write-behind)"] = _time_calls(
+            lambda i: moo._handle_moo_increment(
+                bot, nicks[i % 100], "#bench", legendary=False, say_response=False),
+            iterations)
+        moo.shutdown(bot)
+    finally:
+        os.unlink(path)
+
+    print(f"per-moo latency, {iterations} moos")
+    for name, r in results.items():
+        print(f"  {name:28s} mean {r['mean_us']:8.1f}us  "
+              f"p50 {r['p50_us']:8.1f}us  p99 {r['p99_us']:8.1f}us")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Moo detection on adversarial input: the old rule regex vs classify_moo().
+
+The old rule, ^(?!...).*?\\b(m[0o]+)\\b, re-runs the m[0o]+ attempt at every
+position its lazy .*? reaches; on lines packed with "mooooo…x" tokens that
+is super-linear. classify_moo() is a single forward scan.
+
+    python -m bench.bench_detect
+"""
+
+import re
+import time
+
+from bench.fakes import ROOT  # noqa: F401  (puts the repo root on sys.path)
+
+import moo
+
+OLD_RULE = re.compile(r"(?i)^(?!\s*sudo\s+moo\s*$).*?\b(m[0o]+)\b")
+NEW_GATE = re.compile(moo.moo_response.search_rules[0], re.IGNORECASE)
+
+
+def _new(line):
+    """What a line costs now: Sopel's search gate, then classify_moo()."""
+    return NEW_GATE.search(line) and moo.classify_moo(line)
+
+
+CASES = {
+    "no m at all": lambda n: "abc def " * (n // 8),
+    "mooo…x tokens": lambda n: ("m" + "o" * 60 + "x ") * (n // 63),
+    "one huge mooo…x": lambda n: "m" + "o" * n + "x",
+    "mmmm…": lambda n: "m" * n,
+    "moo at the end": lambda n: "x" * n + " moo",
+}
+
+
+def _best_of(fn, line, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(line)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    print(f"{'case':18s} {'length':>8s} {'old rule':>12s} {'gate+classify':>14s}")
+    for name, make in CASES.items():
+        for length in (1000, 10000, 100000):
+            line = make(length)
+            old = _best_of(OLD_RULE.match, line)
+            new = _best_of(_new, line)
+            print(f"{name:18s} {len(line):8d} {old * 1e6:10.1f}us {new * 1e6:12.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Handler throughput and latency at synthetic scale.
+
+Every user-facing handler is called directly with a fake bot and trigger,
+against a scratch sqlite file pre-filled with N nicks, for both DB styles
+(SQLAlchemy session() and legacy connect()). Cooldowns are set to 0 so each
+call does the full amount of work. Results are written as JSON; pass an
+earlier results file with --compare to print the change per handler.
+
+    python -m bench.bench_handlers [--scales 1000,100000,1000000]
+        [--iterations 2000] [--db session,connect] [--out FILE]
+        [--compare OLD.json]
+"""
+
+import argparse
+import dataclasses
+import importlib
+import json
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+
+from bench.fakes import ROOT, FakeBot, FakeChannel, FakeTrigger, ScratchLegacyDB, ScratchSessionDB
+
+import moo
+
+CHANNELS = ["#moo", "#cows", "#pasture", "#barn"]
+DB_STYLES = {"session": ScratchSessionDB, "connect": ScratchLegacyDB}
+FILL_BATCH = 50000
+WHO_USERS = 500   # users in each channel for .moowho
+
+
+def _populate(db, nicks, seed=42):
+    """Give every nick a global count and a count in one channel."""
+    rng = random.Random(seed)
+    conn = db.connect()
+    try:
+        conn.executemany("INSERT INTO moo_channels (channel) VALUES (?)", [(c,) for c in CHANNELS])
+        for start in range(0, nicks, FILL_BATCH):
+            rows = [
+                (f"n{i:07d}", CHANNELS[i % len(CHANNELS)], int(rng.paretovariate(1.2)))
+                for i in range(start, min(start + FILL_BATCH, nicks))
+            ]
+            conn.executemany(
+                "INSERT INTO moo_counts (nick, count) VALUES (?, ?)",
+                [(n, c) for n, _, c in rows],
+            )
+            conn.executemany("INSERT INTO moo_nicks (nick) VALUES (?)", [(n,) for n, _, _ in rows])
+            conn.executemany(
+                "INSERT INTO moo_chan_counts (channel_id, nick_id, nick, count) "
+                "SELECT c.id, n.id, n.nick, ? FROM moo_channels c, moo_nicks n "
+                "WHERE c.channel = ? AND n.nick = ?",
+                [(count, channel, nick) for nick, channel, count in rows],
+            )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _fresh_bot(style, nicks):
+    """Reload the plugin (clean module state) and set up a filled DB."""
+    importlib.reload(moo)
+    db = DB_STYLES[style]()
+    bot = FakeBot(db)
+    moo.setup(bot)
+    _populate(db, nicks)
+    moo._reconcile_totals(bot)
+    moo._load_top(bot)
+    for k, channel in enumerate(CHANNELS):
+        users = [f"n{(k + i * len(CHANNELS)) % nicks:07d}" for i in range(WHO_USERS)]
+        bot.channels[channel] = FakeChannel(users)
+    moo.SETTINGS = dataclasses.replace(
+        moo.SETTINGS, moo_cooldown=0, sudo_cooldown=0, max_rate_per_15sec=0
+    )
+    return bot
+
+
+def _cases(nicks):
+    """handler name → (handler, fn(i) building the i-th trigger)."""
+    def nick(i):
+        return f"n{(i * 7919) % nicks:07d}"
+
+    def chan(i):
+        return CHANNELS[i % len(CHANNELS)]
+
+    return {
+        "moo_response": (moo.moo_response,
+                         lambda i: FakeTrigger("moo", nick=nick(i), sender=chan(i))),
+        "moo_action": (moo.moo_action,
+                       lambda i: FakeTrigger("moos", nick=nick(i), sender=chan(i))),
+        "sudo_moo": (moo.sudo_moo,
+                     lambda i: FakeTrigger("sudo moo", nick=nick(i), sender=chan(i))),
+        "moocount": (moo.moocount,
+                     lambda i: FakeTrigger(f".moocount {nick(i + 1)}", nick=nick(i), sender=chan(i))),
+        "moocount_hot": (moo.moocount,
+                         lambda i: FakeTrigger(f".moocount {nick(i % 50)}", nick=nick(i), sender=chan(i))),
+        "moocount_multi": (moo.moocount,
+                           lambda i: FakeTrigger(".moocount " + " ".join(nick(i + k) for k in range(5)),
+                                                 nick=nick(i), sender=chan(i))),
+        "moowho": (moo.moowho,
+                   lambda i: FakeTrigger(".moowho", nick=nick(i), sender=chan(i))),
+        "mootop_global": (moo.mootop_global,
+                          lambda i: FakeTrigger(".mootop 10", nick=nick(i), sender=chan(i))),
+        "mootop_channel": (moo.mootop_channel,
+                           lambda i: FakeTrigger(".mootopchan 10", nick=nick(i), sender=chan(i))),
+        "mootop_page": (moo.mootop_global,
+                        lambda i: FakeTrigger(f".mootop 50 page {i % 200 + 2}", nick=nick(i), sender=chan(i))),
+        "moorank": (moo.moorank,
+                    lambda i: FakeTrigger(f".moorank {nick(i + 1)}", nick=nick(i), sender=chan(i))),
+        "totalmoo": (moo.totalmoo,
+                     lambda i: FakeTrigger(".moostats", nick=nick(i), sender=chan(i))),
+    }
+
+
+def _measure(bot, handler, make_trigger, iterations):
+    triggers = [make_trigger(i) for i in range(iterations)]
+    samples = []
+    wall = time.perf_counter()
+    for trigger in triggers:
+        start = time.perf_counter()
+        handler(bot, trigger)
+        samples.append(time.perf_counter() - start)
+    wall = time.perf_counter() - wall
+    bot.sent.clear()
+    samples.sort()
+    return {
+        "ops_per_sec": iterations / wall,
+        "mean_us": statistics.fmean(samples) * 1e6,
+        "p50_us": samples[len(samples) // 2] * 1e6,
+        "p99_us": samples[int(len(samples) * 0.99)] * 1e6,
+    }
+
+
+def _revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _compare(old_path, results):
+    with open(old_path, encoding="utf-8") as f:
+        old = {(r["db"], r["nicks"], r["handler"]): r for r in json.load(f)["results"]}
+    print(f"\nvs {old_path} (p50 / p99 ratio, <1 is faster)")
+    for r in results:
+        before = old.get((r["db"], r["nicks"], r["handler"]))
+        if before:
+            print(f"  {r['db']:8s} {r['nicks']:>9,} {r['handler']:15s} "
+                  f"p50 x{r['p50_us'] / before['p50_us']:5.2f}  "
+                  f"p99 x{r['p99_us'] / before['p99_us']:5.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", default="1000,100000,1000000")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--db", default="session,connect")
+    parser.add_argument("--out", default=f"bench-handlers-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    parser.add_argument("--compare", metavar="OLD.json")
+    args = parser.parse_args(argv)
+
+    results = []
+    for style in args.db.split(","):
+        for nicks in (int(n) for n in args.scales.split(",")):
+            start = time.perf_counter()
+            bot = _fresh_bot(style, nicks)
+            print(f"{style}, {nicks:,} nicks (setup {time.perf_counter() - start:.1f}s)")
+            for name, (handler, make_trigger) in _cases(nicks).items():
+                r = _measure(bot, handler, make_trigger, args.iterations)
+                results.append({"db": style, "nicks": nicks, "handler": name, **r})
+                print(f"  {name:15s} {r['ops_per_sec']:9.0f} ops/s  "
+                      f"p50 {r['p50_us']:8.1f}us  p99 {r['p99_us']:8.1f}us")
+            moo.shutdown(bot)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({
+            "meta": {
+                "revision": _revision(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "iterations": args.iterations,
+            },
+            "results": results,
+        }, f, indent=1)
+    print(f"wrote {args.out}")
+
+    if args.compare:
+        _compare(args.compare, results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
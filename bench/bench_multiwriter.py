@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Several bot processes mooing into one sqlite file in WAL mode.
+
+Each worker loads the plugin with its own node_id and sends its share of
+moos through the normal increment path (the writer thread, or a commit per
+moo with --sync), syncing with the other nodes as it goes. Afterwards the
+parent checks that no moo was lost or counted twice, that each node's own
+counters add up to what it sent, and that every worker's leaderboard index
+and rank tree matched the merged tables after a final sync.
+
+    python -m bench.bench_multiwriter [--procs 4] [--moos 20000] [--nicks 500]
+        [--db connect,session] [--sync]
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from bench.fakes import FakeBot, LegacyDB, SessionDB
+
+import moo
+
+CHANNELS = ["#moo", "#cows", "#pasture"]
+DB_STYLES = {"session": SessionDB, "connect": LegacyDB}
+SYNC_EVERY = 1000   # moos between a worker's own node syncs
+BARRIER_TIMEOUT = 600
+
+
+def _worker(style, path, node, moos, nicks, write_behind, barrier, results):
+    bot = FakeBot(DB_STYLES[style](path), moo_options={
+        "node_id": node,
+        "write_behind": write_behind,
+        "history_days": 0,
+    })
+    moo.setup(bot)
+    rng = random.Random(node)
+    sent = Counter()
+
+    barrier.wait(BARRIER_TIMEOUT)
+    moo._sync_nodes(bot)   # the first sync reloads; load the caches after it
+    moo._load_top(bot, CHANNELS[0])
+    moo._rank_tree(bot)
+    start = time.perf_counter()
+    for i in range(moos):
+        nick, chan = f"n{rng.randrange(nicks)}", rng.choice(CHANNELS)
+        inc = rng.choice((1, 1, 1, 2, 20, -3))
+        moo._handle_moo_increment(bot, nick, chan, legendary=False,
+                                  say_response=False, inc_override=inc)
+        sent[nick, chan] += inc
+        if i % SYNC_EVERY == SYNC_EVERY - 1:
+            moo._sync_nodes(bot)
+    moo.WRITER.stop()
+    moo._flush_pending(bot)
+    elapsed = time.perf_counter() - start
+
+    # Everyone's moos are in; one more sync must make every cache exact
+    barrier.wait(BARRIER_TIMEOUT)
+    synced = moo._sync_nodes(bot)
+    with moo._FLUSH_LOCK, moo._TOP_LOCK:
+        top = {None: moo._TOP_GLOBAL.top(moo.LEADERBOARD_KEEP),
+               CHANNELS[0]: moo._TOP_CHAN[CHANNELS[0]].top(moo.LEADERBOARD_KEEP)}
+        ranks = dict(moo._RANK_GLOBAL.counts)
+    bad = 0
+    store = moo._store(bot)
+    for channel, entries in top.items():
+        bad += entries != store.top(channel, len(entries))
+    bad += ranks != dict(store.scan(None))
+    moo.shutdown(bot)
+    results.put((node, dict(sent), elapsed, synced, bad))
+
+
+def _check(path, sent_by_node):
+    conn = sqlite3.connect(path)
+    errors = []
+    total = Counter()
+    for node, sent in sent_by_node.items():
+        total.update(sent)
+        own = {(nick, channel or None): count for nick, channel, count in conn.execute(
+            "SELECT nick, channel, count FROM moo_node_counts WHERE node = ?", (node,)
+        )}
+        expected = Counter()
+        for (nick, chan), v in sent.items():
+            expected[nick, chan] += v
+            expected[nick, None] += v
+        if own != dict(expected):
+            errors.append(f"node {node}: own counters don't match what it sent")
+
+    glob, chan = Counter(), Counter()
+    for (nick, c), v in total.items():
+        glob[nick] += v
+        chan[nick, c] += v
+    if dict(conn.execute("SELECT nick, count FROM moo_counts")) != dict(glob):
+        errors.append("moo_counts differs from the sum of all nodes' moos")
+    stored = {(n, c): v for n, c, v in conn.execute(
+        "SELECT n.nick, c.channel, k.count FROM moo_chan_counts k "
+        "JOIN moo_nicks n ON n.id = k.nick_id JOIN moo_channels c ON c.id = k.channel_id"
+    )}
+    if stored != dict(chan):
+        errors.append("moo_chan_counts differs from the sum of all nodes' moos")
+    totals = dict(conn.execute("SELECT scope, total FROM moo_totals"))
+    if totals.get(moo.GLOBAL_SCOPE) != sum(glob.values()):
+        errors.append("global running total is off")
+    conn.close()
+    return errors
+
+
+def run(style, procs, moos, nicks, write_behind):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.close()
+    moo._migrate(FakeBot(LegacyDB(path)))
+    moo._legacy_close_all()
+
+    ctx = multiprocessing.get_context("spawn")
+    barrier, results = ctx.Barrier(procs), ctx.Queue()
+    workers = [
+        ctx.Process(target=_worker, args=(style, path, f"node{i}", moos // procs, nicks,
+                                          write_behind, barrier, results))
+        for i in range(procs)
+    ]
+    for w in workers:
+        w.start()
+    done = []
+    while len(done) < procs:
+        try:
+            done.append(results.get(timeout=1))
+        except queue.Empty:
+            if any(w.exitcode for w in workers):
+                for w in workers:
+                    w.terminate()
+                raise SystemExit("a worker process failed")
+    for w in workers:
+        w.join()
+
+    slowest = max(elapsed for _, _, elapsed, _, _ in done)
+    errors = _check(path, {node: sent for node, sent, _, _, _ in done})
+    errors += [f"{node}: cache differs from the merged tables after sync"
+               for node, _, _, _, bad in done if bad]
+    synced = sum(max(s, 0) for _, _, _, s, _ in done)
+    print(f"{style:8s} {procs} procs  {moos // procs * procs / slowest:9.0f} moos/s  "
+          f"final sync folded in {synced:,} keys  {'OK' if not errors else 'FAILED'}")
+    for error in errors:
+        print(f"  {error}")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return not errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--procs", type=int, default=4)
+    parser.add_argument("--moos", type=int, default=20000, help="total, split across processes")
+    parser.add_argument("--nicks", type=int, default=500)
+    parser.add_argument("--db", default="connect,session")
+    parser.add_argument("--sync", action="store_true", help="commit every moo (write_behind off)")
+    args = parser.parse_args(argv)
+
+    ok = all([run(style, args.procs, args.moos, args.nicks, not args.sync)
+              for style in args.db.split(",")])
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
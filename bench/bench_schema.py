@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Channel counts before and after interning (schema version 6), on a synthetic dataset.
+
+"before" is a DB at schema version 5: moo_counts_chan keyed by (nick,
+channel) TEXT. "after" is a copy of it migrated to moo_nicks, moo_channels
+and the WITHOUT ROWID moo_chan_counts. Both files are VACUUMed before
+they're measured. Queries run on one tuned sqlite3 connection per file:
+the old statements (as they were) against the new ones, with ids already
+resolved as the store's id cache has them. "id lookup" is what a cache
+miss costs on top.
+
+    python -m bench.bench_schema [--rows 1000000] [--channels 100]
+        [--per-nick 4] [--iterations 5000]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import string
+import sys
+import tempfile
+import time
+
+from bench.fakes import FakeBot, LegacyDB
+
+import moo
+
+FILL_BATCH = 50000
+MIN_SHOWN = 0.01   # tables and indexes under this share of the file aren't listed
+
+# The per-channel statements of schema version 5
+OLD_GET = "SELECT count FROM moo_counts_chan WHERE nick = :n AND channel = :c"
+OLD_UPSERT = """
+    INSERT INTO moo_counts_chan (nick, channel, count) VALUES (:n, :c, :v)
+    ON CONFLICT(nick, channel) DO UPDATE SET count = count + excluded.count
+"""
+OLD_TOP = ("SELECT nick, count FROM moo_counts_chan WHERE channel = :c "
+           "ORDER BY count DESC, nick LIMIT :l")
+OLD_PAGE = ("SELECT nick, count FROM moo_counts_chan WHERE channel = :c AND count <= :v "
+            "ORDER BY count DESC, nick LIMIT :l")
+OLD_SUM = "SELECT COALESCE(SUM(count), 0) FROM moo_counts_chan WHERE channel = :c"
+
+
+def _name(rng, prefix, low, high):
+    return prefix + "".join(rng.choices(string.ascii_lowercase + "_-", k=rng.randint(low, high)))
+
+
+def _setup(path, max_version=None):
+    """Create or migrate the moo tables in path, up to max_version (default: all)."""
+    migrations = moo.MIGRATIONS
+    if max_version is not None:
+        moo.MIGRATIONS = [m for m in migrations if m[0] <= max_version]
+    try:
+        bot = FakeBot(LegacyDB(path), moo_options={"write_behind": "false",
+                                                   "db_maintenance": "false"})
+        moo.setup(bot)
+        moo.shutdown(bot)
+    finally:
+        moo.MIGRATIONS = migrations
+
+
+def _fill(path, rows, channels, per_nick, seed=42):
+    """Give rows // per_nick nicks a global count and a count in per_nick channels."""
+    rng = random.Random(seed)
+    chans = sorted({_name(rng, "#", 4, 14) for _ in range(channels * 2)})[:channels]
+    keys = []
+    conn = sqlite3.connect(path)
+    nicks = rows // per_nick
+    for start in range(0, nicks, FILL_BATCH):
+        g_rows, c_rows = [], []
+        for i in range(start, min(start + FILL_BATCH, nicks)):
+            nick = f"{_name(rng, '', 3, 11)}{i}"
+            count = int(rng.paretovariate(1.2))
+            g_rows.append((nick, count * per_nick))
+            for chan in rng.sample(chans, per_nick):
+                c_rows.append((nick, chan, count))
+        conn.executemany("INSERT INTO moo_counts (nick, count) VALUES (?, ?)", g_rows)
+        conn.executemany("INSERT INTO moo_counts_chan (nick, channel, count) VALUES (?, ?, ?)", c_rows)
+        keys.extend(rng.sample(c_rows, 20))
+    conn.commit()
+    conn.close()
+    return keys, chans
+
+
+def _vacuum(path):
+    conn = sqlite3.connect(path)
+    conn.execute("VACUUM")
+    sizes = {}
+    try:
+        sizes = dict(conn.execute(
+            "SELECT name, SUM(pgsize) FROM dbstat WHERE name LIKE 'moo_%' "
+            "OR name LIKE 'sqlite_autoindex_moo_%' GROUP BY name"
+        ))
+    except sqlite3.OperationalError:
+        pass   # built without dbstat
+    conn.close()
+    return os.path.getsize(path), sizes
+
+
+def _time_calls(fn, iterations):
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2] * 1e6, samples[int(len(samples) * 0.99)] * 1e6
+
+
+def _cases(conn, keys, chans, old):
+    """name → fn(i) for one file; ids come from a dict, as from the id cache."""
+    big = chans[0]
+    below = conn.execute(
+        "SELECT count FROM moo_counts ORDER BY count DESC LIMIT 1 OFFSET 2000"
+    ).fetchone()[0] // 4
+
+    def run(sql, params, commit=False):
+        conn.execute(sql, params).fetchall()
+        if commit:
+            conn.commit()
+
+    if old:
+        return {
+            "get": lambda i: run(OLD_GET, {"n": keys[i % len(keys)][0], "c": keys[i % len(keys)][1]}),
+            "increment": lambda i: run(OLD_UPSERT, {"n": keys[i % len(keys)][0],
+                                                    "c": keys[i % len(keys)][1], "v": 1}, True),
+            "top": lambda i: run(OLD_TOP, {"c": chans[i % len(chans)], "l": 10}),
+            "page": lambda i: run(OLD_PAGE, {"c": big, "v": below, "l": 60}),
+            "page_ties": lambda i: run(OLD_PAGE, {"c": big, "v": 1, "l": 60}),
+            "sum": lambda i: run(OLD_SUM, {"c": chans[i % len(chans)]}),
+        }
+
+    nick_ids = {n: conn.execute(moo.SQL_ID["nick"], {"x": n}).fetchone()[0] for n, _, _ in keys}
+    chan_ids = dict(conn.execute("SELECT channel, id FROM moo_channels"))
+
+    def ids(i):
+        nick, chan, _ = keys[i % len(keys)]
+        return {"ni": nick_ids[nick], "ci": chan_ids[chan], "n": nick}
+
+    return {
+        "get": lambda i: run(moo.SQL_GET_CHAN, ids(i)),
+        "increment": lambda i: run(moo.SQL_UPSERT_CHAN, {**ids(i), "v": 1}, True),
+        "top": lambda i: run(moo.SQL_TOP_CHAN, {"ci": chan_ids[chans[i % len(chans)]], "l": 10}),
+        "page": lambda i: run(moo.SQL_PAGE_CHAN, {"ci": chan_ids[big], "v": below, "l": 60}),
+        "page_ties": lambda i: run(moo.SQL_PAGE_CHAN, {"ci": chan_ids[big], "v": 1, "l": 60}),
+        "sum": lambda i: run(moo.SQL_SUM_CHAN, {"ci": chan_ids[chans[i % len(chans)]]}),
+        "id lookup": lambda i: run(moo.SQL_ID["nick"], {"x": keys[i % len(keys)][0]}),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--channels", type=int, default=100)
+    parser.add_argument("--per-nick", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    tmp = tempfile.mkdtemp()
+    before, after = os.path.join(tmp, "before.db"), os.path.join(tmp, "after.db")
+    try:
+        _setup(before, max_version=5)
+        keys, chans = _fill(before, args.rows, args.channels, args.per_nick)
+        before_size, before_objects = _vacuum(before)
+
+        shutil.copy(before, after)
+        start = time.perf_counter()
+        _setup(after)
+        migrated = time.perf_counter() - start
+        after_size, after_objects = _vacuum(after)
+
+        print(f"{args.rows:,} channel rows, {args.rows // args.per_nick:,} nicks, "
+              f"{args.channels} channels (migration {migrated:.1f}s)")
+        print(f"  file size  before {before_size / 2**20:8.1f} MB  "
+              f"after {after_size / 2**20:8.1f} MB  ({after_size / before_size:.0%})")
+        for label, objects, total in (("before", before_objects, before_size),
+                                      ("after", after_objects, after_size)):
+            for name, size in sorted(objects.items()):
+                if size >= total * MIN_SHOWN:
+                    print(f"    {label:6s}  {name:34s} {size / 2**20:8.1f} MB")
+
+        timings = {}
+        for label, path in (("before", before), ("after", after)):
+            conn = sqlite3.connect(path)
+            moo._tune_connection(conn)
+            for name, fn in _cases(conn, keys, chans, old=label == "before").items():
+                n = args.iterations if not name.startswith("page") else max(1, args.iterations // 10)
+                timings.setdefault(name, {})[label] = _time_calls(fn, n)
+            conn.close()
+        for name, runs in timings.items():
+            line = "  ".join(f"{label} p50 {p50:8.1f}us p99 {p99:8.1f}us"
+                             for label, (p50, p99) in runs.items())
+            print(f"  {name:10s} {line}")
+    finally:
+        shutil.rmtree(tmp)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
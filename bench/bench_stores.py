@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Storage backends side by side: increments, count lookups and leaderboard
+loads at N nicks, p50 and p99 per call. That every backend gives the same
+answers is checked by tests/test_store_conformance.py.
+
+    python -m bench.bench_stores [--backends sqlalchemy,sqlite,memory]
+        [--nicks 100000] [--iterations 5000]
+"""
+
+import argparse
+import dataclasses
+import importlib
+import random
+import sys
+import time
+
+from bench.fakes import FakeBot, ScratchLegacyDB, ScratchSessionDB
+
+import moo
+
+CHANNELS = ["#moo", "#cows", "#barn"]
+DBS = {"sqlalchemy": ScratchSessionDB, "sqlite": ScratchLegacyDB, "memory": ScratchLegacyDB}
+FILL_BATCH = 50000
+
+
+def _fresh_bot(backend, **options):
+    """Reload the plugin (clean module state) and set it up on a new DB."""
+    importlib.reload(moo)
+    bot = FakeBot(DBS[backend](), moo_options={"backend": backend, **options})
+    moo.setup(bot)
+    assert moo.STORE.name == backend, moo.STORE.name
+    moo.SETTINGS = dataclasses.replace(
+        moo.SETTINGS, moo_cooldown=0, sudo_cooldown=0, max_rate_per_15sec=0
+    )
+    return bot
+
+
+def _populate(bot, nicks, seed=42):
+    rng = random.Random(seed)
+    store = moo._store(bot)
+    for start in range(0, nicks, FILL_BATCH):
+        g_rows, c_rows = [], []
+        for i in range(start, min(start + FILL_BATCH, nicks)):
+            count = int(rng.paretovariate(1.2))
+            g_rows.append({"n": f"n{i:07d}", "v": count})
+            c_rows.append({"n": f"n{i:07d}", "c": CHANNELS[i % len(CHANNELS)], "v": count})
+        store.load(g_rows, c_rows, "overwrite")
+    moo._reconcile_totals(bot)
+
+
+def _time_calls(fn, iterations):
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2] * 1e6, samples[int(len(samples) * 0.99)] * 1e6
+
+
+def timings(backends, nicks, iterations):
+    for backend in backends:
+        bot = _fresh_bot(backend, write_behind="false", count_cache_size=0)
+        start = time.perf_counter()
+        _populate(bot, nicks)
+        print(f"{backend}, {nicks:,} nicks (fill {time.perf_counter() - start:.1f}s)")
+
+        def nick(i):
+            return f"n{(i * 7919) % nicks:07d}"
+
+        cases = {
+            "increment": lambda i: moo._db_increment(bot, nick(i), CHANNELS[i % 3], 1),
+            "get": lambda i: moo.db_helper(bot, nick(i)),
+            "get_chan": lambda i: moo.db_helper_chan(bot, nick(i), CHANNELS[i % 3]),
+            "load_top": lambda i: moo._load_top(bot, CHANNELS[i % 3]),
+        }
+        for name, fn in cases.items():
+            n = iterations if name != "load_top" else max(1, iterations // 50)
+            p50, p99 = _time_calls(fn, n)
+            print(f"  {name:10s} p50 {p50:9.1f}us  p99 {p99:9.1f}us")
+        moo.shutdown(bot)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backends", default="sqlalchemy,sqlite,memory")
+    parser.add_argument("--nicks", type=int, default=100000)
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args(argv)
+    timings(args.backends.split(","), args.nicks, args.iterations)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
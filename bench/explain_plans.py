@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Check that the leaderboard, per-channel total and windowed queries use the indexes
+added by the schema migrations (EXPLAIN QUERY PLAN, no table scan or sort).
+
+    python -m bench.explain_plans
+
+Exits non-zero if a plan regresses. tests/test_query_plans.py runs the same checks.
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+
+from bench.fakes import FakeBot, LegacyDB
+
+import moo
+
+CHANNELS = [f"#chan{i}" for i in range(50)]   # interned first: #chan7 gets id 8
+CHAN7 = 8
+
+# statement → (params, index the plan must use)
+EXPECTED = {
+    moo.SQL_TOP_GLOBAL: ({"l": 10}, "moo_counts_rank"),
+    moo.SQL_TOP_CHAN: ({"ci": CHAN7, "l": 10}, "moo_chan_counts_rank"),
+    moo.SQL_SUM_CHAN: ({"ci": CHAN7}, "moo_chan_counts_rank"),
+    moo.SQL_SUM_CHAN_CHUNK: ({"after": "", "l": 100}, "moo_chan_counts_rank"),
+    moo.SQL_PAGE_GLOBAL: ({"v": 500, "l": 60}, "moo_counts_rank"),
+    moo.SQL_PAGE_CHAN: ({"ci": CHAN7, "v": 500, "l": 60}, "moo_chan_counts_rank"),
+    moo.SQL_LAST_AT_GLOBAL: ({"v": 500, "l": 1}, "moo_counts_rank"),
+    moo.SQL_FIRST_AT_CHAN: ({"ci": CHAN7, "v": 500, "l": 1}, "moo_chan_counts_rank"),
+    moo.SQL_GET_CHAN_MANY[10]: ({"ci": CHAN7, **{f"n{i}": i for i in range(10)}}, "PRIMARY KEY"),
+    moo.SQL_IDS_MANY["nick"][10]: ({f"n{i}": f"nick{i}" for i in range(10)},
+                                   "sqlite_autoindex_moo_nicks_1"),
+    moo.SQL_EXPORT_GLOBAL: ({"n": "", "l": 100}, "sqlite_autoindex_moo_counts_1"),
+    moo.SQL_EXPORT_CHAN: ({"ci": 0, "ni": 0, "l": 100}, "PRIMARY KEY"),
+    moo.SQL_RESET_BOUND["moo_chan_counts"]: ({"a": "", "l": 100}, "PRIMARY KEY"),
+    moo.SQL_NICK_CHAN_CHUNK: ({"ni": 7, "a": 0, "l": 100}, "PRIMARY KEY"),
+    moo.SQL_WINDOW_NICK: ({"n": "nick7", "h": 480, "d": 20}, "moo_daily_nick"),
+    moo.SQL_WINDOW_NICK_CHAN: ({"n": "nick7", "c": "#chan7", "h": 480, "d": 20}, "moo_daily_nick"),
+}
+
+# Windowed tops sum buckets, so they sort to group and rank the sums; each
+# history table must still be searched by its key or an index, never scanned.
+# statement → (params, searches the plan must have)
+AGGREGATES = {
+    moo.SQL_WINDOW_TOP_GLOBAL: ({"h": 740, "d": 25, "l": 10}, (
+        "SEARCH moo_hourly USING PRIMARY KEY", "SEARCH moo_daily USING PRIMARY KEY")),
+    moo.SQL_WINDOW_TOP_CHAN: ({"c": "#chan7", "h": 740, "d": 25, "l": 10}, (
+        "SEARCH moo_hourly USING PRIMARY KEY", "SEARCH moo_daily USING COVERING INDEX moo_daily_chan")),
+}
+
+
+def build(path):
+    """Migrate a new sqlite file at path, fill it with sample rows and analyze it; returns a connection."""
+    bot = FakeBot(LegacyDB(path))
+    moo.setup(bot)
+    moo.shutdown(bot)
+
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO moo_channels (channel) VALUES (?)", [(c,) for c in CHANNELS])
+    conn.executemany("INSERT INTO moo_nicks (nick) VALUES (?)",
+                     [(f"nick{i}",) for i in range(20000)])
+    conn.executemany(
+        "INSERT INTO moo_chan_counts (channel_id, nick_id, nick, count) VALUES (?, ?, ?, ?)",
+        [(i % 50 + 1, i + 1, f"nick{i}", i % 997) for i in range(20000)]
+    )
+    conn.executemany(
+        "INSERT INTO moo_daily (day, channel, nick, count) VALUES (?, ?, ?, ?)",
+        [(i % 30, f"#chan{i % 50}", f"nick{i % 2000}", 1) for i in range(6000)]
+    )
+    conn.executemany(
+        "INSERT INTO moo_hourly (hour, channel, nick, count) VALUES (?, ?, ?, ?)",
+        [(720 + i % 48, f"#chan{i % 50}", f"nick{i % 2000}", 1) for i in range(6000)]
+    )
+    # Sampled statistics, as the plugin's scheduled maintenance gathers them
+    conn.execute(f"PRAGMA analysis_limit = {moo.ANALYSIS_LIMIT}")
+    conn.execute("ANALYZE")
+    conn.commit()
+    return conn
+
+
+def _plan(conn, sql, params):
+    return " | ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+
+
+def check(conn, sql):
+    """(plan, ok) for a statement in EXPECTED or AGGREGATES."""
+    if sql in AGGREGATES:
+        params, searches = AGGREGATES[sql]
+        plan = _plan(conn, sql, params)
+        return plan, all(s in plan for s in searches) and "SCAN moo_" not in plan
+    params, index = EXPECTED[sql]
+    plan = _plan(conn, sql, params)
+    return plan, index in plan and "TEMP B-TREE" not in plan
+
+
+def main():
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    failures = 0
+    try:
+        conn = build(path)
+        for sql in [*EXPECTED, *AGGREGATES]:
+            plan, ok = check(conn, sql)
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {sql}\n     {plan}")
+        conn.close()
+    finally:
+        os.unlink(path)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Minimal stand-ins for the Sopel objects moo.py touches.
+
+Only what the plugin actually uses is implemented: bot.nick, bot.db,
+bot.config.parser, bot.config.core.homedir, bot.channels,
+bot.say/bot.notice and trigger.group/nick/sender.
+"""
+
+import configparser
+import itertools
+import os
+import sqlite3
+import sys
+import tempfile
+import types
+
+# Make `import moo` work when run as `python -m bench.<name>` from the repo root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+class LegacyDB:
+    """Sopel 6 style database: only connect() (plus the filename)."""
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def connect(self):
+        return sqlite3.connect(self.filename)
+
+
+# Scratch databases go to a RAM-backed filesystem where there is one, so
+# commits don't wait on the disk
+SCRATCH_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+class ScratchLegacyDB:
+    """
+    Sopel 6 style database backed by a private sqlite file, removed along
+    with the object.
+
+    No filename is exposed, so the plugin calls connect() for every borrow,
+    like a legacy bot whose DB object can't be pooled. A file rather than a
+    shared-cache memory database, so readers and the writer thread lock each
+    other out the way they would on a real bot's database.
+    """
+
+    def __init__(self):
+        self._dir = tempfile.TemporaryDirectory(prefix="moobench", dir=SCRATCH_DIR)
+        self._path = os.path.join(self._dir.name, "moo.db")
+
+    def connect(self):
+        return sqlite3.connect(self._path, check_same_thread=False)
+
+
+class SessionDB:
+    """Sopel 7+/8 style database: SQLAlchemy session() on a sqlite file."""
+
+    def __init__(self, filename):
+        # Imported here so the legacy-only benchmarks don't need SQLAlchemy
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import scoped_session, sessionmaker
+
+        self.filename = filename
+        self.engine = create_engine(f"sqlite:///{filename}")
+        self._session = scoped_session(sessionmaker(bind=self.engine))
+
+    def session(self):
+        return self._session()
+
+    def connect(self):
+        return self.engine.raw_connection()
+
+
+class ScratchSessionDB(SessionDB):
+    """A SessionDB on a private sqlite file, removed along with the object."""
+
+    def __init__(self):
+        self._dir = tempfile.TemporaryDirectory(prefix="moobench", dir=SCRATCH_DIR)
+        super().__init__(os.path.join(self._dir.name, "moo.db"))
+
+
+class PostgresSessionDB:
+    """
+    Sopel 7+/8 style database: SQLAlchemy session() on a new PostgreSQL
+    database, created through the server at url (dropped by drop()).
+    """
+
+    _ids = itertools.count()
+
+    def __init__(self, url):
+        from sqlalchemy import create_engine, text
+        from sqlalchemy.engine import make_url
+        from sqlalchemy.orm import scoped_session, sessionmaker
+
+        self.name = f"moobench_{os.getpid()}_{next(self._ids)}"
+        self._admin = create_engine(url, isolation_level="AUTOCOMMIT")
+        with self._admin.connect() as conn:
+            conn.execute(text(f"DROP DATABASE IF EXISTS {self.name}"))
+            conn.execute(text(f"CREATE DATABASE {self.name}"))
+        self.engine = create_engine(make_url(url).set(database=self.name))
+        self._session = scoped_session(sessionmaker(bind=self.engine))
+
+    def session(self):
+        return self._session()
+
+    def connect(self):
+        return self.engine.raw_connection()
+
+    def drop(self):
+        from sqlalchemy import text
+
+        self._session.remove()
+        self.engine.dispose()
+        with self._admin.connect() as conn:
+            conn.execute(text(f"DROP DATABASE IF EXISTS {self.name}"))
+        self._admin.dispose()
+
+
+class FakeConfig:
+    def __init__(self, moo_options=None, homedir=None):
+        # No homedir (the default): nothing is saved next to the config
+        self.core = types.SimpleNamespace(homedir=homedir)
+        self.parser = configparser.RawConfigParser(allow_no_value=True)
+        self.parser.add_section("moo")
+        for key, value in (moo_options or {}).items():
+            self.parser.set("moo", key, str(value))
+
+
+class FakeChannel:
+    """bot.channels[name]: just the users, keyed by nick."""
+
+    def __init__(self, users=()):
+        self.users = dict.fromkeys(users)
+
+
+class FakeBot:
+    """Captures everything the plugin sends instead of talking to IRC."""
+
+    def __init__(self, db, nick="MooBot", moo_options=None, homedir=None):
+        self.db = db
+        self.nick = nick
+        self.config = FakeConfig(moo_options, homedir)
+        self.channels = {}
+        self.sent = []
+
+    def say(self, message, destination=None, *args, **kwargs):
+        self.sent.append(("PRIVMSG", destination, message))
+
+    def notice(self, message, destination=None):
+        self.sent.append(("NOTICE", destination, message))
+
+
+class FakeTrigger(str):
+    """
+    A line someone sent: the text itself plus nick, sender and group().
+
+    For commands, group(1) is the command name and group(2) its arguments,
+    as with Sopel's command triggers.
+    """
+
+    def __new__(cls, text, nick="alice", sender="#moo", admin=False):
+        self = super().__new__(cls, text)
+        self.nick = nick
+        self.sender = sender
+        self.admin = admin
+        self.owner = admin
+        return self
+
+    def group(self, n=0):
+        if n == 0:
+            return str(self)
+        name, _, args = self.lstrip(".!").partition(" ")
+        if n == 1:
+            return name
+        if n == 2:
+            return args.strip() or None
+        return None
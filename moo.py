@@ -19,288 +19,3969 @@ FIXES APPLIED (Sopel 8.0.4):
 
 from sopel import plugin
 import random
+import re
+import configparser
+import csv
+import functools
+import json
 import logging
+import heapq
+import os
+import queue
+import sqlite3
+import sys
+import threading
 import time
-from sqlalchemy import text
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass, fields, replace
+from sqlalchemy import event, text
+from sqlalchemy.pool import NullPool
 
 logger = logging.getLogger(__name__)
 # Bot nick (set at setup)
 BOT_NICK_LOWER = None
 
-# Default behavior values (can be overridden from the `moo` config section)
-# Cooldowns (seconds)
-MOO_COOLDOWN = 6         # moo cooldown
-SUDO_COOLDOWN = 3600     # sudo moo cooldown (1 hour)
+# Behaviour settings (cooldowns, legendary chance, ...) live in SETTINGS,
+# parsed from the `moo` config section; see MooSettings below.
 
-# Legendary moo chance (0.0 - 1.0)
-LEGENDARY_CHANCE = 0.02
+# Write-behind buffering of moo increments
+WRITE_BEHIND_INTERVAL = 5  # seconds between timed flushes
+
+# UPSERT ... RETURNING needs SQLite 3.35+; older builds fall back to a SELECT
+_SQLITE_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
 
 # Use monotonic clock for cooldowns
 _time = time.monotonic
+# Wall clock for history buckets (hours/days since the epoch, UTC)
+_wall = time.time
+
+# Most cooldown entries a store keeps before evicting the soonest-expiring
+COOLDOWN_MAX_ENTRIES = 100000
+
+# Pending (not yet flushed) increments: nick → delta, (nick, channel) → delta
+_PENDING_GLOBAL = {}
+_PENDING_CHAN = {}
+_PENDING_TOTALS = {}   # scope → delta, kept in step with the two dicts above
+_PENDING_HOURLY = {}   # (hour, channel or '', nick) → delta, for the moo history
+_PENDING_LOCK = threading.RLock()
+# Deltas a flush has taken out of the buffer and is writing. Readers keep
+# adding them until the flush publishes the counts that include them.
+_INFLIGHT_GLOBAL = {}
+_INFLIGHT_CHAN = {}
+_INFLIGHT_TOTALS = {}
+_INFLIGHT_HOURLY = {}
+# Their stored counts and totals before the write, installed before it
+# starts: a read can't tell whether it ran before or after the commit, so
+# these answer for the keys in flight (see _stored_bases)
+_INFLIGHT_BASES = {}
+_INFLIGHT_TOTAL_BASES = {}
+# Moved under _PENDING_LOCK whenever this process publishes counts it wrote
+# or drops counts it reset, so a read that went to the store meanwhile tries
+# again (_with_unflushed)
+_STORED_GEN = 0
+# Every flush ends an epoch. For the epochs flushed most recently, each nick's
+# stored count from before that flush is kept, so a moo buffered in epoch e
+# knows its exact new count: base + the nick's pending delta right after it.
+_FLUSH_EPOCH = 0
+_FLUSH_BASES = {}      # epoch → {nick: count before the flush}
+FLUSH_BASES_KEEP = 16
+# Held by whatever writes counts (flushes, direct increments, resets,
+# imports, node syncs), so each write and the publishing of the counts it
+# read back happen one at a time. Handler threads don't take it: reads add
+# the in-flight and pending deltas to stored counts under _PENDING_LOCK.
+_FLUSH_LOCK = threading.RLock()
+
+# In-memory leaderboards: global index and channel → index (see _TopIndex).
+# Like the rank trees below, they count a moo as soon as it's buffered.
+LEADERBOARD_KEEP = 100   # entries kept per scope; .mootop shows at most 50
+_TOP_GLOBAL = None
+_TOP_CHAN = {}
+_TOP_LOCK = threading.Lock()
+# Rank trees for .moorank and deep .mootop pages: global and channel → tree.
+# Built from a full scan on first use, then kept current like the indexes.
+_RANK_GLOBAL = None
+_RANK_CHAN = {}
+# Indexes and rank trees being built without the flush lock: scope (None
+# for global) → journals of what was recorded for it meanwhile (see _build).
+# Guarded by _TOP_LOCK, like the structures themselves.
+_BUILDS = {}
+
+
+def _is_channel(name):
+    """Return True if this looks like a real channel name."""
+    return bool(name) and name.startswith(("#", "&", "+", "!"))
+
+
+# --------------------------------------------------------------
+# Cooldowns
+# --------------------------------------------------------------
+class _CooldownStripe:
+    __slots__ = ("lock", "deadlines", "heap", "prune_runs", "prune_pops", "expired", "evicted")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.deadlines = {}   # key → deadline
+        self.heap = []        # (deadline, key), may hold superseded entries
+        # Counters are per stripe so they're only ever touched under its lock
+        self.prune_runs = self.prune_pops = self.expired = self.evicted = 0
+
+
+class CooldownStore:
+    """
+    Per-(channel, nick) cooldown deadlines, safe to share between threads.
+
+    Keys are spread over lock stripes. Each stripe keeps its deadlines in a
+    dict plus a heap ordered by expiry, so pruning only touches entries that
+    have actually expired (amortized O(expired)) instead of scanning them all.
+    Heap entries superseded by a newer deadline are skipped when popped, and
+    the heap is rebuilt if they ever outnumber live entries.
+    """
+
+    def __init__(self, max_entries=COOLDOWN_MAX_ENTRIES, stripes=16):
+        self._stripes = [_CooldownStripe() for _ in range(stripes)]
+        self._max_per_stripe = max(1, max_entries // stripes)
+
+    @staticmethod
+    def key(channel, nick):
+        """Build an interned (channel, nick) key; repeated nicks share one string."""
+        return (sys.intern(channel), sys.intern(nick))
+
+    @staticmethod
+    def _prune(stripe, now):
+        heap, deadlines = stripe.heap, stripe.deadlines
+        while heap and heap[0][0] <= now:
+            deadline, key = heapq.heappop(heap)
+            stripe.prune_pops += 1
+            if deadlines.get(key) == deadline:
+                del deadlines[key]
+                stripe.expired += 1
+        stripe.prune_runs += 1
+
+    def hit(self, key, now, cooldown):
+        """
+        Start a cooldown for key unless one is running.
+
+        Returns 0 if the action may go ahead (and the new cooldown is set),
+        otherwise the number of seconds left.
+        """
+        stripe = self._stripes[hash(key) % len(self._stripes)]
+        with stripe.lock:
+            self._prune(stripe, now)
+            deadline = stripe.deadlines.get(key)
+            if deadline is not None and deadline > now:
+                return deadline - now
+
+            deadline = now + cooldown
+            stripe.deadlines[key] = deadline
+            heapq.heappush(stripe.heap, (deadline, key))
+
+            if len(stripe.deadlines) > self._max_per_stripe:
+                # Over budget: drop whatever would expire next
+                while True:
+                    old_deadline, old_key = heapq.heappop(stripe.heap)
+                    if stripe.deadlines.get(old_key) == old_deadline:
+                        del stripe.deadlines[old_key]
+                        stripe.evicted += 1
+                        break
+            if len(stripe.heap) > 2 * len(stripe.deadlines) + 64:
+                stripe.heap = [(d, k) for k, d in stripe.deadlines.items()]
+                heapq.heapify(stripe.heap)
+            return 0
+
+    def entries(self, now):
+        """Running cooldowns as (key, seconds left) pairs, for snapshots."""
+        running = []
+        for stripe in self._stripes:
+            with stripe.lock:
+                running.extend((k, d - now) for k, d in stripe.deadlines.items() if d > now)
+        return running
+
+    def restore(self, key, deadline):
+        """Bring back a deadline from a snapshot, unless a later one is set or the stripe is full."""
+        stripe = self._stripes[hash(key) % len(self._stripes)]
+        with stripe.lock:
+            current = stripe.deadlines.get(key)
+            if current is not None and current >= deadline:
+                return
+            if current is None and len(stripe.deadlines) >= self._max_per_stripe:
+                return
+            stripe.deadlines[key] = deadline
+            heapq.heappush(stripe.heap, (deadline, key))
+
+    def clear(self):
+        for stripe in self._stripes:
+            with stripe.lock:
+                stripe.deadlines.clear()
+                stripe.heap.clear()
+
+    def __len__(self):
+        return sum(len(stripe.deadlines) for stripe in self._stripes)
+
+    def stats(self):
+        """Entry count and pruning cost, for diagnostics."""
+        stats = dict.fromkeys(
+            ("entries", "heap_entries", "prune_runs", "prune_pops", "expired", "evicted"), 0
+        )
+        for stripe in self._stripes:
+            stats["entries"] += len(stripe.deadlines)
+            stats["heap_entries"] += len(stripe.heap)
+            stats["prune_runs"] += stripe.prune_runs
+            stats["prune_pops"] += stripe.prune_pops
+            stats["expired"] += stripe.expired
+            stats["evicted"] += stripe.evicted
+        runs = stats["prune_runs"]
+        stats["pops_per_prune"] = stats["prune_pops"] / runs if runs else 0.0
+        return stats
+
+
+# Cooldown tracking: (channel, nick) → deadline
+MOO_COOLDOWNS = CooldownStore()
+SUDO_COOLDOWNS = CooldownStore()
+
+
+# --------------------------------------------------------------
+# Settings
+# --------------------------------------------------------------
+# The [moo] section is parsed once into an immutable MooSettings. Hot paths
+# read attributes off SETTINGS; a reload builds a whole new object and swaps
+# the module global, so a handler never sees half-applied settings.
+class MooConfigError(ValueError):
+    """Raised when the [moo] config section has invalid values."""
+
+
+_TRUE = ("true", "yes", "on", "1")
+BACKPRESSURE_MODES = ("block", "drop", "spill")
+_FALSE = ("false", "no", "off", "0")
+_INLINE_COMMENT = re.compile(r"\s+[#;].*$")
+
+
+def _parse_bool(raw):
+    val = raw.lower()
+    if val in _TRUE:
+        return True
+    if val in _FALSE:
+        return False
+    raise ValueError("expected true/false")
+
+
+def _parse_int(raw, minimum, what):
+    try:
+        val = int(raw)
+    except ValueError:
+        val = None
+    if val is None or val < minimum:
+        raise ValueError(f"expected {what}")
+    return val
+
+
+def _parse_seconds(raw):
+    return _parse_int(raw, 0, "a whole number of seconds >= 0")
+
+
+def _parse_rate(raw):
+    return _parse_int(raw, 0, "a whole number >= 0 (0 disables the limit)")
+
+
+def _parse_days(raw):
+    return _parse_int(raw, 0, "a whole number of days >= 0 (0 turns history off)")
+
+
+def _parse_cache_size(raw):
+    return _parse_int(raw, 0, "a whole number >= 0 (0 turns the cache off)")
+
+
+def _parse_positive(raw):
+    return _parse_int(raw, 1, "a whole number >= 1")
+
+
+def _parse_backpressure(raw):
+    val = raw.lower()
+    if val not in BACKPRESSURE_MODES:
+        raise ValueError("expected one of " + ", ".join(BACKPRESSURE_MODES))
+    return val
+
+
+def _parse_backend(raw):
+    val = raw.lower()
+    if val not in BACKENDS:
+        raise ValueError("expected one of " + ", ".join(BACKENDS))
+    return val
+
+
+def _parse_sqlite_profile(raw):
+    val = raw.lower()
+    if val not in SQLITE_PROFILES:
+        raise ValueError("expected one of " + ", ".join(SQLITE_PROFILES))
+    return val
+
+
+def _parse_path(raw):
+    return os.path.expanduser(raw) if raw else ""
+
+
+def _parse_node_id(raw):
+    if not re.fullmatch(r"[\w.-]{0,32}", raw, re.ASCII):
+        raise ValueError("expected up to 32 letters, digits, '.', '_' or '-'")
+    return raw
+
+
+def _parse_chance(raw):
+    try:
+        val = float(raw)
+    except ValueError:
+        val = None
+    if val is None or not 0.0 <= val <= 1.0:
+        raise ValueError("expected a number between 0.0 and 1.0")
+    return val
+
+
+@dataclass(frozen=True)
+class MooSettings:
+    leet_moo: bool = True
+    moo_cooldown: int = 6                # seconds per user per channel
+    sudo_cooldown: int = 3600            # seconds per user per channel (1 hour)
+    legendary_chance: float = 0.02       # 0.0 - 1.0
+    max_rate_per_15sec: int = 0          # channel replies per 15s; 0 = no limit
+    write_behind: bool = True            # buffer increments instead of committing each moo
+    write_behind_max: int = 500          # most queued moos written per transaction
+    writer_queue_size: int = 10000       # moos waiting for the DB writer thread
+    writer_backpressure: str = "spill"   # queue full: block, drop or spill
+    history_days: int = 400              # days of moo history kept; 0 = no history
+    metrics_file: str = ""               # Prometheus textfile path; empty = off
+    node_id: str = ""                    # this process's name in a shared DB; empty = sole writer
+    warm_start: bool = True              # keep cooldowns and leaderboards across restarts
+    count_cache_size: int = 10000        # cached per-nick counts; 0 = no cache
+    count_cache_ttl: int = 300           # seconds a cached count is trusted; 0 = no expiry
+    backend: str = "auto"                # where counts live; see MooStore
+    sqlite_profile: str = "balanced"     # journal mode and pragmas; see SQLITE_PROFILES
+    db_maintenance: bool = True          # scheduled ANALYZE, vacuum and integrity checks
+
+    _PARSERS = {
+        "leet_moo": _parse_bool,
+        "moo_cooldown": _parse_seconds,
+        "sudo_cooldown": _parse_seconds,
+        "legendary_chance": _parse_chance,
+        "max_rate_per_15sec": _parse_rate,
+        "write_behind": _parse_bool,
+        "write_behind_max": _parse_positive,
+        "writer_queue_size": _parse_positive,
+        "writer_backpressure": _parse_backpressure,
+        "history_days": _parse_days,
+        "metrics_file": _parse_path,
+        "node_id": _parse_node_id,
+        "warm_start": _parse_bool,
+        "count_cache_size": _parse_cache_size,
+        "count_cache_ttl": _parse_seconds,
+        "backend": _parse_backend,
+        "sqlite_profile": _parse_sqlite_profile,
+        "db_maintenance": _parse_bool,
+    }
+
+    @classmethod
+    def parse(cls, options):
+        """Build settings from raw [moo] option strings.
+
+        Returns ``(settings, errors)``. Invalid options keep their defaults
+        and are described in ``errors``; unknown options are ignored.
+        """
+        values, errors = {}, []
+        for name, raw in options.items():
+            convert = cls._PARSERS.get(name)
+            if convert is None:
+                continue
+            raw = _INLINE_COMMENT.sub("", raw).strip()
+            try:
+                values[name] = convert(raw)
+            except ValueError as e:
+                errors.append(f"{name} = {raw!r}: {e}")
+        return cls(**values), errors
+
+    @classmethod
+    def from_parser(cls, parser):
+        """Parse the [moo] section of a configparser (missing section = defaults)."""
+        if parser is None or not parser.has_section("moo"):
+            return cls(), []
+        return cls.parse(dict(parser.items("moo", raw=True)))
+
+    @classmethod
+    def from_file(cls, filename):
+        """Re-read the [moo] section from disk; raises MooConfigError if invalid."""
+        parser = configparser.RawConfigParser()
+        if not parser.read(filename, encoding="utf-8"):
+            raise MooConfigError(f"cannot read {filename}")
+        settings, errors = cls.from_parser(parser)
+        if errors:
+            raise MooConfigError("; ".join(errors))
+        return settings
+
+
+SETTINGS = MooSettings()
+
+CONFIG_WATCH_INTERVAL = 30  # seconds between config file mtime checks
+_CONFIG_MTIME = None
+
+
+def _config_filename(bot):
+    return getattr(bot.config, "filename", None)
+
+
+def _config_mtime(filename):
+    try:
+        return os.stat(filename).st_mtime_ns
+    except (OSError, TypeError):
+        return None
+
+
+def _reload_settings(bot):
+    """Swap in freshly parsed settings from the config file.
+
+    Returns the list of changed option names. Raises MooConfigError and keeps
+    the current settings if the file is unreadable or has invalid values.
+    """
+    global SETTINGS, _CONFIG_MTIME
+    filename = _config_filename(bot)
+    if not filename:
+        raise MooConfigError("bot config has no file to reload from")
+    mtime = _config_mtime(filename)
+    new = _fit_settings(MooSettings.from_file(filename), STORE)
+    if STORE is not None and new.backend != SETTINGS.backend:
+        logger.warning("Moo backend change to %s takes effect after a restart", new.backend)
+    old, SETTINGS = SETTINGS, new
+    _CONFIG_MTIME = mtime
+    if new.sqlite_profile != old.sqlite_profile:
+        _legacy_close_all()   # pooled connections reopen with the new pragmas
+    changed = [f.name for f in fields(MooSettings) if getattr(old, f.name) != getattr(new, f.name)]
+    if changed:
+        logger.info("Moo settings reloaded: %s", ", ".join(changed))
+    return changed
+
+
+# --------------------------------------------------------------
+# Reply rate limiting
+# --------------------------------------------------------------
+REPLY_WINDOW = 15          # seconds; max_rate_per_15sec replies per window
+REPLY_SUMMARY_NICKS = 5    # nicks named in a flood summary before "…"
+REPLY_FLUSH_INTERVAL = 5   # seconds between checks for held-back summaries
+
+
+class _ReplyBucket:
+    __slots__ = ("tokens", "stamp", "held", "nicks", "more")
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.stamp = now
+        self.held = 0      # replies merged into the pending summary
+        self.nicks = []    # first few distinct nicks behind them
+        self.more = False  # a nick was left out of nicks
+
+
+class ReplyScheduler:
+    """
+    Per-channel token bucket for moo replies.
+
+    Each channel may send ``rate`` replies per REPLY_WINDOW, refilled
+    continuously. Replies over budget aren't queued: they're folded into one
+    pending summary ("🐄 ×14 (alice, bob, …)") that goes out as soon as the
+    channel has a token again. Important replies (milestones) are always sent
+    but still spend a token, so they push back the next ordinary one.
+    Only output is limited; counting happens before any of this.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}   # channel → _ReplyBucket
+        self._sent = self._priority = self._dropped = self._merged = 0
+
+    def _bucket(self, channel, rate, now):
+        bucket = self._buckets.get(channel)
+        if bucket is None:
+            bucket = self._buckets[channel] = _ReplyBucket(float(rate), now)
+        else:
+            refill = (now - bucket.stamp) * rate / REPLY_WINDOW
+            bucket.tokens = min(float(rate), bucket.tokens + refill)
+            bucket.stamp = now
+        return bucket
+
+    @staticmethod
+    def _summary(bucket):
+        names = ", ".join(bucket.nicks)
+        if bucket.more:
+            names += ", …"
+        line = f"🐄 ×{bucket.held} ({names})"
+        bucket.held = 0
+        bucket.nicks = []
+        bucket.more = False
+        return line
+
+    def say(self, bot, channel, nick, message, important=False):
+        """Send a reply to channel now, or fold it into the channel's summary."""
+        rate = SETTINGS.max_rate_per_15sec
+        if not rate or not _is_channel(channel):
+            with self._lock:
+                self._sent += 1
+            bot.say(message)
+            return
+
+        out = []
+        with self._lock:
+            bucket = self._bucket(channel, rate, _time())
+            if important:
+                # Never held back, but may borrow up to one window ahead
+                bucket.tokens = max(bucket.tokens - 1, -float(rate))
+                self._priority += 1
+                out.append(message)
+            else:
+                if bucket.held or bucket.tokens < 1:
+                    self._dropped += 1
+                    bucket.held += 1
+                    if nick not in bucket.nicks:
+                        if len(bucket.nicks) < REPLY_SUMMARY_NICKS:
+                            bucket.nicks.append(nick)
+                        else:
+                            bucket.more = True
+                    message = None
+                if bucket.tokens >= 1:
+                    bucket.tokens -= 1
+                    if bucket.held:
+                        self._merged += 1
+                        out.append(self._summary(bucket))
+                    else:
+                        self._sent += 1
+                        out.append(message)
+        for line in out:
+            bot.say(line)
+
+    def flush(self, bot):
+        """Send held-back summaries for channels that have a token again."""
+        rate = SETTINGS.max_rate_per_15sec
+        now = _time()
+        out = []
+        with self._lock:
+            for channel, bucket in list(self._buckets.items()):
+                if rate:
+                    bucket = self._bucket(channel, rate, now)
+                if bucket.held and (not rate or bucket.tokens >= 1):
+                    bucket.tokens -= 1
+                    self._merged += 1
+                    out.append((channel, self._summary(bucket)))
+                elif not bucket.held and (not rate or bucket.tokens >= rate):
+                    # Idle and full again: nothing worth remembering
+                    del self._buckets[channel]
+        for channel, line in out:
+            bot.say(line, channel)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def stats(self):
+        """Reply counters, for diagnostics.
+
+        sent: replies sent as-is; priority: important replies (sent even
+        over budget); dropped: replies held back and folded into a summary;
+        merged: summary lines sent in their place.
+        """
+        with self._lock:
+            return {
+                "sent": self._sent,
+                "priority": self._priority,
+                "dropped": self._dropped,
+                "merged": self._merged,
+                "channels": len(self._buckets),
+                "pending": sum(b.held for b in self._buckets.values()),
+            }
+
+
+REPLIES = ReplyScheduler()
+
+
+# --------------------------------------------------------------
+# Output packing
+# --------------------------------------------------------------
+# One IRC line is 512 bytes including the CRLF and the ":nick!user@host"
+# prefix the server adds when relaying, so the room left for text depends on
+# the bot's hostmask and the target. Packing short items into as few lines as
+# fit saves send-queue slots and flood-protection delay.
+IRC_LINE_BYTES = 512
+_MIN_TEXT_BYTES = 64   # floor, in case the estimate is ever absurdly small
+
+
+def _text_budget(bot, target):
+    """Bytes of message text that reach `target` without being truncated."""
+    safe_text_length = getattr(bot, "safe_text_length", None)
+    if safe_text_length is not None:
+        try:
+            return max(_MIN_TEXT_BYTES, safe_text_length(target))
+        except Exception:
+            logger.debug("safe_text_length failed; estimating", exc_info=True)
+    # Sopel < 8: assume the longest hostmask (nick!~user(9)@host(63))
+    prefix = 1 + len(bot.nick) + 1 + 1 + 9 + 1 + 63
+    overhead = len(f" PRIVMSG {target} :".encode("utf-8")) + 2
+    return max(_MIN_TEXT_BYTES, IRC_LINE_BYTES - prefix - overhead)
+
+
+def _split_oversize(text, budget):
+    """Cut text into pieces of at most `budget` UTF-8 bytes, at spaces if possible."""
+    pieces = []
+    while len(text.encode("utf-8")) > budget:
+        cut = len(text.encode("utf-8")[:budget].decode("utf-8", "ignore"))
+        space = text.rfind(" ", 0, cut)
+        if space > cut // 2:
+            cut = space
+        pieces.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+def pack_lines(items, budget, sep=" | ", head="", cont=""):
+    """
+    Join items into as few lines of at most `budget` bytes as possible.
+
+    Items are never split unless one alone is too long for a line. The first
+    line starts with `head`, later ones with `cont`.
+    """
+    sep_len = len(sep.encode("utf-8"))
+    lines = []
+    line, used, fresh = head, len(head.encode("utf-8")), True
+    for item in items:
+        size = len(item.encode("utf-8"))
+        if not fresh and used + sep_len + size <= budget:
+            line += sep + item
+            used += sep_len + size
+            continue
+        if not fresh:
+            lines.append(line)
+            line, used = cont, len(cont.encode("utf-8"))
+        if used + size <= budget:
+            line += item
+            used += size
+            fresh = False
+            continue
+        # Too long even for an empty line: break it up on its own lines
+        for piece in _split_oversize(line + item, budget):
+            lines.append(piece)
+        line, used, fresh = cont, len(cont.encode("utf-8")), True
+    if not fresh:
+        lines.append(line)
+    elif not lines:
+        # No items: just the head, cut to fit like an oversize item
+        lines.extend(_split_oversize(line, budget) or [line])
+    return lines
+
+
+# --------------------------------------------------------------
+# Metrics
+# --------------------------------------------------------------
+# Counters and fixed-bucket latency histograms for the hot paths. Recording
+# is two perf_counter() calls, a bisect and a dict update under one lock, so
+# it stays on all the time. Read with .moometrics, or set `metrics_file` to
+# have a Prometheus textfile-collector file rewritten every minute.
+METRICS_EXPORT_INTERVAL = 60   # seconds between metrics_file rewrites
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+_perf = time.perf_counter
+
+
+class _Histogram:
+    __slots__ = ("buckets", "sum", "count")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)   # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (inf if past the last)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(LATENCY_BUCKETS + (float("inf"),), self.buckets):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and latency histograms keyed by (name, labels).
+
+    labels is a tuple of (label, value) pairs, e.g. (("scope", "global"),),
+    so series keys are hashable and cheap to build.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}     # (name, labels) → int
+        self._histograms = {}   # (name, labels) → _Histogram
+
+    def inc(self, name, labels=(), n=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def observe(self, name, seconds, labels=()):
+        key = (name, labels)
+        slot = bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = _Histogram()
+            hist.buckets[slot] += 1
+            hist.sum += seconds
+            hist.count += 1
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def histograms(self):
+        """Copies of every histogram, safe to read without the lock."""
+        with self._lock:
+            out = {}
+            for key, hist in self._histograms.items():
+                copy = out[key] = _Histogram()
+                copy.buckets = list(hist.buckets)
+                copy.sum, copy.count = hist.sum, hist.count
+            return out
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+METRICS = MetricsRegistry()
+
+
+def _timed(handler):
+    """Count calls, errors and latency of a Sopel handler (innermost decorator)."""
+    labels = (("handler", handler.__name__),)
+
+    @functools.wraps(handler)
+    def wrapper(bot, trigger):
+        start = _perf()
+        try:
+            return handler(bot, trigger)
+        except Exception:
+            METRICS.inc("moo_errors_total", labels)
+            raise
+        finally:
+            METRICS.observe("moo_handler_seconds", _perf() - start, labels)
+
+    return wrapper
+
+
+def _gauges():
+    """Point-in-time values folded into the metrics output: name → [(labels, value)]."""
+    with _PENDING_LOCK:
+        pending = len(_PENDING_GLOBAL) + len(_PENDING_CHAN)
+    gauges = {
+        "moo_pending_keys": [((), pending)],
+        "moo_writer_queue": [((), WRITER.qsize())],
+        "moo_cooldown_entries": [],
+    }
+    for kind, store in (("moo", MOO_COOLDOWNS), ("sudo", SUDO_COOLDOWNS)):
+        gauges["moo_cooldown_entries"].append(((("kind", kind),), store.stats()["entries"]))
+    gauges["moo_count_cache_entries"] = [((), COUNT_CACHE.stats()["entries"])]
+    gauges["moo_replies_pending"] = [((), REPLIES.stats()["pending"])]
+    return gauges
+
+
+def _stat_counters():
+    """Running totals kept by the cooldown stores, count cache and reply
+    scheduler rather than METRICS, in the same shape as _gauges()."""
+    counters = {"moo_cooldown_evicted_total": []}
+    for kind, store in (("moo", MOO_COOLDOWNS), ("sudo", SUDO_COOLDOWNS)):
+        counters["moo_cooldown_evicted_total"].append(((("kind", kind),), store.stats()["evicted"]))
+    cache = COUNT_CACHE.stats()
+    counters["moo_count_cache_events_total"] = [
+        ((("kind", k),), cache[k]) for k in ("hits", "misses", "evicted", "expired")
+    ]
+    replies = REPLIES.stats()
+    counters["moo_replies_total"] = [
+        ((("kind", k),), replies[k]) for k in ("sent", "priority", "dropped", "merged")
+    ]
+    return counters
+
+
+def _prom_labels(labels, extra=()):
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def metrics_text():
+    """Everything in METRICS plus the stat counters and current gauges, in Prometheus text format."""
+    out = []
+    by_name = {}
+    for (name, labels), value in sorted(METRICS.counters().items()):
+        by_name.setdefault(name, []).append(f"{name}{_prom_labels(labels)} {value}")
+    for name, series in _stat_counters().items():
+        by_name[name] = [f"{name}{_prom_labels(labels)} {value}" for labels, value in series]
+    for name, lines in by_name.items():
+        out.append(f"# TYPE {name} counter")
+        out.extend(lines)
+
+    by_name = {}
+    for (name, labels), hist in sorted(METRICS.histograms().items()):
+        lines = by_name.setdefault(name, [])
+        running = 0
+        for bound, n in zip(LATENCY_BUCKETS + ("+Inf",), hist.buckets):
+            running += n
+            lines.append(f"{name}_bucket{_prom_labels(labels, (('le', bound),))} {running}")
+        lines.append(f"{name}_sum{_prom_labels(labels)} {hist.sum:.6f}")
+        lines.append(f"{name}_count{_prom_labels(labels)} {hist.count}")
+    for name, lines in by_name.items():
+        out.append(f"# TYPE {name} histogram")
+        out.extend(lines)
+
+    for name, series in _gauges().items():
+        out.append(f"# TYPE {name} gauge")
+        out.extend(f"{name}{_prom_labels(labels)} {value}" for labels, value in series)
+    return "\n".join(out) + "\n"
+
+
+def _write_metrics_file(path):
+    """Replace the textfile atomically so the collector never reads half a file."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(metrics_text())
+    os.replace(tmp, path)
+
+
+# --------------------------------------------------------------
+# SQL statements
+# --------------------------------------------------------------
+# Every statement is built once at import: sqlite's per-connection statement
+# cache and SQLAlchemy's compiled cache are keyed on them, so reusing the same
+# objects skips re-parsing. Named parameters work for sqlite3 and text() alike.
+#
+# The statements are written for sqlite. Through SQLAlchemy the tables may
+# also live in PostgreSQL, which gets its own text() of each statement: the
+# one given as postgresql=, or one derived by _postgres(). Other databases
+# are refused (see SqlAlchemyStore).
+_TEXT = {}
+_PG_TEXT = {}
+SQL_DIALECTS = {"sqlite": _TEXT, "postgresql": _PG_TEXT}
+
+
+def _postgres(statement):
+    """
+    statement with the sqlite-only spellings PostgreSQL doesn't know
+    rewritten, or None if it only matters to sqlite (triggers).
+    """
+    if "TRIGGER " in statement:
+        return None
+    if statement.startswith("INSERT OR IGNORE INTO "):
+        statement = f"INSERT INTO {statement[22:]} ON CONFLICT DO NOTHING"
+    if statement.endswith(" WITHOUT ROWID"):
+        statement = statement[:-14]   # PostgreSQL tables have no rowid to leave out
+    # sqlite reads CROSS JOIN as "join in this order"; PostgreSQL plans its own
+    return statement.replace(" CROSS JOIN ", " JOIN ")
+
+
+def _sql(statement, postgresql=None):
+    """Register a SQL statement and pre-build its text() clauses."""
+    statement = " ".join(statement.split())
+    _TEXT[statement] = text(statement)
+    postgresql = _postgres(statement) if postgresql is None else " ".join(postgresql.split())
+    _PG_TEXT[statement] = None if postgresql is None else text(postgresql)
+    return statement
+
+
+SQL_CREATE_COUNTS = _sql("""
+    CREATE TABLE IF NOT EXISTS moo_counts (
+        nick TEXT PRIMARY KEY,
+        count INTEGER DEFAULT 0
+    )
+""")
+SQL_CREATE_COUNTS_CHAN = _sql("""
+    CREATE TABLE IF NOT EXISTS moo_counts_chan (
+        nick TEXT,
+        channel TEXT,
+        count INTEGER DEFAULT 0,
+        PRIMARY KEY (nick, channel)
+    )
+""")
+
+SQL_CREATE_SCHEMA_VERSION = _sql("""
+    CREATE TABLE IF NOT EXISTS moo_schema_version (
+        version INTEGER PRIMARY KEY,
+        applied_at INTEGER
+    )
+""")
+SQL_GET_SCHEMA_VERSION = _sql("SELECT MAX(version) FROM moo_schema_version")
+SQL_SET_SCHEMA_VERSION = _sql(
+    "INSERT INTO moo_schema_version (version, applied_at) VALUES (:v, :t)"
+)
+
+# Channel counts are keyed by interned ids (schema version 6): moo_nicks and
+# moo_channels give every name an integer id once, and moo_chan_counts is a
+# WITHOUT ROWID table keyed by (nick_id, channel_id), so no channel name is
+# repeated and there is no separate key index. Nick first, so the key also
+# serves a nick's own rows (resets). The nick's name rides along in each row
+# for the rank index (channel_id, count DESC, nick): channel leaderboards
+# read ties in name order straight from it, with no join or sort. Ids are
+# never deleted or reused, which lets a store cache them for good (see
+# _IdCache); names are never changed, so the copies can't go stale.
+SQL_CREATE_NICKS = _sql("""
+    CREATE TABLE IF NOT EXISTS moo_nicks (
+        id INTEGER PRIMARY KEY,
+        nick TEXT NOT NULL UNIQUE
+    )
+""", postgresql="""
+    CREATE TABLE IF NOT EXISTS moo_nicks (
+        id SERIAL PRIMARY KEY,
+        nick TEXT NOT NULL UNIQUE
+    )
+""")
+SQL_CREATE_CHANNELS = _sql("""
+    CREATE TABLE IF NOT EXISTS moo_channels (
+        id INTEGER PRIMARY KEY,
+        channel TEXT NOT NULL UNIQUE
+    )
+""", postgresql="""
+    CREATE TABLE IF NOT EXISTS moo_channels (
+        id SERIAL PRIMARY KEY,
+        channel TEXT NOT NULL UNIQUE
+    )
+""")
+SQL_CREATE_CHAN_COUNTS = _sql("""
+    CREATE TABLE IF NOT EXISTS moo_chan_counts (
+        nick_id INTEGER NOT NULL,
+        channel_id INTEGER NOT NULL,
+        nick TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (nick_id, channel_id)
+    ) WITHOUT ROWID
+""")
+ID_TABLES = {"nick": ("moo_nicks", "nick"), "channel": ("moo_channels", "channel")}
+SQL_ID = {
+    kind: _sql(f"SELECT id FROM {table} WHERE {column} = :x")
+    for kind, (table, column) in ID_TABLES.items()
+}
+SQL_INTERN = {
+    kind: _sql(f"INSERT OR IGNORE INTO {table} ({column}) VALUES (:x)")
+    for kind, (table, column) in ID_TABLES.items()
+}
+
+SQL_GET_GLOBAL = _sql("SELECT count FROM moo_counts WHERE nick = :n")
+SQL_GET_CHAN = _sql(
+    "SELECT count FROM moo_chan_counts WHERE nick_id = :ni AND channel_id = :ci"
+)
+# Many nicks per round trip (.moowho, .moocount a b c). IN lists come in a
+# few fixed sizes so their statements stay cached; a chunk uses the smallest
+# that fits, and unused slots are NULL, which matches nothing.
+LOOKUP_SIZES = (10, 50, 250)
+LOOKUP_CHUNK = LOOKUP_SIZES[-1]
+
+
+def _lookup_slots(size):
+    return ", ".join(f":n{i}" for i in range(size))
+
+
+SQL_GET_GLOBAL_MANY = {
+    size: _sql(f"SELECT nick, count FROM moo_counts WHERE nick IN ({_lookup_slots(size)})")
+    for size in LOOKUP_SIZES
+}
+SQL_GET_CHAN_MANY = {
+    size: _sql(f"SELECT nick_id, count FROM moo_chan_counts "
+               f"WHERE channel_id = :ci AND nick_id IN ({_lookup_slots(size)})")
+    for size in LOOKUP_SIZES
+}
+SQL_IDS_MANY = {
+    kind: {
+        size: _sql(f"SELECT {column}, id FROM {table} WHERE {column} IN ({_lookup_slots(size)})")
+        for size in LOOKUP_SIZES
+    }
+    for kind, (table, column) in ID_TABLES.items()
+}
+
+SQL_UPSERT_GLOBAL = _sql("""
+    INSERT INTO moo_counts (nick, count) VALUES (:n, :v)
+    ON CONFLICT(nick) DO UPDATE SET count = moo_counts.count + excluded.count
+""")
+SQL_UPSERT_GLOBAL_RETURNING = _sql(SQL_UPSERT_GLOBAL + " RETURNING count")
+SQL_UPSERT_CHAN = _sql("""
+    INSERT INTO moo_chan_counts (nick_id, channel_id, nick, count) VALUES (:ni, :ci, :n, :v)
+    ON CONFLICT(nick_id, channel_id) DO UPDATE SET count = moo_chan_counts.count + excluded.count
+""")
+SQL_UPSERT_CHAN_RETURNING = _sql(SQL_UPSERT_CHAN + " RETURNING count")
+
+# UPSERT-free increments for old sqlite builds (legacy path)
+SQL_SEED_GLOBAL = _sql("INSERT OR IGNORE INTO moo_counts (nick, count) VALUES (:n, 0)")
+SQL_ADD_GLOBAL = _sql("UPDATE moo_counts SET count = count + :v WHERE nick = :n")
+SQL_SEED_CHAN = _sql(
+    "INSERT OR IGNORE INTO moo_chan_counts (nick_id, channel_id, nick, count) "
+    "VALUES (:ni, :ci, :n, 0)"
+)
+SQL_ADD_CHAN = _sql(
+    "UPDATE moo_chan_counts SET count = count + :v WHERE nick_id = :ni AND channel_id = :ci"
+)
+
+SQL_TOP_GLOBAL = _sql(
+    "SELECT nick, count FROM moo_counts ORDER BY count DESC, nick LIMIT :l"
+)
+SQL_TOP_CHAN = _sql(
+    "SELECT nick, count FROM moo_chan_counts WHERE channel_id = :ci "
+    "ORDER BY count DESC, nick LIMIT :l"
+)
+# Leaderboard pages resume at a count boundary found in the rank tree
+SQL_PAGE_GLOBAL = _sql(
+    "SELECT nick, count FROM moo_counts WHERE count <= :v "
+    "ORDER BY count DESC, nick LIMIT :l"
+)
+SQL_PAGE_CHAN = _sql(
+    "SELECT nick, count FROM moo_chan_counts WHERE channel_id = :ci AND count <= :v "
+    "ORDER BY count DESC, nick LIMIT :l"
+)
+# Rank tree loads, and the nicks either side of a rank (first/last at a count)
+SQL_ALL_GLOBAL = _sql("SELECT nick, count FROM moo_counts")
+SQL_ALL_CHAN = _sql("SELECT nick, count FROM moo_chan_counts WHERE channel_id = :ci")
+SQL_FIRST_AT_GLOBAL = _sql(
+    "SELECT nick FROM moo_counts WHERE count = :v ORDER BY nick LIMIT :l"
+)
+SQL_LAST_AT_GLOBAL = _sql(
+    "SELECT nick FROM moo_counts WHERE count = :v ORDER BY nick DESC LIMIT :l"
+)
+SQL_FIRST_AT_CHAN = _sql(
+    "SELECT nick FROM moo_chan_counts WHERE channel_id = :ci AND count = :v "
+    "ORDER BY nick LIMIT :l"
+)
+SQL_LAST_AT_CHAN = _sql(
+    "SELECT nick FROM moo_chan_counts WHERE channel_id = :ci AND count = :v "
+    "ORDER BY nick DESC LIMIT :l"
+)
+# Running totals: scope is a channel name, or GLOBAL_SCOPE for network-wide
+GLOBAL_SCOPE = ""
+
+SQL_CREATE_TOTALS = _sql("""
+    CREATE TABLE IF NOT EXISTS moo_totals (
+        scope TEXT PRIMARY KEY,
+        total INTEGER NOT NULL DEFAULT 0
+    )
+""")
+SQL_GET_TOTAL = _sql("SELECT total FROM moo_totals WHERE scope = :s")
+SQL_ALL_TOTALS = _sql("SELECT scope, total FROM moo_totals")
+SQL_SET_TOTAL = _sql(
+    "INSERT OR REPLACE INTO moo_totals (scope, total) VALUES (:s, :v)",
+    postgresql="INSERT INTO moo_totals (scope, total) VALUES (:s, :v) "
+               "ON CONFLICT(scope) DO UPDATE SET total = excluded.total",
+)
+SQL_UPSERT_TOTAL = _sql("""
+    INSERT INTO moo_totals (scope, total) VALUES (:s, :v)
+    ON CONFLICT(scope) DO UPDATE SET total = moo_totals.total + excluded.total
+""")
+SQL_SEED_TOTAL = _sql("INSERT OR IGNORE INTO moo_totals (scope, total) VALUES (:s, 0)")
+SQL_ADD_TOTAL = _sql("UPDATE moo_totals SET total = total + :v WHERE scope = :s")
+SQL_DROP_ZERO_TOTALS = _sql("DELETE FROM moo_totals WHERE total = 0")
+
+# Chunked recomputation for .mooreconcile (keyset pagination, no OFFSET)
+SQL_SUM_CHAN = _sql(
+    "SELECT COALESCE(SUM(count), 0) FROM moo_chan_counts WHERE channel_id = :ci"
+)
+SQL_SUM_GLOBAL_CHUNK = _sql("""
+    SELECT MAX(nick), SUM(count), COUNT(*) FROM (
+        SELECT nick, count FROM moo_counts WHERE nick > :after ORDER BY nick LIMIT :l
+    ) AS chunk
+""")
+SQL_SUM_CHAN_CHUNK = _sql("""
+    SELECT c.channel, SUM(k.count) FROM moo_channels c
+    CROSS JOIN moo_chan_counts k ON k.channel_id = c.id
+    WHERE c.channel > :after GROUP BY c.channel ORDER BY c.channel LIMIT :l
+""")
+
+# Bulk export (keyset pages in primary-key order) and overwrite-mode import
+SQL_EXPORT_GLOBAL = _sql(
+    "SELECT nick, count FROM moo_counts WHERE nick > :n ORDER BY nick LIMIT :l"
+)
+SQL_EXPORT_CHAN = _sql("""
+    SELECT k.nick_id, k.channel_id, k.nick, c.channel, k.count FROM moo_chan_counts k
+    CROSS JOIN moo_channels c ON c.id = k.channel_id
+    WHERE (k.nick_id, k.channel_id) > (:ni, :ci) ORDER BY k.nick_id, k.channel_id LIMIT :l
+""")
+SQL_SET_GLOBAL = _sql(
+    "INSERT OR REPLACE INTO moo_counts (nick, count) VALUES (:n, :v)",
+    postgresql="INSERT INTO moo_counts (nick, count) VALUES (:n, :v) "
+               "ON CONFLICT(nick) DO UPDATE SET count = excluded.count",
+)
+SQL_SET_CHAN = _sql(
+    "INSERT OR REPLACE INTO moo_chan_counts (nick_id, channel_id, nick, count) "
+    "VALUES (:ni, :ci, :n, :v)",
+    postgresql="INSERT INTO moo_chan_counts (nick_id, channel_id, nick, count) "
+               "VALUES (:ni, :ci, :n, :v) "
+               "ON CONFLICT(nick_id, channel_id) DO UPDATE SET count = excluded.count",
+)
+
+SQL_DELETE_NICK = _sql("DELETE FROM moo_counts WHERE nick = :n")
+
+# Moo history: per-(hour, channel, nick) buckets for recent hours, rolled up
+# into per-day buckets. channel is '' for moos outside a channel. Hours and
+# days are counted since the Unix epoch (UTC). Windowed reads only ever sum
+# buckets, so their cost depends on the window, not on how many moos it holds.
+SQL_CREATE_HOURLY = _sql("""
+    CREATE TABLE IF NOT EXISTS moo_hourly (
+        hour INTEGER NOT NULL,
+        channel TEXT NOT NULL,
+        nick TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (hour, channel, nick)
+    ) WITHOUT ROWID
+""")
+SQL_CREATE_DAILY = _sql("""
+    CREATE TABLE IF NOT EXISTS moo_daily (
+        day INTEGER NOT NULL,
+        channel TEXT NOT NULL,
+        nick TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, channel, nick)
+    ) WITHOUT ROWID
+""")
+SQL_UPSERT_HOURLY = _sql("""
+    INSERT INTO moo_hourly (hour, channel, nick, count) VALUES (:h, :c, :n, :v)
+    ON CONFLICT(hour, channel, nick) DO UPDATE SET count = moo_hourly.count + excluded.count
+""")
+SQL_SEED_HOURLY = _sql(
+    "INSERT OR IGNORE INTO moo_hourly (hour, channel, nick, count) VALUES (:h, :c, :n, 0)"
+)
+SQL_ADD_HOURLY = _sql(
+    "UPDATE moo_hourly SET count = count + :v WHERE hour = :h AND channel = :c AND nick = :n"
+)
+SQL_UPSERT_DAILY = _sql("""
+    INSERT INTO moo_daily (day, channel, nick, count) VALUES (:d, :c, :n, :v)
+    ON CONFLICT(day, channel, nick) DO UPDATE SET count = moo_daily.count + excluded.count
+""")
+SQL_SEED_DAILY = _sql(
+    "INSERT OR IGNORE INTO moo_daily (day, channel, nick, count) VALUES (:d, :c, :n, 0)"
+)
+SQL_ADD_DAILY = _sql(
+    "UPDATE moo_daily SET count = count + :v WHERE day = :d AND channel = :c AND nick = :n"
+)
+# Rollup: hourly buckets before :h (a day boundary) become daily buckets
+SQL_ROLLUP_HOURLY = _sql("""
+    SELECT hour / 24, channel, nick, SUM(count) FROM moo_hourly
+    WHERE hour < :h GROUP BY hour / 24, channel, nick
+""")
+SQL_PRUNE_HOURLY = _sql("DELETE FROM moo_hourly WHERE hour < :h")
+SQL_PRUNE_DAILY = _sql("DELETE FROM moo_daily WHERE day < :d")
+# Windows start on a day boundary: hourly buckets from hour :h, daily from day :d
+# (= :h / 24). Rollup moves whole days, so no bucket is in both tables.
+SQL_WINDOW_TOP_GLOBAL = _sql("""
+    SELECT nick, SUM(count) AS total FROM (
+        SELECT nick, count FROM moo_hourly WHERE hour >= :h
+        UNION ALL
+        SELECT nick, count FROM moo_daily WHERE day >= :d
+    ) AS buckets GROUP BY nick ORDER BY total DESC, nick LIMIT :l
+""")
+SQL_WINDOW_TOP_CHAN = _sql("""
+    SELECT nick, SUM(count) AS total FROM (
+        SELECT nick, count FROM moo_hourly WHERE channel = :c AND hour >= :h
+        UNION ALL
+        SELECT nick, count FROM moo_daily WHERE channel = :c AND day >= :d
+    ) AS buckets GROUP BY nick ORDER BY total DESC, nick LIMIT :l
+""")
+SQL_WINDOW_NICK = _sql("""
+    SELECT COALESCE(SUM(count), 0) FROM (
+        SELECT count FROM moo_hourly WHERE nick = :n AND hour >= :h
+        UNION ALL
+        SELECT count FROM moo_daily WHERE nick = :n AND day >= :d
+    ) AS buckets
+""")
+SQL_WINDOW_NICK_CHAN = _sql("""
+    SELECT COALESCE(SUM(count), 0) FROM (
+        SELECT count FROM moo_hourly WHERE nick = :n AND channel = :c AND hour >= :h
+        UNION ALL
+        SELECT count FROM moo_daily WHERE nick = :n AND channel = :c AND day >= :d
+    ) AS buckets
+""")
+
+# Multi-writer mode: each node's own share of every count, stamped with the
+# node's sequence number at the time of its last change (see _sync_nodes)
+SQL_CREATE_NODE_COUNTS = _sql("""
+    CREATE TABLE IF NOT EXISTS moo_node_counts (
+        node TEXT,
+        nick TEXT,
+        channel TEXT,
+        count INTEGER DEFAULT 0,
+        seq INTEGER DEFAULT 0,
+        PRIMARY KEY (node, nick, channel)
+    ) WITHOUT ROWID
+""")
+SQL_CREATE_NODES = _sql("""
+    CREATE TABLE IF NOT EXISTS moo_nodes (
+        node TEXT PRIMARY KEY,
+        seq INTEGER DEFAULT 0,
+        resets INTEGER DEFAULT 0
+    )
+""")
+SQL_SEED_NODE = _sql("INSERT OR IGNORE INTO moo_nodes (node, seq, resets) VALUES (:o, 0, 0)")
+SQL_BUMP_NODE = _sql("UPDATE moo_nodes SET seq = seq + 1 WHERE node = :o")
+SQL_BUMP_NODE_RESETS = _sql("UPDATE moo_nodes SET resets = resets + 1 WHERE node = :o")
+SQL_ALL_NODES = _sql("SELECT node, seq, resets FROM moo_nodes")
+# The schema version each node last started with (from version 6 on)
+SQL_MARK_NODE = _sql("UPDATE moo_nodes SET version = :v WHERE node = :o")
+SQL_OLD_NODES = _sql("SELECT COUNT(*) FROM moo_nodes WHERE version < :v")
+SQL_UPSERT_NODE_COUNT = _sql("""
+    INSERT INTO moo_node_counts (node, nick, channel, count, seq)
+    VALUES (:o, :n, :c, :v, (SELECT seq FROM moo_nodes WHERE node = :o))
+    ON CONFLICT(node, nick, channel) DO UPDATE
+    SET count = moo_node_counts.count + excluded.count, seq = excluded.seq
+""")
+SQL_SEED_NODE_COUNT = _sql(
+    "INSERT OR IGNORE INTO moo_node_counts (node, nick, channel, count, seq) "
+    "VALUES (:o, :n, :c, 0, 0)"
+)
+SQL_ADD_NODE_COUNT = _sql("""
+    UPDATE moo_node_counts
+    SET count = count + :v, seq = (SELECT seq FROM moo_nodes WHERE node = :o)
+    WHERE node = :o AND nick = :n AND channel = :c
+""")
+SQL_NODE_CHANGES = _sql(
+    "SELECT nick, channel FROM moo_node_counts WHERE node = :o AND seq > :q"
+)
+SQL_DELETE_NICK_NODES = _sql("DELETE FROM moo_node_counts WHERE nick = :n")
+
+# Chunked resets (.mooreset), one transaction per chunk. A full reset walks
+# the nicks in order, one range (:a, :b] at a time. A range ends at the
+# RESET_CHUNK-th row of whichever nick-ordered table reaches it first, so it
+# holds at most a chunk of rows per table (plus the rest of one nick's
+# rows). A one-nick reset walks that nick's channel rows (by channel id),
+# then its history rows, a chunk at a time. Interned ids outlive resets.
+RESET_CHUNK = 2000
+RESET_TABLES = ("moo_counts", "moo_chan_counts", "moo_hourly", "moo_daily")
+SQL_RESET_BOUND = {
+    table: _sql(f"""
+        SELECT MAX(nick), COUNT(*) FROM (
+            SELECT nick FROM {table} WHERE nick > :a ORDER BY nick LIMIT :l
+        ) AS chunk
+    """)
+    for table in RESET_TABLES if table != "moo_chan_counts"
+}
+SQL_RESET_BOUND["moo_chan_counts"] = _sql("""
+    SELECT MAX(nick), COUNT(*) FROM (
+        SELECT n.nick FROM moo_nicks n CROSS JOIN moo_chan_counts k ON k.nick_id = n.id
+        WHERE n.nick > :a ORDER BY n.nick LIMIT :l
+    ) AS chunk
+""")
+SQL_RESET_RANGE = {
+    table: _sql(f"DELETE FROM {table} WHERE nick > :a AND nick <= :b")
+    for table in RESET_TABLES if table != "moo_chan_counts"
+}
+SQL_RESET_RANGE["moo_chan_counts"] = _sql("""
+    DELETE FROM moo_chan_counts
+    WHERE nick_id IN (SELECT id FROM moo_nicks WHERE nick > :a AND nick <= :b)
+""")
+SQL_RESET_RANGE_NODES = _sql(
+    "DELETE FROM moo_node_counts WHERE node = :o AND nick > :a AND nick <= :b"
+)
+SQL_RANGE_GLOBAL = _sql("SELECT nick, count FROM moo_counts WHERE nick > :a AND nick <= :b")
+SQL_RANGE_CHAN = _sql("""
+    SELECT k.nick, c.channel, k.count FROM moo_nicks n
+    CROSS JOIN moo_chan_counts k ON k.nick_id = n.id CROSS JOIN moo_channels c ON c.id = k.channel_id
+    WHERE n.nick > :a AND n.nick <= :b
+""")
+SQL_NICK_CHAN_CHUNK = _sql("""
+    SELECT k.channel_id, c.channel, k.count FROM moo_chan_counts k
+    CROSS JOIN moo_channels c ON c.id = k.channel_id
+    WHERE k.nick_id = :ni AND k.channel_id > :a ORDER BY k.channel_id LIMIT :l
+""")
+SQL_RESET_NICK_CHAN = _sql(
+    "DELETE FROM moo_chan_counts WHERE nick_id = :ni AND channel_id > :a AND channel_id <= :b"
+)
+SQL_NICK_HOURLY_CHUNK = _sql("""
+    SELECT hour, channel FROM moo_hourly
+    WHERE nick = :n AND (hour, channel) > (:t, :a) ORDER BY hour, channel LIMIT :l
+""")
+SQL_RESET_NICK_HOURLY = _sql("""
+    DELETE FROM moo_hourly
+    WHERE nick = :n AND (hour, channel) > (:t, :a) AND (hour, channel) <= (:u, :b)
+""")
+SQL_NICK_DAILY_CHUNK = _sql("""
+    SELECT day, channel FROM moo_daily
+    WHERE nick = :n AND (day, channel) > (:t, :a) ORDER BY day, channel LIMIT :l
+""")
+SQL_RESET_NICK_DAILY = _sql("""
+    DELETE FROM moo_daily
+    WHERE nick = :n AND (day, channel) > (:t, :a) AND (day, channel) <= (:u, :b)
+""")
+
+
+# Schema version 6 moved channel counts from moo_counts_chan to
+# moo_chan_counts. While a node sharing the database still runs an older
+# version (moo_nodes.version), the old table stays and these triggers copy
+# every change to either table to the other, so old nodes keep reading and
+# writing theirs. A copy is only made where the other side differs, which
+# ends the back and forth, and none uses a conflict clause: an outer INSERT
+# OR REPLACE would make it REPLACE too, and hand a nick a new id. sqlite
+# only: old nodes never ran on PostgreSQL. The last node to upgrade drops
+# it all (_SqlStore.migrate).
+LEGACY_CHAN_VERSION = 6
+SQL_MIRROR_OLD_CHAN = [_sql(trigger) for trigger in ("""
+    CREATE TRIGGER IF NOT EXISTS moo_counts_chan_insert AFTER INSERT ON moo_counts_chan BEGIN
+        INSERT INTO moo_nicks (nick) SELECT NEW.nick
+        WHERE NOT EXISTS (SELECT 1 FROM moo_nicks WHERE nick = NEW.nick);
+        INSERT INTO moo_channels (channel) SELECT NEW.channel
+        WHERE NOT EXISTS (SELECT 1 FROM moo_channels WHERE channel = NEW.channel);
+        UPDATE moo_chan_counts SET count = COALESCE(NEW.count, 0)
+        WHERE nick_id = (SELECT id FROM moo_nicks WHERE nick = NEW.nick)
+        AND channel_id = (SELECT id FROM moo_channels WHERE channel = NEW.channel)
+        AND count <> COALESCE(NEW.count, 0);
+        INSERT INTO moo_chan_counts (nick_id, channel_id, nick, count)
+        SELECT n.id, c.id, NEW.nick, COALESCE(NEW.count, 0) FROM moo_nicks n, moo_channels c
+        WHERE n.nick = NEW.nick AND c.channel = NEW.channel
+        AND NOT EXISTS (SELECT 1 FROM moo_chan_counts WHERE nick_id = n.id AND channel_id = c.id);
+    END
+""", """
+    CREATE TRIGGER IF NOT EXISTS moo_counts_chan_update AFTER UPDATE OF count ON moo_counts_chan BEGIN
+        UPDATE moo_chan_counts SET count = COALESCE(NEW.count, 0)
+        WHERE nick_id = (SELECT id FROM moo_nicks WHERE nick = NEW.nick)
+        AND channel_id = (SELECT id FROM moo_channels WHERE channel = NEW.channel)
+        AND count <> COALESCE(NEW.count, 0);
+    END
+""", """
+    CREATE TRIGGER IF NOT EXISTS moo_counts_chan_delete AFTER DELETE ON moo_counts_chan BEGIN
+        DELETE FROM moo_chan_counts
+        WHERE nick_id = (SELECT id FROM moo_nicks WHERE nick = OLD.nick)
+        AND channel_id = (SELECT id FROM moo_channels WHERE channel = OLD.channel);
+    END
+""", """
+    CREATE TRIGGER IF NOT EXISTS moo_chan_counts_insert AFTER INSERT ON moo_chan_counts BEGIN
+        UPDATE moo_counts_chan SET count = NEW.count
+        WHERE nick = NEW.nick AND channel = (SELECT channel FROM moo_channels WHERE id = NEW.channel_id)
+        AND count IS NOT NEW.count;
+        INSERT INTO moo_counts_chan (nick, channel, count)
+        SELECT NEW.nick, c.channel, NEW.count FROM moo_channels c
+        WHERE c.id = NEW.channel_id
+        AND NOT EXISTS (SELECT 1 FROM moo_counts_chan WHERE nick = NEW.nick AND channel = c.channel);
+    END
+""", """
+    CREATE TRIGGER IF NOT EXISTS moo_chan_counts_update AFTER UPDATE OF count ON moo_chan_counts BEGIN
+        UPDATE moo_counts_chan SET count = NEW.count
+        WHERE nick = NEW.nick AND channel = (SELECT channel FROM moo_channels WHERE id = NEW.channel_id)
+        AND count IS NOT NEW.count;
+    END
+""", """
+    CREATE TRIGGER IF NOT EXISTS moo_chan_counts_delete AFTER DELETE ON moo_chan_counts BEGIN
+        DELETE FROM moo_counts_chan
+        WHERE nick = OLD.nick AND channel = (SELECT channel FROM moo_channels WHERE id = OLD.channel_id);
+    END
+""")]
+# Dropping moo_counts_chan takes its own triggers with it
+SQL_RETIRE_OLD_CHAN = [
+    _sql("DROP TRIGGER IF EXISTS moo_chan_counts_insert"),
+    _sql("DROP TRIGGER IF EXISTS moo_chan_counts_update"),
+    _sql("DROP TRIGGER IF EXISTS moo_chan_counts_delete"),
+    _sql("DROP TABLE IF EXISTS moo_counts_chan"),
+]
+
+
+# Ordered schema migrations: (version, description, statements).
+# Append only — never edit a released entry. Each runs once, in its own
+# transaction, and records its version in moo_schema_version.
+MIGRATIONS = [
+    (1, "moo_counts and moo_counts_chan tables", [
+        SQL_CREATE_COUNTS,
+        SQL_CREATE_COUNTS_CHAN,
+    ]),
+    # Covering indexes for the leaderboard loads and per-channel sums:
+    # ORDER BY count DESC, nick (optionally WHERE channel = ?) reads them
+    # in order instead of scanning and sorting the table.
+    (2, "leaderboard indexes", [
+        _sql("CREATE INDEX IF NOT EXISTS moo_counts_rank "
+             "ON moo_counts (count DESC, nick)"),
+        _sql("CREATE INDEX IF NOT EXISTS moo_counts_chan_rank "
+             "ON moo_counts_chan (channel, count DESC, nick)"),
+    ]),
+    (3, "running totals", [
+        SQL_CREATE_TOTALS,
+        _sql("INSERT OR REPLACE INTO moo_totals (scope, total) "
+             "SELECT '', COALESCE(SUM(count), 0) FROM moo_counts",
+             postgresql="INSERT INTO moo_totals (scope, total) "
+                        "SELECT '', COALESCE(SUM(count), 0) FROM moo_counts "
+                        "ON CONFLICT(scope) DO UPDATE SET total = excluded.total"),
+        _sql("INSERT OR REPLACE INTO moo_totals (scope, total) "
+             "SELECT channel, SUM(count) FROM moo_counts_chan GROUP BY channel",
+             postgresql="INSERT INTO moo_totals (scope, total) "
+                        "SELECT channel, SUM(count) FROM moo_counts_chan GROUP BY channel "
+                        "ON CONFLICT(scope) DO UPDATE SET total = excluded.total"),
+    ]),
+    # Per-nick and per-channel windowed reads use these; the primary keys
+    # serve the network-wide ones (range on hour/day).
+    (4, "hourly and daily moo history", [
+        SQL_CREATE_HOURLY,
+        SQL_CREATE_DAILY,
+        _sql("CREATE INDEX IF NOT EXISTS moo_hourly_nick ON moo_hourly (nick, hour, channel, count)"),
+        _sql("CREATE INDEX IF NOT EXISTS moo_daily_nick ON moo_daily (nick, day, channel, count)"),
+        _sql("CREATE INDEX IF NOT EXISTS moo_daily_chan ON moo_daily (channel, day, nick, count)"),
+    ]),
+    (5, "per-node counters for multi-writer mode", [
+        SQL_CREATE_NODE_COUNTS,
+        SQL_CREATE_NODES,
+        _sql("CREATE INDEX IF NOT EXISTS moo_node_counts_seq ON moo_node_counts (node, seq)"),
+    ]),
+    # Ids are handed out in name order, so the counts table (and a dump of
+    # it) starts out laid out the way the old one was. moo_counts_chan is
+    # mirrored until no node needs it (see SQL_MIRROR_OLD_CHAN); the file
+    # keeps its pages until `.moomaint rebuild`.
+    (LEGACY_CHAN_VERSION, "interned nick and channel ids for channel counts", [
+        SQL_CREATE_NICKS,
+        SQL_CREATE_CHANNELS,
+        SQL_CREATE_CHAN_COUNTS,
+        _sql("INSERT OR IGNORE INTO moo_nicks (nick) "
+             "SELECT DISTINCT nick FROM moo_counts_chan ORDER BY nick"),
+        _sql("INSERT OR IGNORE INTO moo_channels (channel) "
+             "SELECT DISTINCT channel FROM moo_counts_chan ORDER BY channel"),
+        _sql("INSERT INTO moo_chan_counts (nick_id, channel_id, nick, count) "
+             "SELECT n.id, c.id, o.nick, COALESCE(o.count, 0) FROM moo_counts_chan o "
+             "JOIN moo_channels c ON c.channel = o.channel JOIN moo_nicks n ON n.nick = o.nick "
+             "ORDER BY 1, 2"),
+        _sql("CREATE INDEX IF NOT EXISTS moo_chan_counts_rank "
+             "ON moo_chan_counts (channel_id, count DESC, nick)"),
+        *SQL_MIRROR_OLD_CHAN,
+        _sql("ALTER TABLE moo_nodes ADD COLUMN version INTEGER NOT NULL DEFAULT 5"),
+    ]),
+]
+
+
+# --------------------------------------------------------------
+# Legacy sqlite connection pool
+# --------------------------------------------------------------
+# Sopel runs every handler call in a fresh thread, so connections are pooled
+# rather than thread-local. They are opened with check_same_thread=False when
+# the DB exposes its filename, and get the sqlite_profile pragmas once, there;
+# otherwise bot.db.connect() is used per borrow, as Sopel configured it.
+LEGACY_POOL_SIZE = 4
+
+_LEGACY_IDLE = []
+_LEGACY_LOCK = threading.Lock()
+
+
+def _legacy_open(bot):
+    filename = getattr(bot.db, "filename", None)
+    if filename:
+        conn = sqlite3.connect(filename, check_same_thread=False)
+        _tune_connection(conn)
+        return conn
+    return None
+
+
+@contextmanager
+def _legacy_db(bot):
+    """
+    Borrow a long-lived legacy sqlite connection.
+
+    The transaction is rolled back if the block raises; committing is up to
+    the caller, as with a plain connection.
+    """
+    with _LEGACY_LOCK:
+        conn = _LEGACY_IDLE.pop() if _LEGACY_IDLE else None
+    pooled = True
+    if conn is None:
+        conn = _legacy_open(bot)
+        if conn is None:
+            conn, pooled = bot.db.connect(), False
+
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if not pooled:
+            conn.close()
+        else:
+            with _LEGACY_LOCK:
+                if len(_LEGACY_IDLE) < LEGACY_POOL_SIZE:
+                    _LEGACY_IDLE.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+
+def _legacy_close_all():
+    """Close every idle pooled connection (on shutdown)."""
+    with _LEGACY_LOCK:
+        conns = list(_LEGACY_IDLE)
+        _LEGACY_IDLE.clear()
+    for conn in conns:
+        try:
+            conn.close()
+        except Exception:
+            logger.exception("Error closing moo DB connection")
+
+
+# --------------------------------------------------------------
+# Storage backends
+# --------------------------------------------------------------
+# Everything that reads or writes counts goes through a MooStore, picked with
+# `backend` in [moo]:
+#   sqlalchemy  Sopel 7+'s bot.db.session()
+#   sqlite      bot.db.connect() (pooled when the DB exposes its filename)
+#   memory      dicts in this process, saved to disk every MEMORY_SAVE_INTERVAL
+#   auto        sqlalchemy when the bot has it, otherwise sqlite
+# The two SQL stores share every query and only differ in how a statement is
+# run and whether UPSERT/RETURNING may be used. Callers hold _FLUSH_LOCK
+# around writes; reads take no lock (see _with_unflushed).
+BACKENDS = ("auto", "sqlalchemy", "sqlite", "memory")
+MEMORY_SAVE_INTERVAL = 60   # seconds between saves of the memory store
+
+STORE = None   # set by setup()
+
+
+def _one(result):
+    """First column of the first row, or None."""
+    row = result.fetchone()
+    return row[0] if row else None
+
+
+def _node_params(rows):
+    # Multi-writer mode: the same deltas also go to this node's own counters,
+    # all stamped with one new node sequence number per transaction.
+    node = SETTINGS.node_id
+    return {"o": node}, [{"o": node, "n": n, "c": c, "v": v} for n, c, v in rows]
+
+
+class MooStore:
+    """
+    Counts, running totals and leaderboard queries for one bot.
+
+    Nicks and channels are passed in normalized (stripped, lowercased).
+    Global counts use channel None; totals are keyed by scope (a channel, or
+    GLOBAL_SCOPE). Counts that drop to 0 keep their row, as in the tables.
+    """
+
+    name = ""
+    sql = True   # backed by the moo tables (history and multi-writer need them)
+
+    def __init__(self, bot):
+        self.db = bot.db
+
+    def close(self):
+        """Release connections, or save to disk (memory)."""
+
+    def tune(self):
+        """Arrange for sqlite_profile pragmas on new connections (sqlite databases only)."""
+
+    @contextmanager
+    def sqlite_connection(self):
+        """A DB-API connection to the sqlite database for maintenance, or None."""
+        yield None
+
+
+class _SessionTx:
+    """One SQLAlchemy session, spoken to with the _sql() strings in its dialect's text()."""
+
+    __slots__ = ("s", "texts")
+
+    def __init__(self, s, texts):
+        self.s = s
+        self.texts = texts
+
+    def run(self, sql, params=None):
+        clause = self.texts[sql]
+        if clause is None:
+            return None   # nothing to do in this dialect (sqlite's triggers)
+        return self.s.execute(clause, params or {})
+
+    def many(self, sql, rows):
+        if rows:
+            self.s.execute(self.texts[sql], rows)
+
+    def begin(self):
+        pass   # the session opens its own transaction
+
+    def commit(self):
+        self.s.commit()
+
+
+class _ConnTx:
+    """One DB-API connection (sqlite3, or Sopel's raw connection)."""
+
+    __slots__ = ("conn",)
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def run(self, sql, params=None):
+        return self.conn.execute(sql, params or {})
+
+    def many(self, sql, rows):
+        if rows:
+            self.conn.executemany(sql, rows)
+
+    def begin(self):
+        # sqlite3 doesn't open a transaction for DDL on its own
+        self.conn.execute("BEGIN")
+
+    def commit(self):
+        self.conn.commit()
+
+
+ID_CACHE_SIZE = 50000   # interned ids kept per kind (nick, channel)
+
+
+class _IdCache:
+    """
+    Bounded LRU of interned ids (name → id) for one kind.
+
+    Ids are never deleted or reused, so an entry stays right for good; only
+    ids read from the DB, or written by a committed transaction, go in.
+    """
+
+    def __init__(self, size=ID_CACHE_SIZE):
+        self._lock = threading.Lock()
+        self._ids = OrderedDict()
+        self._size = size
+
+    def get(self, name):
+        with self._lock:
+            i = self._ids.get(name)
+            if i is not None:
+                self._ids.move_to_end(name)
+            return i
+
+    def update(self, ids):
+        with self._lock:
+            self._ids.update(ids)
+            for name in ids:
+                self._ids.move_to_end(name)
+            while len(self._ids) > self._size:
+                self._ids.popitem(last=False)
+
+
+class _SqlStore(MooStore):
+    upsert = True      # INSERT ... ON CONFLICT; otherwise INSERT OR IGNORE + UPDATE
+    returning = False  # UPSERT ... RETURNING count
+
+    def __init__(self, bot):
+        super().__init__(bot)
+        self._id_cache = {kind: _IdCache() for kind in ID_TABLES}
+
+    def transaction(self):
+        """Context manager yielding a _SessionTx/_ConnTx; rolled back unless committed."""
+        raise NotImplementedError
+
+    def query(self, sql, params=None):
+        with self.transaction() as tx:
+            return tx.run(sql, params).fetchall()
+
+    def migrate(self):
+        """Bring the moo tables up to the newest version in MIGRATIONS."""
+        with self.transaction() as tx:
+            tx.run(SQL_CREATE_SCHEMA_VERSION)
+            tx.commit()
+            current = _one(tx.run(SQL_GET_SCHEMA_VERSION)) or 0
+            for version, description, statements in MIGRATIONS:
+                if version <= current:
+                    continue
+                logger.info("Moo schema migration %d: %s", version, description)
+                tx.begin()
+                for statement in statements:
+                    tx.run(statement)
+                tx.run(SQL_SET_SCHEMA_VERSION, {"v": version, "t": int(time.time())})
+                tx.commit()
+                current = version
+            if current < LEGACY_CHAN_VERSION:
+                return
+
+            # Record the version this node runs; once none runs an older
+            # one, the pre-6 channel table and its triggers go
+            tx.begin()
+            if SETTINGS.node_id:
+                node = {"o": SETTINGS.node_id, "v": current}
+                tx.run(SQL_SEED_NODE, node)
+                tx.run(SQL_MARK_NODE, node)
+            if not _one(tx.run(SQL_OLD_NODES, {"v": LEGACY_CHAN_VERSION})):
+                for statement in SQL_RETIRE_OLD_CHAN:
+                    tx.run(statement)
+            tx.commit()
+
+    # Interned ids
+    def _id(self, tx, kind, name):
+        """The id of one name, or None if it has never been counted."""
+        cache = self._id_cache[kind]
+        i = cache.get(name)
+        if i is None:
+            i = _one(tx.run(SQL_ID[kind], {"x": name}))
+            if i is not None:
+                cache.update({name: i})
+        return i
+
+    def _fetch_ids(self, tx, kind, names):
+        """{name: id} for those of names that have one, LOOKUP_CHUNK per query."""
+        found = {}
+        for start in range(0, len(names), LOOKUP_CHUNK):
+            chunk = names[start:start + LOOKUP_CHUNK]
+            size = next(n for n in LOOKUP_SIZES if n >= len(chunk))
+            params = {f"n{i}": None for i in range(len(chunk), size)}
+            params.update((f"n{i}", name) for i, name in enumerate(chunk))
+            found.update(tx.run(SQL_IDS_MANY[kind][size], params).fetchall())
+        return found
+
+    def _ids(self, tx, kind, names):
+        """{name: id} for those of names that have one, through the cache."""
+        cache = self._id_cache[kind]
+        found, missing = {}, []
+        for name in names:
+            i = cache.get(name)
+            if i is None:
+                missing.append(name)
+            else:
+                found[name] = i
+        if missing:
+            fetched = self._fetch_ids(tx, kind, missing)
+            cache.update(fetched)
+            found.update(fetched)
+        return found
+
+    def _intern(self, tx, kind, names, fresh):
+        """
+        {name: id} for names, giving ids to the new ones (once per kind and
+        transaction). New ids go in fresh[kind] and reach the cache only
+        after the commit: a rolled-back id could be handed to another name.
+        """
+        found = self._ids(tx, kind, names)
+        new = [name for name in names if name not in found]
+        if new:
+            tx.many(SQL_INTERN[kind], [{"x": name} for name in new])
+            ids = self._fetch_ids(tx, kind, new)
+            fresh.setdefault(kind, {}).update(ids)
+            found.update(ids)
+        return found
+
+    def _remember(self, fresh):
+        for kind, ids in fresh.items():
+            self._id_cache[kind].update(ids)
+
+    def _add(self, tx, upsert, seed, add, rows):
+        if self.upsert:
+            tx.many(upsert, rows)
+        else:
+            # Pre-3.24 sqlite: same transaction, seed + add
+            tx.many(seed, rows)
+            tx.many(add, rows)
+
+    # Counts
+    def get(self, nick, channel=None):
+        with self.transaction() as tx:
+            if channel is None:
+                return _one(tx.run(SQL_GET_GLOBAL, {"n": nick})) or 0
+            ci = self._id(tx, "channel", channel)
+            ni = ci and self._id(tx, "nick", nick)
+            if not ni:
+                return 0
+            return _one(tx.run(SQL_GET_CHAN, {"ci": ci, "ni": ni})) or 0
+
+    def get_many(self, nicks, channel=None):
+        """{nick: count} for those of nicks that have a row, LOOKUP_CHUNK per query."""
+        found = {}
+        with self.transaction() as tx:
+            if channel is None:
+                statements, keys, scope = SQL_GET_GLOBAL_MANY, nicks, {}
+            else:
+                ci = self._id(tx, "channel", channel)
+                if ci is None:
+                    return found
+                names = {i: nick for nick, i in self._ids(tx, "nick", nicks).items()}
+                statements, keys, scope = SQL_GET_CHAN_MANY, list(names), {"ci": ci}
+            for start in range(0, len(keys), LOOKUP_CHUNK):
+                chunk = keys[start:start + LOOKUP_CHUNK]
+                size = next(n for n in LOOKUP_SIZES if n >= len(chunk))
+                params = {f"n{i}": None for i in range(len(chunk), size)}
+                params.update((f"n{i}", key) for i, key in enumerate(chunk))
+                params.update(scope)
+                found.update(tx.run(statements[size], params).fetchall())
+        if channel is not None:
+            found = {names[i]: count for i, count in found.items()}
+        return found
+
+    def add(self, glob, chan, totals, hourly=None, node=None, reads=()):
+        """
+        Add deltas in one transaction: glob {nick: delta}, chan {(nick,
+        channel): delta}, totals {scope: delta}, hourly {(hour, channel,
+        nick): delta} and node [(nick, channel or '', delta)] rows.
+
+        Each count is added in a single statement (count = count + delta), so
+        concurrent writers can't overwrite each other. Returns the new global
+        counts and the new channel counts for the keys in reads.
+        """
+        reads, fresh = set(reads), {}
+        g_rows = [{"n": n, "v": v} for n, v in glob.items()]
+        with self.transaction() as tx:
+            self._add(tx, SQL_UPSERT_TOTAL, SQL_SEED_TOTAL, SQL_ADD_TOTAL,
+                      [{"s": s, "v": v} for s, v in totals.items() if v])
+            c_rows = self._chan_rows(tx, chan.items(), fresh)
+            if self.returning:
+                g_new = {r["n"]: _one(tx.run(SQL_UPSERT_GLOBAL_RETURNING, r)) for r in g_rows}
+                c_new = {key: _one(tx.run(SQL_UPSERT_CHAN_RETURNING, r))
+                         for key, r in zip(chan, c_rows) if key in reads}
+                self._add(tx, SQL_UPSERT_CHAN, SQL_SEED_CHAN, SQL_ADD_CHAN,
+                          [r for key, r in zip(chan, c_rows) if key not in reads])
+            else:
+                self._add(tx, SQL_UPSERT_GLOBAL, SQL_SEED_GLOBAL, SQL_ADD_GLOBAL, g_rows)
+                self._add(tx, SQL_UPSERT_CHAN, SQL_SEED_CHAN, SQL_ADD_CHAN, c_rows)
+                g_new = {r["n"]: _one(tx.run(SQL_GET_GLOBAL, r)) for r in g_rows}
+                c_new = {key: _one(tx.run(SQL_GET_CHAN, r))
+                         for key, r in zip(chan, c_rows) if key in reads}
+            if hourly:
+                self._add(tx, SQL_UPSERT_HOURLY, SQL_SEED_HOURLY, SQL_ADD_HOURLY,
+                          [{"h": h, "c": c, "n": n, "v": v} for (h, c, n), v in hourly.items()])
+            if node:
+                node, params = _node_params(node)
+                tx.run(SQL_SEED_NODE, node)
+                tx.run(SQL_BUMP_NODE, node)
+                self._add(tx, SQL_UPSERT_NODE_COUNT, SQL_SEED_NODE_COUNT, SQL_ADD_NODE_COUNT, params)
+            tx.commit()
+        self._remember(fresh)
+        return g_new, c_new
+
+    def _chan_rows(self, tx, deltas, fresh):
+        """Statement rows for ((nick, channel), value) pairs, interning new names."""
+        deltas = list(deltas)
+        if not deltas:
+            return []
+        nick_ids = self._intern(tx, "nick", list({n for (n, _), _ in deltas}), fresh)
+        chan_ids = self._intern(tx, "channel", list({c for (_, c), _ in deltas}), fresh)
+        return [{"ci": chan_ids[c], "ni": nick_ids[n], "n": n, "v": v} for (n, c), v in deltas]
+
+    def reset_chunks(self, nick=None, limit=RESET_CHUNK):
+        """
+        Delete one nick's counts and history (or everyone's) a chunk at a
+        time, fixing the totals as it goes. A generator: every step commits
+        one transaction, then yields (rows deleted, the (nick, channel or
+        None) counts that went).
+        """
+        if nick is None:
+            yield from self._reset_all(limit)
+        else:
+            yield from self._reset_nick(nick, limit)
+
+    def _reset_all(self, limit):
+        after = ""
+        while True:
+            with self.transaction() as tx:
+                ends = []
+                for table in RESET_TABLES:
+                    last, rows = tx.run(SQL_RESET_BOUND[table], {"a": after, "l": limit}).fetchone()
+                    if last is not None:
+                        ends.append((rows < limit, last))
+                if not ends:
+                    tx.run(SQL_DROP_ZERO_TOTALS)
+                    tx.commit()
+                    return
+                # The nearest full chunk ends the range; once no table has
+                # one left, the range takes everything
+                full = [last for done, last in ends if not done]
+                upto = min(full) if full else max(last for _, last in ends)
+                span = {"a": after, "b": upto}
+
+                g_rows = tx.run(SQL_RANGE_GLOBAL, span).fetchall()
+                c_rows = tx.run(SQL_RANGE_CHAN, span).fetchall()
+                totals = Counter()
+                for _, count in g_rows:
+                    totals[GLOBAL_SCOPE] += count
+                for _, channel, count in c_rows:
+                    totals[channel] += count
+                tx.many(SQL_ADD_TOTAL, [{"s": s, "v": -v} for s, v in totals.items() if v])
+
+                deleted = sum(tx.run(SQL_RESET_RANGE[table], span).rowcount
+                              for table in RESET_TABLES)
+                for node, _, _ in tx.run(SQL_ALL_NODES).fetchall():
+                    deleted += tx.run(SQL_RESET_RANGE_NODES, {"o": node, **span}).rowcount
+                tx.commit()
+            yield deleted, [(n, None) for n, _ in g_rows] + [(n, c) for n, c, _ in c_rows]
+            after = upto
+
+    def _reset_nick(self, nick, limit):
+        with self.transaction() as tx:
+            ni = self._id(tx, "nick", nick)
+        after = 0
+        while ni is not None:
+            with self.transaction() as tx:
+                rows = tx.run(SQL_NICK_CHAN_CHUNK, {"ni": ni, "a": after, "l": limit}).fetchall()
+                if not rows:
+                    break
+                upto = rows[-1][0]
+                tx.many(SQL_ADD_TOTAL, [{"s": c, "v": -v} for _, c, v in rows if v])
+                tx.run(SQL_RESET_NICK_CHAN, {"ni": ni, "a": after, "b": upto})
+                tx.commit()
+            yield len(rows), [(nick, c) for _, c, _ in rows]
+            if len(rows) < limit:
+                break
+            after = upto
+
+        for select, delete in ((SQL_NICK_HOURLY_CHUNK, SQL_RESET_NICK_HOURLY),
+                               (SQL_NICK_DAILY_CHUNK, SQL_RESET_NICK_DAILY)):
+            after = (-1, "")
+            while True:
+                with self.transaction() as tx:
+                    keys = tx.run(select, {"n": nick, "t": after[0], "a": after[1],
+                                           "l": limit}).fetchall()
+                    if not keys:
+                        break
+                    upto = tuple(keys[-1])
+                    tx.run(delete, {"n": nick, "t": after[0], "a": after[1],
+                                    "u": upto[0], "b": upto[1]})
+                    tx.commit()
+                yield len(keys), []
+                if len(keys) < limit:
+                    break
+                after = upto
+
+        with self.transaction() as tx:
+            count = _one(tx.run(SQL_GET_GLOBAL, {"n": nick}))
+            if count:
+                tx.run(SQL_ADD_TOTAL, {"s": GLOBAL_SCOPE, "v": -count})
+            deleted = (tx.run(SQL_DELETE_NICK, {"n": nick}).rowcount
+                       + tx.run(SQL_DELETE_NICK_NODES, {"n": nick}).rowcount)
+            tx.commit()
+        yield deleted, [(nick, None)]
+
+    # Leaderboards
+    def _scope_query(self, channel, global_sql, chan_sql, params):
+        """Rows of global_sql, or of chan_sql for the channel's id (none if it has none)."""
+        with self.transaction() as tx:
+            if channel is None:
+                return tx.run(global_sql, params).fetchall()
+            ci = self._id(tx, "channel", channel)
+            return [] if ci is None else tx.run(chan_sql, {"ci": ci, **params}).fetchall()
+
+    def top(self, channel, limit):
+        rows = self._scope_query(channel, SQL_TOP_GLOBAL, SQL_TOP_CHAN, {"l": limit})
+        return [(n, c) for n, c in rows]
+
+    def page(self, channel, below, limit):
+        """Up to limit (nick, count) rows with count <= below, in leaderboard order."""
+        rows = self._scope_query(channel, SQL_PAGE_GLOBAL, SQL_PAGE_CHAN, {"v": below, "l": limit})
+        return [(n, c) for n, c in rows]
+
+    def scan(self, channel):
+        """Every (nick, count) of a scope, streamed."""
+        with self.transaction() as tx:
+            if channel is None:
+                yield from tx.run(SQL_ALL_GLOBAL)
+                return
+            ci = self._id(tx, "channel", channel)
+            if ci is not None:
+                yield from tx.run(SQL_ALL_CHAN, {"ci": ci})
+
+    def nick_at(self, channel, count, last, skip=()):
+        """First (or last) nick by name among those with exactly count moos, not in skip."""
+        rows = self._scope_query(channel,
+                                 SQL_LAST_AT_GLOBAL if last else SQL_FIRST_AT_GLOBAL,
+                                 SQL_LAST_AT_CHAN if last else SQL_FIRST_AT_CHAN,
+                                 {"v": count, "l": len(skip) + 1})
+        return next((nick for nick, in rows if nick not in skip), None)
+
+    # Running totals
+    def total(self, scope):
+        with self.transaction() as tx:
+            return _one(tx.run(SQL_GET_TOTAL, {"s": scope}))
+
+    def totals(self):
+        return dict(self.query(SQL_ALL_TOTALS))
+
+    def set_totals(self, fixes):
+        with self.transaction() as tx:
+            tx.many(SQL_SET_TOTAL, [{"s": s, "v": v} for s, v in fixes.items()])
+            tx.commit()
+
+    def sum_global(self):
+        """Sum of every global count, read in RECONCILE_CHUNK nick ranges."""
+        total, after = 0, ""
+        while True:
+            last, part, rows = self.query(SQL_SUM_GLOBAL_CHUNK, {"after": after, "l": RECONCILE_CHUNK})[0]
+            if not rows:
+                return total
+            total += part or 0
+            after = last
+
+    def sum_channels(self, after, limit):
+        """[(channel, sum of counts)] for up to limit channels named after `after`."""
+        return [(c, v) for c, v in self.query(SQL_SUM_CHAN_CHUNK, {"after": after, "l": limit})]
+
+    def sum_channel(self, channel):
+        rows = self._scope_query(channel, None, SQL_SUM_CHAN, {})
+        return rows[0][0] if rows else 0
+
+    # Bulk export / import
+    def iter_counts(self):
+        """Yield every count row as a dump record, a BULK_CHUNK page at a time."""
+        after = ""
+        while True:
+            rows = self.query(SQL_EXPORT_GLOBAL, {"n": after, "l": BULK_CHUNK})
+            for nick, count in rows:
+                yield {"nick": nick, "count": count}
+            if len(rows) < BULK_CHUNK:
+                break
+            after = rows[-1][0]
+
+        after = (0, 0)
+        while True:
+            rows = self.query(SQL_EXPORT_CHAN, {"ni": after[0], "ci": after[1], "l": BULK_CHUNK})
+            for _, _, nick, channel, count in rows:
+                yield {"nick": nick, "channel": channel, "count": count}
+            if len(rows) < BULK_CHUNK:
+                break
+            after = rows[-1][:2]
+
+    def load(self, g_rows, c_rows, mode):
+        """Write imported rows in one transaction; totals are left to reconcile."""
+        fresh = {}
+        with self.transaction() as tx:
+            c_rows = self._chan_rows(tx, (((r["n"], r["c"]), r["v"]) for r in c_rows), fresh)
+            if mode == "overwrite":
+                tx.many(SQL_SET_GLOBAL, g_rows)
+                tx.many(SQL_SET_CHAN, c_rows)
+            else:
+                self._add(tx, SQL_UPSERT_GLOBAL, SQL_SEED_GLOBAL, SQL_ADD_GLOBAL, g_rows)
+                self._add(tx, SQL_UPSERT_CHAN, SQL_SEED_CHAN, SQL_ADD_CHAN, c_rows)
+            tx.commit()
+        self._remember(fresh)
+
+    # History and multi-writer (SQL stores only)
+    def rollup(self, cut, keep_from):
+        """Fold hourly buckets before hour cut into days; drop days before keep_from."""
+        with self.transaction() as tx:
+            rows = [{"d": d, "c": c, "n": n, "v": v}
+                    for d, c, n, v in tx.run(SQL_ROLLUP_HOURLY, {"h": cut})]
+            self._add(tx, SQL_UPSERT_DAILY, SQL_SEED_DAILY, SQL_ADD_DAILY, rows)
+            tx.run(SQL_PRUNE_HOURLY, {"h": cut})
+            tx.run(SQL_PRUNE_DAILY, {"d": keep_from})
+            tx.commit()
+        return len(rows)
+
+    def node_reset(self):
+        node = {"o": SETTINGS.node_id}
+        with self.transaction() as tx:
+            tx.run(SQL_SEED_NODE, node)
+            tx.run(SQL_BUMP_NODE_RESETS, node)
+            tx.commit()
+
+
+class SqlAlchemyStore(_SqlStore):
+    """
+    The moo tables through Sopel's SQLAlchemy bot.db.session().
+
+    Sopel can put its database in sqlite or any server SQLAlchemy speaks;
+    the moo statements are written for sqlite and PostgreSQL (SQL_DIALECTS),
+    so any other database is refused rather than failing on its first moo.
+    """
+
+    name = "sqlalchemy"
+    _tuned = None      # engine _on_checkout is listening on
+    _keeper = None     # idle connection that keeps the file open (NullPool)
+
+    def __init__(self, bot):
+        super().__init__(bot)
+        with self.db.session() as s:
+            dialect = s.get_bind().dialect.name
+        if dialect not in SQL_DIALECTS:
+            raise MooConfigError(f"moo counts need a sqlite or PostgreSQL database, not {dialect} "
+                                 f"(backend = memory works with any)")
+        self._texts = SQL_DIALECTS[dialect]
+        self.returning = dialect != "sqlite" or _SQLITE_RETURNING
+
+    @contextmanager
+    def transaction(self):
+        with self.db.session() as s:
+            yield _SessionTx(s, self._texts)
+
+    def _sqlite_engine(self):
+        with self.db.session() as s:
+            engine = s.get_bind()
+        return engine if engine.dialect.name == "sqlite" else None
+
+    def tune(self):
+        # On checkout rather than connect, so connections Sopel pooled
+        # before setup() are tuned too
+        engine = self._sqlite_engine()
+        if engine is None or self._tuned is not None:
+            return
+        event.listen(engine, "checkout", _on_checkout)
+        self._tuned = engine
+        # Unpooled, every session opens the file afresh, and in WAL mode the
+        # last connection to close checkpoints and deletes the WAL. A read
+        # makes the keeper hold it (and the shared-memory index) open.
+        if isinstance(engine.pool, NullPool):
+            with self.sqlite_connection() as conn:
+                filename = conn.cursor().execute("PRAGMA database_list").fetchone()[2]
+            if filename:
+                self._keeper = sqlite3.connect(filename, check_same_thread=False)
+                self._keeper.execute("PRAGMA schema_version").fetchone()
+
+    @contextmanager
+    def sqlite_connection(self):
+        engine = self._sqlite_engine()
+        if engine is None:
+            yield None
+            return
+        if engine.url.database in (None, "", ":memory:"):
+            # The pool may hand every session the same connection, and
+            # checking it in again would roll back theirs; a connection of
+            # our own shows the same thing, a database with no file
+            conn = sqlite3.connect(":memory:")
+        else:
+            conn = engine.raw_connection()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def close(self):
+        if self._keeper is not None:
+            self._keeper.close()
+            self._keeper = None
+        if self._tuned is not None:
+            event.remove(self._tuned, "checkout", _on_checkout)
+            self._tuned = None
+
+
+class SqliteStore(_SqlStore):
+    """The moo tables through sqlite3 connections from bot.db (see _legacy_db)."""
+
+    name = "sqlite"
+    upsert = returning = _SQLITE_RETURNING
+
+    def __init__(self, bot):
+        super().__init__(bot)
+        self._bot = bot
+
+    @contextmanager
+    def transaction(self):
+        with _legacy_db(self._bot) as conn:
+            yield _ConnTx(conn)
+
+    @contextmanager
+    def sqlite_connection(self):
+        with _legacy_db(self._bot) as conn:
+            yield conn
+
+    def close(self):
+        _legacy_close_all()
+
+
+def _state_path(bot, suffix):
+    """<homedir>/<config name>.<suffix>, or None if the bot has no home directory."""
+    homedir = getattr(getattr(bot.config, "core", None), "homedir", None)
+    if not homedir:
+        return None
+    name = getattr(bot.config, "basename", None) or "default"
+    return os.path.join(homedir, f"{name}.{suffix}")
+
+
+class _CountIndex:
+    """Nicks grouped by count, with the distinct counts kept sorted."""
+
+    __slots__ = ("nicks", "order")
+
+    def __init__(self):
+        self.nicks = {}   # count → set of nicks
+        self.order = []   # distinct counts, ascending
+
+    def move(self, nick, old, new):
+        if old is not None:
+            bucket = self.nicks[old]
+            bucket.discard(nick)
+            if not bucket:
+                del self.nicks[old]
+                del self.order[bisect_left(self.order, old)]
+        if new is not None:
+            bucket = self.nicks.get(new)
+            if bucket is None:
+                bucket = self.nicks[new] = set()
+                insort(self.order, new)
+            bucket.add(nick)
+
+    def rows(self, below=None):
+        """(nick, count) in leaderboard order, starting at count <= below."""
+        end = len(self.order) if below is None else bisect_left(self.order, below + 1)
+        for i in range(end - 1, -1, -1):
+            count = self.order[i]
+            for nick in sorted(self.nicks[count]):
+                yield nick, count
+
+
+class MemoryStore(MooStore):
+    """
+    Counts in dicts, indexed by count per scope, for microsecond increments.
+
+    Saved atomically (temp file + rename) to <homedir>/<config name>.moo-memory.json
+    every MEMORY_SAVE_INTERVAL seconds and on shutdown, and loaded at setup.
+    Moos since the last save are lost if the process dies. There are no
+    history windows or multi-writer mode; the bot's database isn't used.
+    """
+
+    name = "memory"
+    sql = False
+
+    def __init__(self, bot):
+        super().__init__(bot)
+        self.path = _state_path(bot, "moo-memory.json")
+        self._lock = threading.RLock()
+        self._counts = {}   # scope → {nick: count}
+        self._index = {}    # scope → _CountIndex
+        self._totals = {}   # scope → running total
+        self._changes = 0   # writes since the last save
+
+    def _set(self, scope, nick, new):
+        counts = self._counts.get(scope)
+        if counts is None:
+            counts = self._counts[scope] = {}
+            self._index[scope] = _CountIndex()
+        old = counts.get(nick)
+        if new is None:
+            del counts[nick]
+            if not counts:
+                del self._counts[scope], self._index[scope]
+            else:
+                self._index[scope].move(nick, old, None)
+            return
+        counts[nick] = new
+        if new != old:
+            self._index[scope].move(nick, old, new)
+
+    def migrate(self):
+        """Load the last save, if there is one."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        start = _perf()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            rows = [(scope, nick, int(count))
+                    for scope, counts in data["counts"].items()
+                    for nick, count in counts.items()]
+            totals = {scope: int(v) for scope, v in data["totals"].items()}
+        except (OSError, ValueError, TypeError, KeyError, AttributeError) as e:
+            # Keep the file for a human to look at rather than saving over it
+            logger.error("Moo memory store: can't load %s, starting empty (kept as .bad): %s",
+                         self.path, e)
+            os.replace(self.path, f"{self.path}.bad")
+            return
+        with self._lock:
+            for scope, nick, count in rows:
+                self._set(scope, nick, count)
+            self._totals = totals
+        logger.info("Moo memory store: %d rows loaded from %s in %.2fs",
+                    sum(map(len, self._counts.values())), self.path, _perf() - start)
+
+    def save(self):
+        """Write everything to disk if anything changed; returns True if it did."""
+        if not self.path:
+            return False
+        with self._lock:
+            if not self._changes:
+                return False
+            data = {
+                "version": 1,
+                "counts": {scope: dict(counts) for scope, counts in self._counts.items()},
+                "totals": dict(self._totals),
+            }
+            self._changes = 0
+        # Written outside the lock; the copy above is all moos can wait for
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        except Exception:
+            with self._lock:
+                self._changes += 1   # try again next time
+            raise
+        return True
+
+    def close(self):
+        self.save()
+
+    # Counts
+    def get(self, nick, channel=None):
+        with self._lock:
+            return self._counts.get(channel or GLOBAL_SCOPE, {}).get(nick, 0)
+
+    def get_many(self, nicks, channel=None):
+        with self._lock:
+            counts = self._counts.get(channel or GLOBAL_SCOPE, {})
+            return {nick: counts[nick] for nick in nicks if nick in counts}
+
+    def add(self, glob, chan, totals, hourly=None, node=None, reads=()):
+        reads = set(reads)
+        with self._lock:
+            for scope, v in totals.items():
+                if v:
+                    self._totals[scope] = self._totals.get(scope, 0) + v
+            g_new = {}
+            global_counts = self._counts.get(GLOBAL_SCOPE, {})
+            for nick, v in glob.items():
+                g_new[nick] = new = global_counts.get(nick, 0) + v
+                self._set(GLOBAL_SCOPE, nick, new)
+            c_new = {}
+            for (nick, channel), v in chan.items():
+                new = self._counts.get(channel, {}).get(nick, 0) + v
+                self._set(channel, nick, new)
+                if (nick, channel) in reads:
+                    c_new[nick, channel] = new
+            self._changes += 1
+        return g_new, c_new
+
+    def reset_chunks(self, nick=None, limit=RESET_CHUNK):
+        # The rows to go are listed up front, in the SQL stores' nick order
+        with self._lock:
+            if nick is None:
+                keys = sorted((n, scope) for scope, counts in self._counts.items() for n in counts)
+            else:
+                keys = [(nick, scope) for scope, counts in self._counts.items() if nick in counts]
+        for start in range(0, len(keys), limit):
+            gone = []
+            with self._lock:
+                self._changes += 1
+                for n, scope in keys[start:start + limit]:
+                    count = self._counts.get(scope, {}).get(n)
+                    if count is None:
+                        continue
+                    if scope in self._totals:
+                        self._totals[scope] -= count
+                    self._set(scope, n, None)
+                    gone.append((n, scope or None))
+            yield len(gone), gone
+        if nick is None:
+            with self._lock:
+                self._totals = {s: v for s, v in self._totals.items() if v}
+
+    # Leaderboards
+    def top(self, channel, limit):
+        return self.page(channel, None, limit)
+
+    def page(self, channel, below, limit):
+        with self._lock:
+            index = self._index.get(channel or GLOBAL_SCOPE)
+            if index is None:
+                return []
+            rows = []
+            for row in index.rows(below):
+                if len(rows) >= limit:
+                    break
+                rows.append(row)
+            return rows
+
+    def scan(self, channel):
+        with self._lock:
+            return list(self._counts.get(channel or GLOBAL_SCOPE, {}).items())
+
+    def nick_at(self, channel, count, last, skip=()):
+        with self._lock:
+            index = self._index.get(channel or GLOBAL_SCOPE)
+            nicks = index.nicks.get(count) if index else None
+            if nicks and skip:
+                nicks = [nick for nick in nicks if nick not in skip]
+            if not nicks:
+                return None
+            return max(nicks) if last else min(nicks)
+
+    # Running totals
+    def total(self, scope):
+        with self._lock:
+            return self._totals.get(scope)
+
+    def totals(self):
+        with self._lock:
+            return dict(self._totals)
+
+    def set_totals(self, fixes):
+        with self._lock:
+            self._totals.update(fixes)
+            self._changes += 1
+
+    def sum_global(self):
+        with self._lock:
+            return sum(self._counts.get(GLOBAL_SCOPE, {}).values())
+
+    def sum_channels(self, after, limit):
+        with self._lock:
+            channels = sorted(s for s in self._counts if s != GLOBAL_SCOPE and s > after)[:limit]
+            return [(c, sum(self._counts[c].values())) for c in channels]
+
+    def sum_channel(self, channel):
+        with self._lock:
+            return sum(self._counts.get(channel, {}).values())
+
+    # Bulk export / import
+    def iter_counts(self):
+        # A copy per scope, so moos can go on while the file is written
+        with self._lock:
+            rows = sorted(self._counts.get(GLOBAL_SCOPE, {}).items())
+        for nick, count in rows:
+            yield {"nick": nick, "count": count}
+        with self._lock:
+            channels = sorted(s for s in self._counts if s != GLOBAL_SCOPE)
+        for channel in channels:
+            with self._lock:
+                rows = sorted(self._counts.get(channel, {}).items())
+            for nick, count in rows:
+                yield {"nick": nick, "channel": channel, "count": count}
+
+    def load(self, g_rows, c_rows, mode):
+        rows = [(GLOBAL_SCOPE, r["n"], r["v"]) for r in g_rows]
+        rows += [(r["c"], r["n"], r["v"]) for r in c_rows]
+        with self._lock:
+            for scope, nick, count in rows:
+                if mode != "overwrite":
+                    count += self._counts.get(scope, {}).get(nick, 0)
+                self._set(scope, nick, count)
+            self._changes += 1
+
+
+STORES = {"sqlalchemy": SqlAlchemyStore, "sqlite": SqliteStore, "memory": MemoryStore}
+
+
+def _open_store(bot, backend):
+    """Build the MooStore for a backend name; raises MooConfigError if it can't be used."""
+    if backend == "auto":
+        backend = "sqlalchemy" if hasattr(bot.db, "session") else "sqlite"
+    if backend == "sqlalchemy" and not hasattr(bot.db, "session"):
+        raise MooConfigError("backend = sqlalchemy needs Sopel 7+ (bot.db.session)")
+    return STORES[backend](bot)
+
+
+def _store(bot):
+    """The store setup() opened for bot.db, or the default backend's."""
+    store = STORE
+    if store is None or store.db is not bot.db:
+        store = _open_store(bot, "auto")
+    return store
+
+
+@plugin.interval(MEMORY_SAVE_INTERVAL)
+def moo_memory_save(bot):
+    """Save the memory store to disk (memory backend only)."""
+    store = STORE
+    if not isinstance(store, MemoryStore):
+        return
+    start = _perf()
+    try:
+        if store.save():
+            METRICS.observe("moo_store_save_seconds", _perf() - start)
+    except Exception:
+        METRICS.inc("moo_errors_total", (("where", "memory_save"),))
+        logger.exception("Moo memory store save failed")
+
+
+def _fit_settings(settings, store):
+    """Turn off options the store can't honour (history and multi-writer need SQL)."""
+    if store is None or store.sql:
+        return settings
+    # Increments already land in memory: no buffer, no writer thread, no cache
+    off = {"write_behind": False, "history_days": 0, "node_id": "", "count_cache_size": 0}
+    return replace(settings, **off)
+
+
+# --------------------------------------------------------------
+# Setup DB tables
+# --------------------------------------------------------------
+def setup(bot):
+    global BOT_NICK_LOWER, SETTINGS, STORE, _CONFIG_MTIME
+    BOT_NICK_LOWER = bot.nick.lower()
+    _RESET_STOP.clear()
+    _MAINT_STOP.clear()
+
+    parser = getattr(bot.config, "parser", None)
+    if parser:
+        if not parser.has_section("moo"):
+            parser.add_section("moo")
+        if not parser.has_option("moo", "leet_moo"):
+            parser.set("moo", "leet_moo", "true")
+
+    # Invalid options fall back to their defaults here so a typo can't keep
+    # the plugin from loading; .mooreload is stricter and rejects them.
+    SETTINGS, errors = MooSettings.from_parser(parser)
+    for error in errors:
+        logger.error("Invalid [moo] option, using default: %s", error)
+    _CONFIG_MTIME = _config_mtime(_config_filename(bot))
+
+    try:
+        STORE = _open_store(bot, SETTINGS.backend)
+    except MooConfigError as e:
+        if SETTINGS.backend == "auto":
+            raise
+        logger.error("Moo backend unavailable, using the default: %s", e)
+        STORE = _open_store(bot, "auto")
+    SETTINGS = _fit_settings(SETTINGS, STORE)
+    logger.info("Moo storage backend: %s", STORE.name)
+
+    try:
+        _tune_db(bot)
+    except Exception:
+        logger.exception("Moo database tuning failed")
+
+    try:
+        _migrate(bot)
+
+        # Cooldowns and leaderboards left by the last run, if any; otherwise
+        # the global leaderboard index (channel indexes load on first use)
+        if not (SETTINGS.warm_start and _load_snapshot(bot)):
+            _load_top(bot)
+
+        if SETTINGS.history_days:
+            _rollup_history(bot)
+    except Exception:
+        logger.exception("Moo setup error")
+
+    WRITER.start(bot)
+    ANNOUNCER.start()
+
+    # Planner statistics right away, off the loading thread
+    if SETTINGS.db_maintenance:
+        threading.Thread(
+            target=_maintenance_job, args=(bot, ("optimize",)), name="moo-maintenance", daemon=True
+        ).start()
+
+
+def _migrate(bot):
+    """Bring the moo tables up to the newest version in MIGRATIONS (or load the memory store)."""
+    _store(bot).migrate()
+
+
+def shutdown(bot):
+    """Stop any reset or maintenance, make sure no buffered moos are lost, save a snapshot, then close the store."""
+    _RESET_STOP.set()
+    _MAINT_STOP.set()
+    if _RESET_THREAD is not None:
+        _RESET_THREAD.join(RESET_STOP_TIMEOUT)
+    if _MAINT_LOCK.acquire(timeout=MAINT_STOP_TIMEOUT):
+        _MAINT_LOCK.release()
+    if not WRITER.stop():
+        logger.error("Moo DB writer didn't finish in time; flushing from here")
+    if not ANNOUNCER.stop():
+        logger.error("Moo announcer didn't finish in time")
+    _flush_pending(bot)
+    if SETTINGS.warm_start:
+        try:
+            _write_snapshot(bot)
+        except Exception:
+            logger.exception("Moo snapshot failed")
+    _store(bot).close()
+
+
+# --------------------------------------------------------------
+# Count cache
+# --------------------------------------------------------------
+class CountCache:
+    """
+    Bounded LRU of stored counts: nick → global count, (nick, channel) →
+    channel count. Unflushed deltas are added on read, as for DB rows.
+
+    Every write path stores its new counts here (see _publish), and resets
+    drop them, so this process never reads a stale entry. The
+    TTL only limits how long writes by other nodes (multi-writer mode) can
+    go unseen between syncs. Size and TTL are read from SETTINGS on each
+    call, so .mooreload applies them at once.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key → (count, time stored)
+        self._keys = {}                 # nick → its keys in _entries, for forget(nick)
+        self._hits = self._misses = self._evicted = self._expired = 0
+
+    def get(self, key, now):
+        """The cached stored count for key, or None (a miss)."""
+        ttl = SETTINGS.count_cache_ttl
+        with self._lock:
+            if not SETTINGS.count_cache_size:
+                # Turned off: entries stop being refreshed, so drop them
+                self._entries.clear()
+                self._keys.clear()
+                return None
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not ttl or now - entry[1] < ttl:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return entry[0]
+                del self._entries[key]
+                self._unlink(key)
+                self._expired += 1
+            self._misses += 1
+            return None
+
+    def put(self, key, count, now):
+        """Cache a count just read from the DB, evicting the least recently used."""
+        size = SETTINGS.count_cache_size
+        with self._lock:
+            if not size:
+                return
+            if key not in self._entries:
+                self._keys.setdefault(key[0] if type(key) is tuple else key, set()).add(key)
+            self._entries[key] = (count, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > size:
+                self._unlink(self._entries.popitem(last=False)[0])
+                self._evicted += 1
+
+    def refresh(self, key, count, now):
+        """Replace a cached count after a write (keys not cached are left out)."""
+        with self._lock:
+            if key in self._entries:
+                self._entries[key] = (count, now)
+
+    def add(self, key, delta):
+        """Add a written delta to a cached count, if there is one."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (entry[0] + delta, entry[1])
+
+    def discard(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._unlink(key)
+
+    def forget(self, nick=None):
+        """Drop one nick's global and channel counts (or everything)."""
+        with self._lock:
+            if nick is None:
+                self._entries.clear()
+                self._keys.clear()
+                return
+            for key in self._keys.pop(nick, ()):
+                del self._entries[key]
+
+    def _unlink(self, key):
+        """Take a key that just left _entries out of the per-nick index."""
+        nick = key[0] if type(key) is tuple else key
+        keys = self._keys[nick]
+        keys.discard(key)
+        if not keys:
+            del self._keys[nick]
+
+    def stats(self):
+        """Hit/miss counters, for diagnostics."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "evicted": self._evicted,
+                "expired": self._expired,
+            }
+
+
+COUNT_CACHE = CountCache()
+
+
+# --------------------------------------------------------------
+# Database helpers
+# --------------------------------------------------------------
+def db_helper(bot, nick, op="get", val=0):
+    """Global moo counts (network-wide per nick)."""
+    nick = nick.strip().lower()
+    bot_nick = (BOT_NICK_LOWER or bot.nick.lower())
+
+    # Never track stats for the bot itself; treat as 0
+    if nick == bot_nick:
+        return 0
+
+    start = _perf()
+    try:
+        if op == "get":
+            # Never waits for a flush; see _read_counts
+            return _read_counts(bot, [nick])[nick]
+
+        # increment, ordered with the flushes; see _FLUSH_LOCK
+        node = [(nick, "", val)] if SETTINGS.node_id else None
+        with _FLUSH_LOCK:
+            new = _store(bot).add({nick: val}, {}, {GLOBAL_SCOPE: val}, node=node)[0][nick]
+            _publish({nick: new}, {})
+        return new
+
+    except Exception:
+        METRICS.inc("moo_errors_total", (("where", "db_global"),))
+        logger.exception("DB error (global)")
+        return -1
+    finally:
+        METRICS.observe("moo_db_seconds", _perf() - start, (("scope", "global"), ("op", op)))
+
+
+def db_helper_chan(bot, nick, channel, op="get", val=0):
+    """Per-channel moo counts per nick."""
+    nick = nick.strip().lower()
+    channel = (channel or "").strip().lower()
+    if not channel:
+        return 0  # no channel context → treat as 0 for per-channel
+
+    bot_nick = (BOT_NICK_LOWER or bot.nick.lower())
+    # Never track stats for the bot itself; treat as 0
+    if nick == bot_nick:
+        return 0
+
+    key = (nick, channel)
+    start = _perf()
+    try:
+        if op == "get":
+            # Never waits for a flush; see _read_counts
+            return _read_counts(bot, [nick], channel)[nick]
+
+        node = [(nick, channel, val)] if SETTINGS.node_id else None
+        with _FLUSH_LOCK:
+            new = _store(bot).add({}, {key: val}, {channel: val}, node=node, reads=(key,))[1][key]
+            _publish({}, {key: new})
+        return new
+
+    except Exception:
+        METRICS.inc("moo_errors_total", (("where", "db_channel"),))
+        logger.exception("DB error (channel)")
+        return -1
+    finally:
+        METRICS.observe("moo_db_seconds", _perf() - start, (("scope", "channel"), ("op", op)))
+
+
+READ_ATTEMPTS = 3   # tries for a read that a publish keeps overtaking
+
+
+def _with_unflushed(read, combine):
+    """
+    Run read() against the store without any lock, then return
+    combine(stored, settled) under _PENDING_LOCK, where the in-flight and
+    pending deltas get added, so a handler never waits for a flush.
+
+    If this process published counts meanwhile (see _publish), the read may
+    or may not include them and is tried again; after READ_ATTEMPTS tries
+    the last one is combined with settled=False. combine takes the keys in
+    flight from _INFLIGHT_BASES once their write has started, since the read
+    may land on either side of its commit.
+    """
+    for attempt in range(READ_ATTEMPTS):
+        with _PENDING_LOCK:
+            gen = _STORED_GEN
+        stored = read()
+        with _PENDING_LOCK:
+            settled = gen == _STORED_GEN
+            if settled or attempt == READ_ATTEMPTS - 1:
+                return combine(stored, settled)
+
+
+def _delta(key):
+    """In-flight plus pending delta of one count key. Call with _PENDING_LOCK held."""
+    if type(key) is tuple:
+        return _INFLIGHT_CHAN.get(key, 0) + _PENDING_CHAN.get(key, 0)
+    return _INFLIGHT_GLOBAL.get(key, 0) + _PENDING_GLOBAL.get(key, 0)
+
+
+def _unflushed(channel=None):
+    """{nick: delta} of one scope's in-flight and pending moos. Call with _PENDING_LOCK held."""
+    deltas = {}
+    if channel is None:
+        for source in (_INFLIGHT_GLOBAL, _PENDING_GLOBAL):
+            for nick, v in source.items():
+                deltas[nick] = deltas.get(nick, 0) + v
+    else:
+        for source in (_INFLIGHT_CHAN, _PENDING_CHAN):
+            for (nick, c), v in source.items():
+                if c == channel:
+                    deltas[nick] = deltas.get(nick, 0) + v
+    return deltas
+
+
+def _read_counts(bot, nicks, channel=None, then=None):
+    """
+    Stored plus unflushed counts for many normalized nicks (per-channel if
+    channel is given): {nick: count}. Cached counts are used as is; the rest
+    come from a few chunked IN queries and are cached. The bot's own nick is
+    left out. Never waits for a flush (see _with_unflushed); then, if given,
+    is called with the counts in the hold that adds the deltas, unless the
+    read couldn't be settled. Unlike db_helper, errors propagate.
+    """
+    botnick = BOT_NICK_LOWER or bot.nick.lower()
+    nicks = [n for n in dict.fromkeys(nicks) if n != botnick]
+    if channel is None:
+        inflight, keys = _INFLIGHT_GLOBAL, {n: n for n in nicks}
+    else:
+        inflight, keys = _INFLIGHT_CHAN, {n: (n, channel) for n in nicks}
+
+    def read():
+        now = _time()
+        counts, missing = {}, []
+        for nick, key in keys.items():
+            cached = COUNT_CACHE.get(key, now)
+            if cached is None:
+                missing.append(nick)
+            else:
+                counts[nick] = cached
+        if missing:
+            start = _perf()
+            found = _store(bot).get_many(missing, channel)
+            scope = "global" if channel is None else "channel"
+            METRICS.observe("moo_db_seconds", _perf() - start, (("scope", scope), ("op", "get_many")))
+            for nick in missing:
+                counts[nick] = found.get(nick, 0)
+        return counts, missing, now
+
+    def combine(stored, settled):
+        counts, missing, now = stored
+        if settled:
+            # An in-flight key may be read before or after its commit
+            for nick in missing:
+                if keys[nick] not in inflight:
+                    COUNT_CACHE.put(keys[nick], counts[nick], now)
+        counts = {nick: _INFLIGHT_BASES.get(keys[nick], count) + _delta(keys[nick])
+                  for nick, count in counts.items()}
+        if then is not None and settled:
+            then(counts)
+        return counts
+
+    return _with_unflushed(read, combine)
+
+
+def _db_increment(bot, nick, channel, val):
+    """
+    Add val to the global and (if channel is given) per-channel count in one
+    transaction. Returns (global_count, channel_count); -1 values on DB error.
+    """
+    nick = nick.strip().lower()
+    channel = (channel or "").strip().lower()
+    if nick == (BOT_NICK_LOWER or bot.nick.lower()):
+        return 0, 0
+
+    key = (nick, channel)
+    chan = {key: val} if channel else {}
+    totals = {GLOBAL_SCOPE: val, channel: val} if channel else {GLOBAL_SCOPE: val}
+    hourly = {(int(_wall()) // 3600, channel, nick): val} if SETTINGS.history_days else None
+    node = None
+    if SETTINGS.node_id:
+        node = [(nick, "", val)] + ([(nick, channel, val)] if channel else [])
+
+    # The flush lock orders the publishes the same way as the commits
+    start = _perf()
+    with _FLUSH_LOCK:
+        try:
+            g_new, c_new = _store(bot).add({nick: val}, chan, totals, hourly, node, reads=chan)
+        except Exception:
+            METRICS.inc("moo_errors_total", (("where", "db_increment"),))
+            logger.exception("DB error (increment)")
+            return -1, -1
+        finally:
+            METRICS.observe("moo_db_seconds", _perf() - start, (("scope", "both"), ("op", "inc")))
+        _publish(g_new, c_new)
+    return g_new[nick], c_new.get(key, 0)
+
+
+# --------------------------------------------------------------
+# Write-behind increment buffer
+# --------------------------------------------------------------
+def _buffer_increment(bot, nick, channel, val, ticket=None):
+    """
+    Queue a moo increment for the next flush; returns the number of pending keys.
+
+    channel may be None for increments that have no per-channel count. A
+    ticket (see DBWriter) is stamped with the epoch and the nick's pending
+    delta in the same hold, which later pins down its exact new count.
+    """
+    nick = nick.strip().lower()
+    if nick == (BOT_NICK_LOWER or bot.nick.lower()):
+        return 0
+
+    with _PENDING_LOCK:
+        _PENDING_GLOBAL[nick] = _PENDING_GLOBAL.get(nick, 0) + val
+        if ticket is not None:
+            ticket.nick = nick
+            ticket.epoch = _FLUSH_EPOCH
+            ticket.after = _PENDING_GLOBAL[nick]
+        _PENDING_TOTALS[GLOBAL_SCOPE] = _PENDING_TOTALS.get(GLOBAL_SCOPE, 0) + val
+        if channel:
+            channel = channel.strip().lower()
+            key = (nick, channel)
+            _PENDING_CHAN[key] = _PENDING_CHAN.get(key, 0) + val
+            _PENDING_TOTALS[channel] = _PENDING_TOTALS.get(channel, 0) + val
+        if SETTINGS.history_days:
+            key = (int(_wall()) // 3600, channel or "", nick)
+            _PENDING_HOURLY[key] = _PENDING_HOURLY.get(key, 0) + val
+        _top_add(nick, channel, val)
+        return len(_PENDING_GLOBAL) + len(_PENDING_CHAN)
+
+
+# pending buffer → where a flush keeps it while writing
+_BUFFERS = (
+    (_PENDING_GLOBAL, _INFLIGHT_GLOBAL),
+    (_PENDING_CHAN, _INFLIGHT_CHAN),
+    (_PENDING_TOTALS, _INFLIGHT_TOTALS),
+    (_PENDING_HOURLY, _INFLIGHT_HOURLY),
+)
+
+
+def _flush_pending(bot):
+    """
+    Write all pending deltas in a single transaction.
+
+    The deltas stay in flight (see _INFLIGHT_GLOBAL) until the new counts,
+    read back in the same transaction, are published to the count cache and
+    leaderboards, and this epoch's base counts are recorded (see
+    _FLUSH_EPOCH). On failure the deltas are merged back into the buffer so
+    no moo is lost. Returns the number of rows written.
+    """
+    global _FLUSH_EPOCH
+    with _FLUSH_LOCK:
+        with _PENDING_LOCK:
+            epoch = _FLUSH_EPOCH
+            _FLUSH_EPOCH += 1
+            if not _PENDING_GLOBAL and not _PENDING_CHAN:
+                _remember_bases(epoch, {})
+                return 0
+            glob, chan, totals, hourly = (dict(pending) for pending, _ in _BUFFERS)
+            for pending, inflight in _BUFFERS:
+                inflight.update(pending)
+                pending.clear()
+            # Channel counts are only needed for leaderboards that are loaded (or loading)
+            read_chans = _loaded_channels(c for _, c in chan)
+
+        node_rows = None
+        if SETTINGS.node_id:
+            node_rows = [(n, "", v) for n, v in glob.items()]
+            node_rows += [(n, c, v) for (n, c), v in chan.items()]
+        chan_reads = [k for k in chan if k[1] in read_chans]
+        start = _perf()
+        try:
+            bases, total_bases = _stored_bases(bot, glob, chan, totals)
+            with _PENDING_LOCK:
+                _INFLIGHT_BASES.update(bases)
+                _INFLIGHT_TOTAL_BASES.update(total_bases)
+            g_new, c_new = _store(bot).add(glob, chan, totals, hourly, node_rows, chan_reads)
+        except Exception:
+            METRICS.inc("moo_errors_total", (("where", "flush"),))
+            logger.exception("Moo flush failed; keeping %d pending deltas", len(glob) + len(chan))
+            with _PENDING_LOCK:
+                for pending, inflight in _BUFFERS:
+                    for k, v in inflight.items():
+                        pending[k] = pending.get(k, 0) + v
+                    inflight.clear()
+                _INFLIGHT_BASES.clear()
+                _INFLIGHT_TOTAL_BASES.clear()
+            return 0
+
+        METRICS.observe("moo_db_seconds", _perf() - start, (("scope", "both"), ("op", "flush")))
+        with _PENDING_LOCK:
+            for _, inflight in _BUFFERS:
+                inflight.clear()
+            _INFLIGHT_BASES.clear()
+            _INFLIGHT_TOTAL_BASES.clear()
+            _remember_bases(epoch, {n: g_new[n] - v for n, v in glob.items()})
+            for k, v in chan.items():
+                if k not in c_new:
+                    COUNT_CACHE.add(k, v)
+            _publish(g_new, c_new)
+            _forget_unread({c for _, c in chan} - read_chans)
+
+        return len(glob) + len(chan)
+
+
+def _stored_bases(bot, glob, chan, totals):
+    """
+    The stored counts and totals of the keys a flush is about to write, as
+    they are before it: (count key → count, scope → total). Counts come from
+    the count cache where it has them. Call with _FLUSH_LOCK held, so none
+    of our other writes gets in between.
+    """
+    store, now = _store(bot), _time()
+    bases, missing = {}, {}
+    for key in [*glob, *chan]:
+        cached = COUNT_CACHE.get(key, now)
+        if cached is not None:
+            bases[key] = cached
+        elif type(key) is tuple:
+            missing.setdefault(key[1], []).append(key[0])
+        else:
+            missing.setdefault(None, []).append(key)
+    for channel, nicks in missing.items():
+        found = store.get_many(nicks, channel)
+        for nick in nicks:
+            bases[nick if channel is None else (nick, channel)] = found.get(nick, 0)
+    stored = store.totals()
+    return bases, {scope: stored.get(scope, 0) for scope in totals}
+
+
+def _loaded_channels(channels):
+    """The channels among these with an index, rank tree or build. Call with _PENDING_LOCK held."""
+    with _TOP_LOCK:
+        return {c for c in channels if c in _TOP_CHAN or c in _RANK_CHAN or c in _BUILDS}
+
+
+def _forget_unread(channels):
+    """
+    Drop the indexes and rank trees of channels whose counts were written
+    but not read back, and throw away their builds: they appeared after the
+    write started, so whether they include it is unknown. Call with
+    _PENDING_LOCK held.
+    """
+    with _TOP_LOCK:
+        for channel in channels:
+            _TOP_CHAN.pop(channel, None)
+            _RANK_CHAN.pop(channel, None)
+            for journal in _BUILDS.get(channel, ()):
+                journal.stale = True
+
+
+def _publish(g_counts, c_counts):
+    """
+    Hand stored counts just written (or read back after a write) to the
+    count cache and leaderboards: g_counts is {nick: count}, c_counts
+    {(nick, channel): count}. Call with _FLUSH_LOCK held, in the hold that
+    wrote them, so publishes happen in commit order.
+    """
+    global _STORED_GEN
+    now = _time()
+    with _PENDING_LOCK:
+        _STORED_GEN += 1
+        for nick, count in g_counts.items():
+            COUNT_CACHE.refresh(nick, count, now)
+            _top_record(nick, g_count=count)
+        for (nick, channel), count in c_counts.items():
+            COUNT_CACHE.refresh((nick, channel), count, now)
+            _top_record(nick, channel, c_count=count)
+
+
+def _remember_bases(epoch, bases):
+    with _PENDING_LOCK:
+        _FLUSH_BASES[epoch] = bases
+        while len(_FLUSH_BASES) > FLUSH_BASES_KEEP:
+            del _FLUSH_BASES[min(_FLUSH_BASES)]
+
+
+@plugin.interval(WRITE_BEHIND_INTERVAL)
+def moo_flush(bot):
+    """Periodically write buffered moo increments (the writer thread does it while it runs)."""
+    if not WRITER.running:
+        _flush_pending(bot)
+
+
+# --------------------------------------------------------------
+# DB writer thread
+# --------------------------------------------------------------
+# Handler threads only touch memory: the increment goes into the pending
+# buffer (so reads see it at once) and a ticket goes onto a bounded queue.
+# One writer thread flushes the buffer in a single transaction per batch of
+# tickets, so a locked database stalls the writer, not the IRC handlers.
+WRITER_CARRY_WAIT = 0.05   # seconds to wait for more tickets while some are unresolved
+
+
+class _WriteTicket:
+    __slots__ = ("nick", "epoch", "after", "future")
+
+    def __init__(self):
+        self.nick = None
+        self.epoch = None    # set by _buffer_increment
+        self.after = 0
+        self.future = Future()
+
+
+_WRITER_STOP = object()
+
+
+class DBWriter:
+    """
+    The one thread that writes moo counts.
+
+    submit() returns a Future of the moo's exact new global count (None if
+    it can't be known, e.g. after a failed flush or a reset). When the queue
+    is full, writer_backpressure decides: block (wait for room), drop (the
+    moo isn't counted) or spill (it's counted, but gets no future).
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue(SETTINGS.writer_queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._bot = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, bot):
+        with self._lock:
+            self._bot = bot
+            if not self.running:
+                self._thread = threading.Thread(target=self._run, name="moo-db-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=10):
+        """Write and resolve everything queued so far, then end the thread."""
+        with self._lock:
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                return True
+            self._queue.put(_WRITER_STOP)
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    def submit(self, bot, nick, channel, val):
+        """Count a moo; returns a Future of its new global count, or None."""
+        settings = SETTINGS
+        if not self.running:
+            # No writer (not set up, or shutting down): buffer for moo_flush
+            _buffer_increment(bot, nick, channel, val)
+            return None
+
+        if self._queue.maxsize != settings.writer_queue_size:
+            self._queue.maxsize = settings.writer_queue_size   # picked up on reload
+        ticket = _WriteTicket()
+        if settings.writer_backpressure == "block":
+            self._queue.put(ticket)
+        else:
+            try:
+                self._queue.put_nowait(ticket)
+            except queue.Full:
+                result = "dropped" if settings.writer_backpressure == "drop" else "spilled"
+                METRICS.inc("moo_writes_total", (("result", result),))
+                if result == "spilled":
+                    _buffer_increment(bot, nick, channel, val)
+                return None
+
+        METRICS.inc("moo_writes_total", (("result", "queued"),))
+        _buffer_increment(bot, nick, channel, val, ticket)
+        if ticket.epoch is None:
+            ticket.future.set_result(None)   # not counted (the bot's own nick)
+        return ticket.future
+
+    def _run(self):
+        carry = []
+        while True:
+            try:
+                batch = [self._queue.get(timeout=WRITER_CARRY_WAIT if carry else WRITE_BEHIND_INTERVAL)]
+            except queue.Empty:
+                batch = []
+            limit = SETTINGS.write_behind_max
+            while len(batch) < limit:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopping = _WRITER_STOP in batch
+            tickets = carry + [t for t in batch if t is not _WRITER_STOP]
+            try:
+                _flush_pending(self._bot)
+            except Exception:
+                logger.exception("Moo writer flush failed")
+            carry = self._resolve(tickets)
+
+            if stopping:
+                for ticket in carry:
+                    if not ticket.future.done():
+                        ticket.future.set_result(None)
+                return
+
+    @staticmethod
+    def _resolve(tickets):
+        """Resolve tickets whose epoch has been flushed; returns the rest."""
+        carry, done = [], []
+        with _PENDING_LOCK:
+            for ticket in tickets:
+                if ticket.future.done():
+                    continue
+                if ticket.epoch is None or ticket.epoch >= _FLUSH_EPOCH:
+                    carry.append(ticket)
+                    continue
+                bases = _FLUSH_BASES.get(ticket.epoch)
+                base = bases.get(ticket.nick) if bases is not None else None
+                done.append((ticket, None if base is None else base + ticket.after))
+        # Callbacks run here, outside the lock
+        for ticket, count in done:
+            ticket.future.set_result(count)
+        return carry
+
+    def qsize(self):
+        return self._queue.qsize()
+
+
+WRITER = DBWriter()
+
+
+# --------------------------------------------------------------
+# In-memory leaderboard index
+# --------------------------------------------------------------
+class _TopIndex:
+    """
+    The best (nick, count) entries of one leaderboard scope.
+
+    Entries are kept sorted by (-count, nick) — the same order as the SQL
+    leaderboards — and are always exactly the top len(entries) of the scope
+    (or the whole scope while `complete`), save for the nicks in `unsure`:
+    ones outside the index that have mooed since, whose counts are unknown
+    until looked up (_settle) or written. An update that can't keep that
+    promise drops the nick instead, so the index only shrinks until reloaded.
+    """
+
+    def __init__(self, rows, keep):
+        self.keep = keep
+        self.complete = len(rows) < keep
+        self.keys = sorted((-c, n) for n, c in rows)[:keep]
+        self.counts = {n: -c for c, n in self.keys}
+        self.unsure = set()
+
+    def add(self, nick, delta):
+        """Add delta to a nick's count, which the index may not know."""
+        old = self.counts.get(nick)
+        if old is not None or self.complete:
+            self.set(nick, (old or 0) + delta)
+        elif delta > 0:
+            self.unsure.add(nick)
+
+    def set(self, nick, count):
+        self.unsure.discard(nick)
+        old = self.counts.pop(nick, None)
+        if old is not None:
+            del self.keys[bisect_left(self.keys, (-old, nick))]
+
+        key = (-count, nick)
+        # Every nick outside the index ranks below its last entry (and below
+        # this nick's old position), so anything ahead of those is safe.
+        if not (
+            self.complete
+            or (old is not None and count >= old)
+            or (self.keys and key < self.keys[-1])
+        ):
+            return
+
+        insort(self.keys, key)
+        self.counts[nick] = count
+        if len(self.keys) > self.keep:
+            _, dropped = self.keys.pop()
+            del self.counts[dropped]
+            self.complete = False
+
+    def remove(self, nick):
+        self.unsure.discard(nick)
+        old = self.counts.pop(nick, None)
+        if old is not None:
+            del self.keys[bisect_left(self.keys, (-old, nick))]
+
+    def covers(self, n):
+        return self.complete or len(self.keys) >= n
+
+    def top(self, n):
+        return [(nick, -neg) for neg, nick in self.keys[:n]]
+
+
+RANK_OFFSET = 1 << 31   # counts beyond ±RANK_OFFSET share the end positions
+RANK_SIZE = 1 << 32
+
+
+class _RankTree:
+    """
+    Order statistics for one leaderboard scope: every nick's count, plus a
+    sparse Fenwick tree over counts.
+
+    Position RANK_OFFSET - count holds the number of nicks with that count,
+    so prefix sums count nicks from the top down. Only non-zero nodes are
+    stored; updates and queries visit at most 32 of them.
+    """
+
+    def __init__(self, rows):
+        self.counts = dict(rows)
+        self.tree = {}
+        for count, nicks in Counter(self.counts.values()).items():
+            self._add(self._pos(count), nicks)
+
+    def __len__(self):
+        return len(self.counts)
+
+    @staticmethod
+    def _pos(count):
+        return RANK_OFFSET - max(1 - RANK_OFFSET, min(RANK_OFFSET - 1, count))
+
+    def _add(self, i, delta):
+        tree = self.tree
+        while i < RANK_SIZE:
+            value = tree.get(i, 0) + delta
+            if value:
+                tree[i] = value
+            else:
+                tree.pop(i, None)
+            i += i & -i
+
+    def _prefix(self, i):
+        total = 0
+        while i > 0:
+            total += self.tree.get(i, 0)
+            i -= i & -i
+        return total
+
+    def add(self, nick, delta):
+        """Add delta to a nick's count (the tree has every nick's, so none is unknown)."""
+        self.set(nick, self.counts.get(nick, 0) + delta)
+
+    def set(self, nick, count):
+        old = self.counts.get(nick)
+        if old == count:
+            return
+        if old is not None:
+            self._add(self._pos(old), -1)
+        self.counts[nick] = count
+        self._add(self._pos(count), 1)
+
+    def remove(self, nick):
+        old = self.counts.pop(nick, None)
+        if old is not None:
+            self._add(self._pos(old), -1)
+
+    def above(self, count):
+        """Number of nicks with a higher count."""
+        return self._prefix(self._pos(count) - 1)
+
+    def tied(self, count):
+        """Number of nicks with exactly this count."""
+        pos = self._pos(count)
+        return self._prefix(pos) - self._prefix(pos - 1)
+
+    def count_at(self, k):
+        """Count of the k-th highest nick (1-based, k <= len(self))."""
+        pos, step = 0, RANK_SIZE >> 1
+        while step:
+            node = self.tree.get(pos + step, 0)
+            if node < k:
+                pos += step
+                k -= node
+            step >>= 1
+        return RANK_OFFSET - (pos + 1)
+
+
+class _BuildJournal:
+    """What _top_record and the resets did to one scope while it was being built."""
+    __slots__ = ("counts", "stale")
+
+    def __init__(self):
+        self.counts = {}     # nick → last stored count published, None once reset
+        self.stale = False   # everything was reset: the build is thrown away
+
+
+def _build(bot, channel, rank):
+    """
+    Build and install a scope's leaderboard index (or, if rank, its rank
+    tree) from the tables.
+
+    The read runs without any lock, so a long scan holds up neither
+    flushes nor moos. The stored counts published for the scope in the
+    meantime (absolute, see _top_record) are replayed onto the result, and
+    the unflushed deltas added, in the hold that installs it.
+    """
+    global _TOP_GLOBAL, _RANK_GLOBAL
+    botnick = BOT_NICK_LOWER or bot.nick.lower()
+    while True:
+        journal = _BuildJournal()
+        with _PENDING_LOCK, _TOP_LOCK:
+            _BUILDS.setdefault(channel, []).append(journal)
+        try:
+            start = _perf()
+            if rank:
+                built = _RankTree((n, c) for n, c in _store(bot).scan(channel) if n != botnick)
+                logger.info("Moo rank tree for %s: %d nicks in %.2fs",
+                            channel or "global", len(built), _perf() - start)
+            else:
+                rows = _store(bot).top(channel, LEADERBOARD_KEEP + 1)  # +1 in case bot is in list
+                built = _TopIndex([(n, c) for (n, c) in rows if n.lower() != botnick], LEADERBOARD_KEEP)
+        except BaseException:
+            with _TOP_LOCK:
+                _drop_journal(channel, journal)
+            raise
+
+        with _PENDING_LOCK, _TOP_LOCK:
+            _drop_journal(channel, journal)
+            if journal.stale:
+                continue
+            for nick, count in journal.counts.items():
+                if count is None:
+                    built.remove(nick)
+                else:
+                    built.set(nick, count)
+            for nick, delta in _unflushed(channel).items():
+                # The scan may have run on either side of a write's commit
+                base = _INFLIGHT_BASES.get(nick if channel is None else (nick, channel))
+                if base is not None:
+                    built.set(nick, base)
+                built.add(nick, delta)
+            if rank and channel is None:
+                _RANK_GLOBAL = built
+            elif rank:
+                _RANK_CHAN[channel] = built
+            elif channel is None:
+                _TOP_GLOBAL = built
+            else:
+                _TOP_CHAN[channel] = built
+        return built
+
+
+def _drop_journal(channel, journal):
+    """Unregister a build's journal. Call with _TOP_LOCK held."""
+    _BUILDS[channel].remove(journal)
+    if not _BUILDS[channel]:
+        del _BUILDS[channel]
+
+
+def _journal(channel, nick, count):
+    """Note a count (None: reset) for the builds of a scope. Call with _TOP_LOCK held."""
+    for journal in _BUILDS.get(channel, ()):
+        journal.counts[nick] = count
+
+
+def _load_top(bot, channel=None):
+    """(Re)build one leaderboard index from the tables and install it."""
+    return _build(bot, channel, rank=False)
+
+
+def _top_add(nick, channel, delta):
+    """Count a buffered moo in the loaded indexes and rank trees. Call with _PENDING_LOCK held."""
+    with _TOP_LOCK:
+        for index in (_TOP_GLOBAL, _RANK_GLOBAL):
+            if index is not None:
+                index.add(nick, delta)
+        if channel:
+            for index in (_TOP_CHAN.get(channel), _RANK_CHAN.get(channel)):
+                if index is not None:
+                    index.add(nick, delta)
+
+
+def _top_record(nick, channel=None, g_count=None, c_count=None):
+    """
+    Feed new stored counts into the loaded leaderboard indexes, which add
+    the unflushed deltas on top.
+
+    Called by _publish, and only with counts that were actually read
+    (negative counts are legitimate, so -1 can't flag an error here).
+    """
+    with _TOP_LOCK:
+        if g_count is not None:
+            live = g_count + _delta(nick)
+            for index in (_TOP_GLOBAL, _RANK_GLOBAL):
+                if index is not None:
+                    index.set(nick, live)
+            _journal(None, nick, g_count)
 
-# Cooldown tracking: (channel, nick) → timestamp
-LAST_MOO = {}
-LAST_SUDO = {}
+        if channel and c_count is not None:
+            live = c_count + _delta((nick, channel))
+            for index in (_TOP_CHAN.get(channel), _RANK_CHAN.get(channel)):
+                if index is not None:
+                    index.set(nick, live)
+            _journal(channel, nick, c_count)
 
 
-def _is_channel(name):
-    """Return True if this looks like a real channel name."""
-    return bool(name) and name.startswith(("#", "&", "+", "!"))
+def _top_forget():
+    """Drop every index, rank tree and cached count, after counts changed wholesale."""
+    global _TOP_GLOBAL, _RANK_GLOBAL, _STORED_GEN
+    with _PENDING_LOCK, _TOP_LOCK:
+        _STORED_GEN += 1
+        COUNT_CACHE.forget()
+        _TOP_GLOBAL = _RANK_GLOBAL = None
+        _TOP_CHAN.clear()
+        _RANK_CHAN.clear()
+        for journal in [j for journals in _BUILDS.values() for j in journals]:
+            journal.stale = True
 
 
-def _prune_cooldowns(store, max_age):
-    """Lightly prune old cooldown entries to prevent unbounded growth."""
-    now = _time()
-    to_delete = [k for k, t in store.items() if now - t > max_age]
-    for k in to_delete:
-        del store[k]
+def _reset_forget(keys):
+    """
+    Drop counts deleted by one reset chunk from the indexes and count cache;
+    moos buffered since count from zero. Call with _FLUSH_LOCK held.
+    """
+    global _STORED_GEN
+    with _PENDING_LOCK, _TOP_LOCK:
+        _STORED_GEN += 1
+        for nick, channel in keys:
+            key = nick if channel is None else (nick, channel)
+            COUNT_CACHE.discard(key)
+            if channel is None:
+                indexes = (_TOP_GLOBAL, _RANK_GLOBAL)
+            else:
+                indexes = (_TOP_CHAN.get(channel), _RANK_CHAN.get(channel))
+            delta = _delta(key)
+            for index in (i for i in indexes if i is not None):
+                if delta:
+                    index.set(nick, delta)
+                else:
+                    index.remove(nick)
+            _journal(channel, nick, None)
+
+
+def _settle(bot, index, channel):
+    """Look up the counts of nicks that mooed from outside an index (see _TopIndex)."""
+    with _TOP_LOCK:
+        unsure = list(index.unsure)
+    if not unsure:
+        return
+
+    def place(counts):
+        with _TOP_LOCK:
+            for nick, count in counts.items():
+                if nick in index.unsure:
+                    index.set(nick, count)
+
+    _read_counts(bot, unsure, channel, then=place)
+
+
+def _leaderboard(bot, channel, limit):
+    """
+    Top `limit` (nick, count) pairs for a channel, or globally if channel
+    is None. Unflushed moos are in the index already; nothing waits for a
+    flush.
+    """
+    with _TOP_LOCK:
+        index = _TOP_GLOBAL if channel is None else _TOP_CHAN.get(channel)
+        if index is not None and not index.covers(limit):
+            index = None
+    if index is None:
+        index = _load_top(bot, channel)
+    _settle(bot, index, channel)
+    with _TOP_LOCK:
+        return index.top(limit)
+
+
+def _rank_tree(bot, channel=None):
+    """
+    The rank tree for a scope, built from a full scan on first use (see
+    _build). Counts include unflushed moos.
+    """
+    with _TOP_LOCK:
+        tree = _RANK_GLOBAL if channel is None else _RANK_CHAN.get(channel)
+    if tree is not None:
+        return tree
+    return _build(bot, channel, rank=True)
+
+
+def _nick_at(bot, channel, count, last, live):
+    """
+    First (or last) nick by name among those with exactly count moos. live
+    is {nick: count} for the nicks with unflushed moos, whose stored counts
+    are out of date; the store answers for everyone else.
+    """
+    nicks = [nick for nick, c in live.items() if c == count]
+    skip = set(live)
+    skip.add(BOT_NICK_LOWER or bot.nick.lower())
+    stored = _store(bot).nick_at(channel, count, last, skip)
+    if stored is not None:
+        nicks.append(stored)
+    if not nicks:
+        return None
+    return max(nicks) if last else min(nicks)
+
+
+def _rank(bot, nick, channel=None):
+    """
+    Where a normalized nick stands in a scope, or None if it has no count.
+
+    Returns {count, rank, total, tied, above, below}: rank is 1 + the number
+    of nicks with more moos (so tied nicks share it), and above/below are the
+    (nick, count) just ahead of and behind the tie group, or None.
+    """
+    tree = _rank_tree(bot, channel)
+    with _PENDING_LOCK, _TOP_LOCK:
+        count = tree.counts.get(nick)
+        if count is None:
+            return None
+        higher, tied, total = tree.above(count), tree.tied(count), len(tree)
+        up = tree.count_at(higher) if higher else None
+        down = tree.count_at(higher + tied + 1) if higher + tied < total else None
+        live = {n: tree.counts[n] for n in _unflushed(channel) if n in tree.counts}
+    # Neighbours in leaderboard order: last name of the group ahead,
+    # first name of the group behind
+    above = (_nick_at(bot, channel, up, True, live), up) if up is not None else None
+    below = (_nick_at(bot, channel, down, False, live), down) if down is not None else None
+    return {"count": count, "rank": higher + 1, "total": total, "tied": tied,
+            "above": above, "below": below}
+
+
+def _fmt_positions(first, n):
+    last = first + n - 1
+    return f"#{first:,}" if n <= 1 else f"#{first:,}–{last:,}"
+
+
+def _split_page(args):
+    """Pull "page P" out of a list of command arguments: (page, other args)."""
+    for i, word in enumerate(args[:-1]):
+        if word.lower() == "page" and args[i + 1].isdigit():
+            return max(1, int(args[i + 1])), args[:i] + args[i + 2:]
+    return 1, args
+
+
+def _leaderboard_page(bot, channel, limit, page):
+    """
+    Entries limit*(page-1)+1 … limit*page of a leaderboard, in _leaderboard
+    order. Early pages come from the index; deeper ones start at the count
+    the rank tree puts at that position and read on with a keyset query, so
+    only the rows of one tie group are skipped, never the pages before it.
+    Nicks with unflushed moos are placed by their counts in the tree.
+    """
+    start = limit * (page - 1)
+    botnick = BOT_NICK_LOWER or bot.nick.lower()
+    with _TOP_LOCK:
+        index = _TOP_GLOBAL if channel is None else _TOP_CHAN.get(channel)
+    if index is not None:
+        _settle(bot, index, channel)
+        with _TOP_LOCK:
+            if index.covers(start + limit):
+                return index.top(start + limit)[start:]
+
+    tree = _rank_tree(bot, channel)
+    with _PENDING_LOCK, _TOP_LOCK:
+        if start >= len(tree):
+            return []
+        boundary = tree.count_at(start + 1)
+        skip = start - tree.above(boundary)
+        live = {n: tree.counts[n] for n in _unflushed(channel) if n in tree.counts}
+    # +1 for the bot, and enough to make up for the live nicks left out
+    rows = _store(bot).page(channel, boundary, skip + limit + 1 + len(live))
+    rows = [(n, c) for n, c in rows if n != botnick and n not in live]
+    rows += [(n, c) for n, c in live.items() if c <= boundary]
+    rows.sort(key=lambda row: (-row[1], row[0]))
+    return rows[skip:skip + limit]
 
 
 # --------------------------------------------------------------
-# Config reader
+# Moo history (windowed counts)
 # --------------------------------------------------------------
-def get_config(bot, option, default=None):
-    parser = getattr(bot.config, "parser", None)
-    if not parser or not parser.has_section("moo"):
-        return default
-    if not parser.has_option("moo", option):
-        return default
+HISTORY_HOURLY_KEEP = 48        # hours kept at hourly resolution before rollup
+HISTORY_ROLLUP_INTERVAL = 3600  # seconds between rollup/prune runs
 
-    val = parser.get("moo", option).strip().lower()
-    if val in ("true", "yes", "on", "1"):
-        return True
-    if val in ("false", "no", "off", "0"):
-        return False
+# Window name → (days, label). A window is whole UTC days ending today.
+WINDOWS = {
+    "day": (1, "today"),
+    "today": (1, "today"),
+    "week": (7, "last 7 days"),
+    "month": (30, "last 30 days"),
+}
+
+
+def _split_window(args):
+    """Pull a window name out of command arguments: (window or None, other args)."""
+    window, rest = None, []
+    for word in (args or "").split():
+        if window is None and word.lower() in WINDOWS:
+            window = word.lower()
+        else:
+            rest.append(word)
+    return window, rest
+
+
+def _window_params(window, now=None):
+    days = WINDOWS[window][0]
+    first_day = int(_wall() if now is None else now) // 86400 - (days - 1)
+    return {"h": first_day * 24, "d": first_day}
+
+
+def _window_unflushed(params, channel):
+    """
+    {nick: delta} of the unflushed moos within a window. Call with
+    _PENDING_LOCK held.
+
+    Windows have no stored bases (see _INFLIGHT_BASES), so a window read
+    that lands between a flush's commit and its publish counts the moos in
+    flight twice; the next read is right again.
+    """
+    deltas = {}
+    for source in (_INFLIGHT_HOURLY, _PENDING_HOURLY):
+        for (hour, chan, nick), v in source.items():
+            if hour >= params["h"] and (channel is None or chan == channel):
+                deltas[nick] = deltas.get(nick, 0) + v
+    return deltas
+
+
+def _window_top(bot, channel, limit, window):
+    """
+    Top `limit` (nick, count) pairs within a window, unflushed moos
+    included (moos buffered while the query runs show up next time).
+    """
+    params = _window_params(window)
+    if channel is None:
+        top_sql, nick_sql = SQL_WINDOW_TOP_GLOBAL, SQL_WINDOW_NICK
+    else:
+        params["c"] = channel
+        top_sql, nick_sql = SQL_WINDOW_TOP_CHAN, SQL_WINDOW_NICK_CHAN
+    store = _store(bot)
+
+    def read():
+        with _PENDING_LOCK:
+            nicks = list(_window_unflushed(params, channel))
+        # Enough rows to fill the board with the unflushed nicks left out
+        rows = store.query(top_sql, dict(params, l=limit + len(nicks)))
+        counts = dict(rows)
+        if len(rows) == limit + len(nicks):
+            for nick in nicks:
+                if nick not in counts:
+                    counts[nick] = store.query(nick_sql, dict(params, n=nick))[0][0]
+        return counts, len(rows) < limit + len(nicks)
+
+    def combine(stored, settled):
+        counts, everyone = stored
+        counts = dict(counts)
+        for nick, delta in _window_unflushed(params, channel).items():
+            if nick in counts or everyone:
+                counts[nick] = counts.get(nick, 0) + delta
+        return sorted(counts.items(), key=lambda row: (-row[1], row[0]))[:limit]
+
+    return _with_unflushed(read, combine)
+
+
+def _window_count(bot, nick, channel, window):
+    """One nick's moos within a window (per-channel if channel is given), unflushed ones included."""
+    params = _window_params(window)
+    params["n"] = nick = nick.strip().lower()
+    if channel is None:
+        sql = SQL_WINDOW_NICK
+    else:
+        params["c"] = channel
+        sql = SQL_WINDOW_NICK_CHAN
+    return _with_unflushed(
+        lambda: _store(bot).query(sql, params)[0][0],
+        lambda stored, settled: stored + _window_unflushed(params, channel).get(nick, 0),
+    )
+
+
+def _rollup_history(bot, now=None):
+    """
+    Fold hourly buckets older than HISTORY_HOURLY_KEEP (whole days only) into
+    daily buckets, and drop daily buckets past history_days. One transaction.
+    Returns the number of daily buckets written.
+    """
+    now = int(_wall() if now is None else now)
+    cut = (now // 3600 - HISTORY_HOURLY_KEEP) // 24 * 24
+    keep_from = now // 86400 - SETTINGS.history_days + 1
+
+    return _store(bot).rollup(cut, keep_from)
+
+
+@plugin.interval(HISTORY_ROLLUP_INTERVAL)
+def moo_history_rollup(bot):
+    """Roll hourly history up into days and prune it to history_days."""
+    if not SETTINGS.history_days:
+        return   # history off: leave what's stored alone
     try:
-        return int(val)
-    except ValueError:
-        return parser.get("moo", option).strip()
+        _rollup_history(bot)
+    except Exception:
+        METRICS.inc("moo_errors_total", (("where", "history_rollup"),))
+        logger.exception("Moo history rollup failed")
 
 
 # --------------------------------------------------------------
-# Setup DB tables
+# Multi-writer mode (several bot processes, one database)
 # --------------------------------------------------------------
-def setup(bot):
-    global BOT_NICK_LOWER
-    global MOO_COOLDOWN, SUDO_COOLDOWN, LEGENDARY_CHANCE
-    BOT_NICK_LOWER = bot.nick.lower()
+# Every process that shares the database sets its own node_id. The count
+# tables stay the merged view: each write adds its delta with count =
+# count + :v, so sqlite's write lock sums concurrent nodes' moos and reads
+# stay single-row or index lookups. In the same transaction the delta also
+# goes to the node's own rows in moo_node_counts (a per-node PN-counter),
+# stamped with the node's new sequence number. Other nodes read those rows
+# past the last sequence they saw and fold the merged counts into their
+# in-memory leaderboards, which otherwise only see their own writes.
+NODE_SYNC_INTERVAL = 10   # seconds between checks for other nodes' writes
 
-    parser = getattr(bot.config, "parser", None)
-    if parser:
-        if not parser.has_section("moo"):
-            parser.add_section("moo")
-        if not parser.has_option("moo", "leet_moo"):
-            parser.set("moo", "leet_moo", "true")
+_NODE_SEEN = None   # other node → (seq, resets) already folded in; None = not yet
 
-    # Load configurable settings from the config parser (if present).
-    try:
-        # Use get_config which returns int/bool when possible
-        MOO_COOLDOWN = int(get_config(bot, "moo_cooldown", MOO_COOLDOWN))
-    except Exception:
-        logger.exception("Invalid moo_cooldown in config; using default")
-        MOO_COOLDOWN = MOO_COOLDOWN
 
-    try:
-        SUDO_COOLDOWN = int(get_config(bot, "sudo_cooldown", SUDO_COOLDOWN))
-    except Exception:
-        logger.exception("Invalid sudo_cooldown in config; using default")
-        SUDO_COOLDOWN = SUDO_COOLDOWN
+def _node_reset(bot):
+    """Tell the other nodes to reload their leaderboards (after a reset or import)."""
+    _store(bot).node_reset()
+
+
+def _sync_nodes(bot):
+    """
+    Bring the leaderboard indexes and rank trees up to date with the other
+    nodes' writes. Returns the number of changed keys folded in, or -1 if
+    the indexes were reloaded instead (first sync, or another node reset
+    or imported counts).
+    """
+    global _NODE_SEEN
+    me = SETTINGS.node_id
+    with _FLUSH_LOCK:
+        store = _store(bot)
+        nodes = store.query(SQL_ALL_NODES)
+        first, _NODE_SEEN = _NODE_SEEN is None, _NODE_SEEN or {}
+        reload, changed = first, set()
+        for node, seq, resets in nodes:
+            if node == me:
+                continue
+            last_seq, last_resets = _NODE_SEEN.get(node, (0, 0))
+            if resets != last_resets:
+                reload = True
+            elif not reload and seq > last_seq:
+                # Rows changed again since are re-read next time; folding a
+                # count in twice is harmless, it's absolute
+                changed.update(store.query(SQL_NODE_CHANGES, {"o": node, "q": last_seq}))
+            _NODE_SEEN[node] = (seq, resets)
+
+        if reload:
+            _top_forget()
+            _load_top(bot)
+            METRICS.inc("moo_node_syncs_total", (("result", "reload"),))
+            return -1
+
+        # Nothing is in flight while the flush lock is held, so these are
+        # the stored counts _publish expects
+        for nick, channel in changed:
+            COUNT_CACHE.discard((nick, channel) if channel else nick)
+        nicks = list({nick for nick, _ in changed})
+        found = store.get_many(nicks, None) if nicks else {}
+        g_counts = {nick: found.get(nick, 0) for nick in nicks}
+        by_channel = {}
+        for nick, channel in changed:
+            if channel:
+                by_channel.setdefault(channel, []).append(nick)
+        with _PENDING_LOCK:
+            loaded = _loaded_channels(by_channel)
+        c_counts = {}
+        for channel in loaded:
+            found = store.get_many(by_channel[channel], channel)
+            c_counts.update(((nick, channel), found.get(nick, 0)) for nick in by_channel[channel])
+        with _PENDING_LOCK:
+            _publish(g_counts, c_counts)
+            _forget_unread(set(by_channel) - loaded)
+        METRICS.inc("moo_node_syncs_total", (("result", "changes"),))
+        METRICS.inc("moo_node_sync_keys_total", n=len(changed))
+        return len(changed)
 
+
+@plugin.interval(NODE_SYNC_INTERVAL)
+def moo_node_sync(bot):
+    """Fold other nodes' moos into the leaderboards (multi-writer mode only)."""
+    if not SETTINGS.node_id:
+        return
     try:
-        LEGENDARY_CHANCE = float(get_config(bot, "legendary_chance", LEGENDARY_CHANCE))
-    except Exception:
-        logger.exception("Invalid legendary_chance in config; using default")
-        LEGENDARY_CHANCE = LEGENDARY_CHANCE
-
-    try:
-        if hasattr(bot.db, "session"):
-            with bot.db.session() as s:
-                # Global counts per nick
-                s.execute(text("""
-                    CREATE TABLE IF NOT EXISTS moo_counts (
-                        nick TEXT PRIMARY KEY,
-                        count INTEGER DEFAULT 0
-                    )
-                """))
-
-                # Per-channel counts per nick
-                s.execute(text("""
-                    CREATE TABLE IF NOT EXISTS moo_counts_chan (
-                        nick TEXT,
-                        channel TEXT,
-                        count INTEGER DEFAULT 0,
-                        PRIMARY KEY (nick, channel)
-                    )
-                """))
-
-                s.commit()
-        else:
-            conn = bot.db.connect()
-            # Global counts per nick
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS moo_counts (
-                    nick TEXT PRIMARY KEY,
-                    count INTEGER DEFAULT 0
-                )
-            """)
-            # Per-channel counts per nick
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS moo_counts_chan (
-                    nick TEXT,
-                    channel TEXT,
-                    count INTEGER DEFAULT 0,
-                    PRIMARY KEY (nick, channel)
-                )
-            """)
-            conn.commit()
-            conn.close()
+        _sync_nodes(bot)
     except Exception:
-        logger.exception("Moo setup error")
+        METRICS.inc("moo_errors_total", (("where", "node_sync"),))
+        logger.exception("Moo node sync failed")
 
 
 # --------------------------------------------------------------
-# Database helpers
+# Warm-start snapshot
 # --------------------------------------------------------------
-def db_helper(bot, nick, op="get", val=0):
-    """Global moo counts (network-wide per nick)."""
-    nick = nick.strip().lower()
-    bot_nick = (BOT_NICK_LOWER or bot.nick.lower())
+# Written on shutdown and every SNAPSHOT_INTERVAL seconds to
+# <homedir>/<config name>.moo-snapshot.json. Cooldown deadlines are stored
+# as wall-clock times (the monotonic clock restarts with the process), so a
+# restart no longer hands out a fresh sudo moo. Leaderboard indexes are
+# stored with the running totals they were taken at and only reinstalled if
+# the database still has exactly those totals; otherwise they're rebuilt.
+SNAPSHOT_INTERVAL = 300   # seconds between periodic snapshots
+SNAPSHOT_VERSION = 1
 
-    # Never track stats for the bot itself; treat as 0
-    if nick == bot_nick:
-        return 0
 
-    try:
-        if hasattr(bot.db, "session"):
-            with bot.db.session() as s:
-                if op == "get":
-                    row = s.execute(
-                        text("SELECT count FROM moo_counts WHERE nick = :n"),
-                        {"n": nick}
-                    ).fetchone()
-                    return row[0] if row else 0
-
-                # increment
-                row = s.execute(
-                    text("SELECT count FROM moo_counts WHERE nick = :n"),
-                    {"n": nick}
-                ).fetchone()
-                new = (row[0] if row else 0) + val
-
-                s.execute(
-                    text("""
-                        INSERT INTO moo_counts (nick, count)
-                        VALUES (:n, :c)
-                        ON CONFLICT(nick) DO UPDATE SET count = excluded.count
-                    """),
-                    {"n": nick, "c": new}
-                )
-                s.commit()
-                return new
-
-        # Legacy sqlite
-        else:
-            conn = bot.db.connect()
-            cur = conn.cursor()
+def _snapshot_cooldowns(store, mono, wall):
+    return [[channel, nick, round(wall + left, 3)] for (channel, nick), left in store.entries(mono)]
 
-            if op == "get":
-                cur.execute("SELECT count FROM moo_counts WHERE nick = ?", (nick,))
-                row = cur.fetchone()
-                conn.close()
-                return row[0] if row else 0
-
-            cur.execute("SELECT count FROM moo_counts WHERE nick = ?", (nick,))
-            row = cur.fetchone()
-            new = (row[0] if row else 0) + val
-            cur.execute(
-                "INSERT OR REPLACE INTO moo_counts (nick, count) VALUES (?, ?)",
-                (nick, new)
-            )
-            conn.commit()
-            conn.close()
-            return new
 
-    except Exception as e:
-        logger.exception("DB error (global)")
-        return -1
+def _write_snapshot(bot):
+    """Save cooldowns and loaded leaderboard indexes; returns the path or None."""
+    path = _state_path(bot, "moo-snapshot.json")
+    if not path:
+        return None
+    start = _perf()
+    with _FLUSH_LOCK:
+        # The indexes count pending moos too, so they're added to the
+        # totals in the hold that copies them (nothing is in flight)
+        _flush_pending(bot)
+        totals = _store(bot).totals()
+        with _PENDING_LOCK, _TOP_LOCK:
+            for scope, v in _PENDING_TOTALS.items():
+                totals[scope] = totals.get(scope, 0) + v
+            indexes = dict(_TOP_CHAN)
+            indexes[GLOBAL_SCOPE] = _TOP_GLOBAL
+            top = {
+                scope: {"complete": index.complete, "entries": index.top(len(index.keys))}
+                for scope, index in indexes.items() if index is not None and not index.unsure
+            }
+    mono, wall = _time(), _wall()
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "written": wall,
+        "totals": totals,
+        "top": top,
+        "moo": _snapshot_cooldowns(MOO_COOLDOWNS, mono, wall),
+        "sudo": _snapshot_cooldowns(SUDO_COOLDOWNS, mono, wall),
+    }
 
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+    METRICS.observe("moo_snapshot_seconds", _perf() - start, (("op", "write"),))
+    return path
 
-def db_helper_chan(bot, nick, channel, op="get", val=0):
-    """Per-channel moo counts per nick."""
-    nick = nick.strip().lower()
-    channel = (channel or "").strip().lower()
-    if not channel:
-        return 0  # no channel context → treat as 0 for per-channel
 
-    bot_nick = (BOT_NICK_LOWER or bot.nick.lower())
-    # Never track stats for the bot itself; treat as 0
-    if nick == bot_nick:
-        return 0
+def _load_snapshot(bot):
+    """
+    Restore what a snapshot holds. Returns True if the leaderboard indexes
+    were installed from it (so there's nothing to load from the DB).
 
+    A missing, unreadable or malformed snapshot is skipped with a warning.
+    """
+    path = _state_path(bot, "moo-snapshot.json")
+    if not path or not os.path.exists(path):
+        return False
+    start = _perf()
     try:
-        if hasattr(bot.db, "session"):
-            with bot.db.session() as s:
-                if op == "get":
-                    row = s.execute(
-                        text(
-                            "SELECT count FROM moo_counts_chan "
-                            "WHERE nick = :n AND channel = :c"
-                        ),
-                        {"n": nick, "c": channel}
-                    ).fetchone()
-                    return row[0] if row else 0
-
-                row = s.execute(
-                    text(
-                        "SELECT count FROM moo_counts_chan "
-                        "WHERE nick = :n AND channel = :c"
-                    ),
-                    {"n": nick, "c": channel}
-                ).fetchone()
-                new = (row[0] if row else 0) + val
-
-                s.execute(
-                    text("""
-                        INSERT INTO moo_counts_chan (nick, channel, count)
-                        VALUES (:n, :c, :v)
-                        ON CONFLICT(nick, channel) DO UPDATE SET count = excluded.count
-                    """),
-                    {"n": nick, "c": channel, "v": new}
-                )
-                s.commit()
-                return new
+        with open(path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"version {snapshot.get('version')!r}")
+        mono, wall = _time(), _wall()
+        restored = 0
+        for name, store, cooldown in (("moo", MOO_COOLDOWNS, SETTINGS.moo_cooldown),
+                                      ("sudo", SUDO_COOLDOWNS, SETTINGS.sudo_cooldown)):
+            for channel, nick, deadline in snapshot[name]:
+                # Never longer than the cooldown now configured
+                left = min(float(deadline) - wall, cooldown)
+                if left > 0:
+                    store.restore(store.key(str(channel), str(nick)), mono + left)
+                    restored += 1
 
-        else:
-            conn = bot.db.connect()
-            cur = conn.cursor()
-
-            if op == "get":
-                cur.execute(
-                    "SELECT count FROM moo_counts_chan WHERE nick = ? AND channel = ?",
-                    (nick, channel)
-                )
-                row = cur.fetchone()
-                conn.close()
-                return row[0] if row else 0
+        top = snapshot["top"]
+        totals = _store(bot).totals()
+        fresh = totals == snapshot["totals"] and GLOBAL_SCOPE in top
+        if fresh:
+            indexes = {}
+            for scope, saved in top.items():
+                index = _TopIndex([(str(n), int(c)) for n, c in saved["entries"]], LEADERBOARD_KEEP)
+                index.complete = bool(saved["complete"]) and len(index.keys) == len(saved["entries"])
+                indexes[scope] = index
+            _install_top(indexes)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning("Ignoring moo snapshot %s: %s", path, e)
+        return False
 
-            cur.execute(
-                "SELECT count FROM moo_counts_chan WHERE nick = ? AND channel = ?",
-                (nick, channel)
-            )
-            row = cur.fetchone()
-            new = (row[0] if row else 0) + val
-            cur.execute(
-                "INSERT OR REPLACE INTO moo_counts_chan (nick, channel, count) "
-                "VALUES (?, ?, ?)",
-                (nick, channel, new)
-            )
-            conn.commit()
-            conn.close()
-            return new
+    METRICS.observe("moo_snapshot_seconds", _perf() - start, (("op", "load"),))
+    logger.info("Moo snapshot loaded: %d cooldowns, leaderboards %s",
+                restored, "restored" if fresh else "stale, rebuilding")
+    return fresh
 
-    except Exception as e:
-        logger.exception("DB error (channel)")
-        return -1
+
+def _install_top(indexes):
+    """Replace the leaderboard indexes with scope → _TopIndex (GLOBAL_SCOPE = global)."""
+    global _TOP_GLOBAL
+    with _TOP_LOCK:
+        _TOP_GLOBAL = indexes.pop(GLOBAL_SCOPE)
+        _TOP_CHAN.clear()
+        _TOP_CHAN.update(indexes)
+
+
+@plugin.interval(SNAPSHOT_INTERVAL)
+def moo_snapshot(bot):
+    """Refresh the warm-start snapshot, so a crash loses little."""
+    if not SETTINGS.warm_start:
+        return
+    try:
+        _write_snapshot(bot)
+    except Exception:
+        METRICS.inc("moo_errors_total", (("where", "snapshot"),))
+        logger.exception("Moo snapshot failed")
 
 
 # --------------------------------------------------------------
@@ -388,6 +4069,87 @@ MILESTONES = {
 }
 
 
+def _announcements(nick, inc, legendary, g_count):
+    """Legendary/milestone lines for a moo that brought nick to g_count."""
+    lines = []
+    if g_count is None or g_count < 0:
+        return lines   # unknown or DB error
+    # Legendary message only for normal moo events (not sudo override)
+    if legendary:
+        lines.append(f"🌈 LEGENDARY MOO! {nick} gains +{inc} moos (🌐 total: {g_count:,})")
+    if g_count > 0 and g_count in MILESTONES:
+        lines.append(f"📈 Milestone unlocked for {nick} ({g_count:,} moos): {MILESTONES[g_count]}")
+    return lines
+
+
+def _announce(bot, nick, chan, lines):
+    for line in lines:
+        REPLIES.say(bot, chan, nick, line, important=True)
+
+
+_ANNOUNCER_STOP = object()
+
+
+class Announcer:
+    """
+    The one thread that sends legendary and milestone lines for write-behind moos.
+
+    Their counts become known on the writer thread, and bot.say may sleep
+    for flood protection, so the lines are queued here in order instead.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if not self.running:
+                self._thread = threading.Thread(target=self._run, name="moo-announcer", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=10):
+        """Send everything queued so far, then end the thread."""
+        with self._lock:
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                return True
+            self._queue.put(_ANNOUNCER_STOP)
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    def submit(self, bot, nick, chan, lines):
+        if not self.running:
+            _announce(bot, nick, chan, lines)   # not set up, or shutting down
+            return
+        self._queue.put((bot, nick, chan, lines))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _ANNOUNCER_STOP:
+                return
+            try:
+                _announce(*item)
+            except Exception:
+                logger.exception("Moo announcement failed")
+
+
+ANNOUNCER = Announcer()
+
+
+def _announce_later(bot, nick, chan, inc, legendary, g_count):
+    """Future callback (usually on the writer thread): hand any lines to the announcer."""
+    lines = _announcements(nick, inc, legendary, g_count)
+    if lines:
+        ANNOUNCER.submit(bot, nick, chan, lines)
+
+
 def _handle_moo_increment(bot, nick, chan, legendary=None, say_response=True, inc_override=None):
     """
     Shared increment logic for moo triggers.
@@ -396,59 +4158,125 @@ def _handle_moo_increment(bot, nick, chan, legendary=None, say_response=True, in
     say_response: if True, bot.say() a moo line.
     inc_override: if not None, force increment amount (e.g. sudo moo +10)
     """
-    legendary = (random.random() < LEGENDARY_CHANCE) if legendary is None else legendary
+    start = _perf()
+    legendary = (random.random() < SETTINGS.legendary_chance) if legendary is None else legendary
 
     if say_response:
         msg = random.choice(legendary_moos if legendary else moos)
-        bot.say(msg)
+        REPLIES.say(bot, chan, nick, msg)
 
     if inc_override is not None:
         inc = inc_override
     else:
         inc = 20 if legendary else 1
 
-    # Global count
-    g_count = db_helper(bot, nick, "inc", inc)
+    channel = chan if _is_channel(chan) else None
+    announce_legendary = legendary and inc_override is None
+    if SETTINGS.write_behind and WRITER.running:
+        # Counted in memory now; the writer thread resolves the new count
+        future = WRITER.submit(bot, nick, channel, inc)
+        if future is not None:
+            future.add_done_callback(
+                lambda f: _announce_later(bot, nick, chan, inc, announce_legendary, f.result())
+            )
+    elif SETTINGS.write_behind:
+        # Buffer both counts; the read below sees the pending delta, and
+        # moo_flush writes them
+        _buffer_increment(bot, nick, channel, inc)
+        key = nick.strip().lower()
+        try:
+            g_count = _read_counts(bot, [key]).get(key, 0)
+        except Exception:
+            METRICS.inc("moo_errors_total", (("where", "read_count"),))
+            logger.exception("DB error (global)")
+            g_count = -1
+        _announce(bot, nick, chan, _announcements(nick, inc, announce_legendary, g_count))
+    else:
+        # Global + per-channel count (only if in a real channel), one transaction
+        g_count, _ = _db_increment(bot, nick, channel, inc)
+        _announce(bot, nick, chan, _announcements(nick, inc, announce_legendary, g_count))
 
-    # Per-channel count (only if in a real channel)
-    if _is_channel(chan):
-        db_helper_chan(bot, nick, chan, "inc", inc)
+    METRICS.observe("moo_increment_seconds", _perf() - start)
 
-    # Legendary message only for normal moo events (not sudo override)
-    if legendary and g_count >= 0 and inc_override is None:
-        bot.say(
-            f"🌈 LEGENDARY MOO! {nick} gains +{inc} moos "
-            f"(🌐 total: {g_count:,})"
-        )
 
-    # Only announce milestones on valid (non-error) counts
-    if g_count > 0 and g_count in MILESTONES:
-        bot.say(f"📈 Milestone unlocked for {nick} ({g_count:,} moos): {MILESTONES[g_count]}")
+@plugin.interval(REPLY_FLUSH_INTERVAL)
+def moo_reply_flush(bot):
+    """Send flood summaries that were held back for lack of budget."""
+    try:
+        REPLIES.flush(bot)
+    except Exception:
+        logger.exception("Moo reply flush failed")
+
+
+# --------------------------------------------------------------
+# Moo detection (shared by the text handlers)
+# --------------------------------------------------------------
+MOO_SUDO = "sudo"
+MOO_PLAIN = "moo"
+MOO_LEET = "leet"
+
+_SUDO_LINE = re.compile(r"(?i)\s*sudo\s+moo\s*$")
+# \bm[0o]+\b, but the run of 0/o is captured by a lookahead and replayed with
+# a backreference. Lookaheads are atomic, so a failed \b never backtracks
+# through the run: each "m" costs one pass over its own run and the whole
+# scan stays linear however the line is built.
+_MOO_TOKEN = re.compile(r"(?i)\bm(?=([0o]+))\1\b")
+
+
+def classify_moo(line):
+    """
+    Classify a line in one pass: (kind, token) or (None, None).
+
+    kind is MOO_SUDO for a bare "sudo moo", MOO_PLAIN if the line holds a
+    standalone moo word (m + o's), and MOO_LEET if its only moo words
+    contain zeros (m0o, m000). token is the matched word, lowercased.
+    """
+    # Cheap prefilter: most chat lines have no "m" at all
+    if "m" not in line and "M" not in line:
+        return None, None
+
+    if _SUDO_LINE.match(line):
+        return MOO_SUDO, "moo"
+
+    leet = None
+    for match in _MOO_TOKEN.finditer(line):
+        token = match.group(0).lower()
+        if "0" not in token:
+            return MOO_PLAIN, token
+        leet = leet or token
+
+    if leet:
+        return MOO_LEET, leet
+    return None, None
 
 
 # --------------------------------------------------------------
 # Moo detector (text) — EXCLUDES "sudo moo" (incl whitespace variants)
 # --------------------------------------------------------------
-@plugin.rule(r"(?i)^(?!\s*sudo\s+moo\s*$).*?\b(m[0o]+)\b")
+# The search pattern is only a cheap gate (an "m" followed by o or 0);
+# classify_moo() does the real matching and skips "sudo moo" lines.
+@plugin.search(r"m[0o]")
+@_timed
 def moo_response(bot, trigger):
     if not trigger.nick or trigger.nick.lower() == bot.nick.lower():
         return
 
-    chan = (trigger.sender or "").lower()
-    nick = trigger.nick
-    key = (chan, nick.lower())
-
-    now = _time()
-    _prune_cooldowns(LAST_MOO, 3600)
-
-    if now - LAST_MOO.get(key, 0) < MOO_COOLDOWN:
+    kind, _ = classify_moo(str(trigger))
+    if kind not in (MOO_PLAIN, MOO_LEET):
         return
-    LAST_MOO[key] = now
 
     # Ignore zero-moo when leet_moo is OFF
-    moo_token = (trigger.group(1) or "")
-    if not get_config(bot, "leet_moo", True) and "0" in moo_token:
+    if kind == MOO_LEET and not SETTINGS.leet_moo:
+        return
+
+    chan = (trigger.sender or "").lower()
+    nick = trigger.nick
+    key = CooldownStore.key(chan, nick.lower())
+
+    if MOO_COOLDOWNS.hit(key, _time(), SETTINGS.moo_cooldown):
+        METRICS.inc("moo_cooldown_checks_total", (("kind", "moo"), ("result", "blocked")))
         return
+    METRICS.inc("moo_cooldown_checks_total", (("kind", "moo"), ("result", "allowed")))
 
     _handle_moo_increment(bot, nick, chan, legendary=None, say_response=True)
 
@@ -459,6 +4287,7 @@ def moo_response(bot, trigger):
 # Match CTCP ACTIONs like: /me moos  OR  /me moos! (allow simple punctuation)
 # Register common punctuation variants to avoid using unsupported decorators
 @plugin.action_commands("moos", "moos!", "moos?", "moos.")
+@_timed
 def moo_action(bot, trigger):
     """
     Handle /me moos (CTCP ACTION "moos") as a moo with no cooldown.
@@ -477,21 +4306,23 @@ def moo_action(bot, trigger):
 # sudo moo (1/hour per user per channel) — uses shared increment logic
 # --------------------------------------------------------------
 @plugin.rule(r"(?i)^\s*sudo\s+moo\s*$")
+@_timed
 def sudo_moo(bot, trigger):
     if not trigger.nick or trigger.nick.lower() == bot.nick.lower():
         return
 
+    if classify_moo(str(trigger))[0] != MOO_SUDO:
+        return
+
     chan = (trigger.sender or "").lower()
     nick = trigger.nick
-    key = (chan, nick.lower())
-
-    now = _time()
-    _prune_cooldowns(LAST_SUDO, 86400)
-
-    last = LAST_SUDO.get(key, 0)
+    key = CooldownStore.key(chan, nick.lower())
 
-    if now - last < SUDO_COOLDOWN:
-        remaining = int(SUDO_COOLDOWN - (now - last))
+    left = SUDO_COOLDOWNS.hit(key, _time(), SETTINGS.sudo_cooldown)
+    METRICS.inc("moo_cooldown_checks_total",
+                (("kind", "sudo"), ("result", "blocked" if left else "allowed")))
+    if left:
+        remaining = int(left)
         m = remaining // 60
         s = remaining % 60
         if m > 0:
@@ -500,8 +4331,6 @@ def sudo_moo(bot, trigger):
             bot.say(f"⏳ sudo moo cooldown for {nick}: {s}s left.")
         return
 
-    LAST_SUDO[key] = now
-
     # Outcome probabilities (exclusive ranges):
     #  - 5% chance: big win (+30 moos)
     #  - next 10%: big loss (-100 moos)
@@ -524,72 +4353,193 @@ def sudo_moo(bot, trigger):
 # .moocount / .mymoo / .moos
 # --------------------------------------------------------------
 @plugin.commands("moocount", "mymoo")
+@_timed
 def moocount(bot, trigger):
-    arg = (trigger.group(2) or "").strip()
-    target = arg or trigger.nick
-
-    global_count = db_helper(bot, target, "get")
+    window, args = _split_window(trigger.group(2))
+    target = args[0] if args else trigger.nick
 
     chan = (trigger.sender or "").lower()
     is_channel = _is_channel(chan)
+
+    if len(args) > 1:
+        _moocount_many(bot, trigger, args, chan if is_channel else None, window)
+        return
+
+    if window:
+        if not SETTINGS.history_days:
+            bot.say("🕰️ Moo history is turned off, so there are only all-time stats.")
+            return
+        try:
+            global_count = _window_count(bot, target, None, window)
+            chan_count = _window_count(bot, target, chan, window) if is_channel else 0
+        except Exception:
+            METRICS.inc("moo_errors_total", (("where", "history"),))
+            logger.exception("Moo history error")
+            bot.say("⚠️ Moo history error.")
+            return
+        suffix = f" {WINDOWS[window][1]}"
+    else:
+        global_count = db_helper(bot, target, "get")
+        chan_count = db_helper_chan(bot, target, chan, "get") if is_channel else 0
+        suffix = " total"
+
     if is_channel:
-        chan_count = db_helper_chan(bot, target, chan, "get")
         bot.say(
             f"📊 {target}: 🐄 {chan_count:,} moo"
             f"{'' if chan_count == 1 else 's'} in {chan} | "
             f"🌐 {global_count:,} moo"
-            f"{'' if global_count == 1 else 's'} total"
+            f"{'' if global_count == 1 else 's'}{suffix}"
         )
     else:
         bot.say(
             f"📊 {target} has 🌐 {global_count:,} moo"
-            f"{'' if global_count == 1 else 's'} total."
+            f"{'' if global_count == 1 else 's'}{suffix}."
         )
 
 
+def _moocount_many(bot, trigger, nicks, chan, window):
+    """.moocount a b c: everyone's counts on as few lines as fit."""
+    if window and not SETTINGS.history_days:
+        bot.say("🕰️ Moo history is turned off, so there are only all-time stats.")
+        return
+    try:
+        rows = _roster_counts(bot, nicks, chan, window)
+    except Exception:
+        METRICS.inc("moo_errors_total", (("where", "history" if window else "db_roster"),))
+        logger.exception("Moo count error")
+        bot.say("⚠️ Moo count error.")
+        return
+
+    label = WINDOWS[window][1] if window else "total"
+    head = f"📊 🐄 in {chan} / 🌐 {label}: " if chan else f"📊 🌐 {label}: "
+    _say_roster(bot, trigger, rows, chan, head, "📊 … ")
+
+
+def _roster_counts(bot, nicks, chan, window=None):
+    """
+    [(nick, channel count, global count)] for display nicks, most moos
+    first. All-time counts are read in batches (see _read_counts); window
+    counts one nick at a time. The channel count is 0 without a channel.
+    """
+    names = {}
+    for nick in nicks:
+        names.setdefault(nick.lower(), nick)
+    names.pop(BOT_NICK_LOWER or bot.nick.lower(), None)
+
+    if window:
+        glob = {n: _window_count(bot, n, None, window) for n in names}
+        here = {n: _window_count(bot, n, chan, window) for n in names} if chan else {}
+    else:
+        glob = _read_counts(bot, list(names))
+        here = _read_counts(bot, list(names), chan) if chan else {}
+    rows = [(names[n], here.get(n, 0), glob[n]) for n in names]
+    rows.sort(key=lambda r: (-r[1], -r[2], r[0].lower()))
+    return rows
+
+
+def _say_roster(bot, trigger, rows, chan, head, cont, tail=()):
+    if chan:
+        items = [f"{nick} {c:,} / {g:,}" for nick, c, g in rows]
+    else:
+        items = [f"{nick} {g:,}" for nick, _, g in rows]
+    budget = _text_budget(bot, trigger.sender)
+    for line in pack_lines(items + list(tail), budget, head=head, cont=cont):
+        bot.say(line)
+
+
+# --------------------------------------------------------------
+# .moowho (everyone in the channel)
+# --------------------------------------------------------------
+WHO_MAX_SHOWN = 40   # entries listed; the rest are summed up in one item
+
+
+def _channel_users(bot, channel):
+    """Nicks in a channel the bot is in (normalized name), or None."""
+    for name, state in (getattr(bot, "channels", None) or {}).items():
+        if str(name).lower() == channel:
+            return [str(nick) for nick in state.users]
+    return None
+
+
+@plugin.commands("moowho")
+@_timed
+def moowho(bot, trigger):
+    """Moo counts for everyone currently in the channel, most moos first."""
+    chan = ((trigger.group(2) or "").split() or [trigger.sender or ""])[0].lower()
+    if not _is_channel(chan):
+        bot.say("Usage: .moowho [#channel]")
+        return
+    users = _channel_users(bot, chan)
+    if users is None:
+        bot.say(f"👥 I'm not in {chan}.")
+        return
+
+    try:
+        rows = _roster_counts(bot, users, chan)
+    except Exception:
+        METRICS.inc("moo_errors_total", (("where", "db_roster"),))
+        logger.exception("Moo roster error")
+        bot.say("⚠️ Moo roster error.")
+        return
+
+    mooers = [r for r in rows if r[1] or r[2]]
+    if not mooers:
+        bot.say(f"👥 Nobody in {chan} has mooed yet.")
+        return
+    tail = []
+    if len(mooers) > WHO_MAX_SHOWN:
+        tail.append(f"+{len(mooers) - WHO_MAX_SHOWN:,} more")
+    if len(rows) > len(mooers):
+        tail.append(f"{len(rows) - len(mooers):,} without moos")
+    head = f"👥 {chan} (🐄 here / 🌐 total): "
+    _say_roster(bot, trigger, mooers[:WHO_MAX_SHOWN], chan, head, "👥 … ", tail)
+
+
 # --------------------------------------------------------------
 # .mootop / .topmoo (global leaderboard)
 # --------------------------------------------------------------
 @plugin.commands("mootop", "topmoo")
+@_timed
 def mootop_global(bot, trigger):
+    window, args = _split_window(trigger.group(2))
+    page, args = _split_page(args)
     try:
-        limit = int((trigger.group(2) or "10").split()[0])
-    except Exception:
+        limit = int(args[0]) if args else 10
+    except ValueError:
         limit = 10
 
-    limit = max(1, min(50, limit))
-    query_limit = limit + 1  # in case bot is in list
-
-    try:
-        if hasattr(bot.db, "session"):
-            with bot.db.session() as s:
-                rows = s.execute(
-                    text(
-                        "SELECT nick, count FROM moo_counts "
-                        "ORDER BY count DESC, nick LIMIT :l"
-                    ),
-                    {"l": query_limit}
-                ).fetchall()
+    limit = max(1, min(50, limit))
+    if window and not SETTINGS.history_days:
+        bot.say("🕰️ Moo history is turned off, so there are only all-time stats.")
+        return
+    if window and page > 1:
+        bot.say("📄 Pages are only available for all-time leaderboards.")
+        return
+
+    try:
+        if window:
+            # Summed from the hourly/daily history buckets
+            entries = _window_top(bot, None, limit, window)
+            label = WINDOWS[window][1]
+            empty, head = f"🏆 No moos {label}.", f"🏆 Global Moo Legends ({label}): "
+        elif page > 1:
+            entries = _leaderboard_page(bot, None, limit, page)
+            first = limit * (page - 1) + 1
+            empty = f"🏆 No moo legends on page {page}."
+            head = f"🏆 Global Moo Legends ({_fmt_positions(first, len(entries))}): "
         else:
-            conn = bot.db.connect()
-            cur = conn.cursor()
-            cur.execute(
-                "SELECT nick, count FROM moo_counts "
-                "ORDER BY count DESC, nick LIMIT ?",
-                (query_limit,)
-            )
-            rows = cur.fetchall()
-            conn.close()
-
-        botnick = BOT_NICK_LOWER or bot.nick.lower()
-        entries = [(n, c) for (n, c) in rows if n.lower() != botnick]
+            # Served from the in-memory index (pending moos included)
+            entries = _leaderboard(bot, None, limit)
+            empty, head = "🏆 No moo legends yet.", "🏆 Global Moo Legends: "
 
         if not entries:
-            bot.say("🏆 No moo legends yet.")
+            bot.say(empty)
             return
 
-        line = " | ".join(f"{n} == {c:,}" for (n, c) in entries[:limit])
-        bot.say(f"🏆 Global Moo Legends: {line}")
+        items = [f"{n} == {c:,}" for (n, c) in entries]
+        budget = _text_budget(bot, trigger.sender)
+        for line in pack_lines(items, budget, head=head, cont="🏆 … "):
+            bot.say(line)
 
     except Exception:
         logger.exception("Moo leaderboard error")
@@ -600,77 +4550,108 @@ def mootop_global(bot, trigger):
 # .mootopchan / .chanmootop / .topmoochan (per-channel leaderboard)
 # --------------------------------------------------------------
 @plugin.commands("mootopchan", "chanmootop", "topmoochan")
+@_timed
 def mootop_channel(bot, trigger):
     chan = (trigger.sender or "").lower()
     if not _is_channel(chan):
         bot.say("📺 Channel-only command. Try this inside a channel.")
         return
 
+    window, args = _split_window(trigger.group(2))
+    page, args = _split_page(args)
     try:
-        limit = int((trigger.group(2) or "10").split()[0])
-    except Exception:
+        limit = int(args[0]) if args else 10
+    except ValueError:
         limit = 10
 
     limit = max(1, min(50, limit))
-    query_limit = limit + 1
-
-    try:
-        if hasattr(bot.db, "session"):
-            with bot.db.session() as s:
-                rows = s.execute(
-                    text(
-                        "SELECT nick, count FROM moo_counts_chan "
-                        "WHERE channel = :c "
-                        "ORDER BY count DESC, nick LIMIT :l"
-                    ),
-                    {"c": chan, "l": query_limit}
-                ).fetchall()
-        else:
-            conn = bot.db.connect()
-            cur = conn.cursor()
-            cur.execute(
-                "SELECT nick, count FROM moo_counts_chan "
-                "WHERE channel = ? "
-                "ORDER BY count DESC, nick LIMIT ?",
-                (chan, query_limit)
-            )
-            rows = cur.fetchall()
-            conn.close()
+    if window and not SETTINGS.history_days:
+        bot.say("🕰️ Moo history is turned off, so there are only all-time stats.")
+        return
+    if window and page > 1:
+        bot.say("📄 Pages are only available for all-time leaderboards.")
+        return
 
-        botnick = BOT_NICK_LOWER or bot.nick.lower()
-        entries = [(n, c) for (n, c) in rows if n.lower() != botnick]
+    try:
+        if window:
+            entries = _window_top(bot, chan, limit, window)
+            label = WINDOWS[window][1]
+            empty, head = f"🏆 No moos in {chan} {label}.", f"🏆 Moo leaderboard in {chan} ({label}): "
+        elif page > 1:
+            entries = _leaderboard_page(bot, chan, limit, page)
+            first = limit * (page - 1) + 1
+            empty = f"🏆 No moo legends in {chan} on page {page}."
+            head = f"🏆 Moo leaderboard in {chan} ({_fmt_positions(first, len(entries))}): "
+        else:
+            entries = _leaderboard(bot, chan, limit)
+            empty, head = f"🏆 No moo legends yet in {chan}.", f"🏆 Moo leaderboard in {chan}: "
 
         if not entries:
-            bot.say(f"🏆 No moo legends yet in {chan}.")
+            bot.say(empty)
             return
 
-        line = " | ".join(f"{n} == {c:,}" for (n, c) in entries[:limit])
-        bot.say(f"🏆 Moo leaderboard in {chan}: {line}")
+        items = [f"{n} == {c:,}" for (n, c) in entries]
+        budget = _text_budget(bot, trigger.sender)
+        for line in pack_lines(items, budget, head=head, cont="🏆 … "):
+            bot.say(line)
 
     except Exception:
         logger.exception("Channel moo leaderboard error")
         bot.say("⚠️ Channel moo leaderboard error.")
 
 
+# --------------------------------------------------------------
+# .moorank (where a nick stands, and who is around it)
+# --------------------------------------------------------------
+def _fmt_rank(label, info):
+    count = info["count"]
+    text = (f"{label} #{info['rank']:,} of {info['total']:,} with {count:,} "
+            f"moo{'' if count == 1 else 's'}")
+    if info["tied"] > 1:
+        text += f" (tied with {info['tied'] - 1:,})"
+    if info["above"]:
+        text += f", ⬆️ {info['above'][0]} {info['above'][1]:,}"
+    if info["below"]:
+        text += f", ⬇️ {info['below'][0]} {info['below'][1]:,}"
+    return text
+
+
+@plugin.commands("moorank")
+@_timed
+def moorank(bot, trigger):
+    args = (trigger.group(2) or "").split()
+    target = args[0] if args else trigger.nick
+    nick = target.strip().lower()
+    chan = (trigger.sender or "").lower()
+
+    try:
+        info = _rank(bot, nick)
+        if info is None:
+            bot.say(f"🏅 {target} hasn't mooed yet.")
+            return
+        items = [_fmt_rank("🌐", info)]
+        if _is_channel(chan):
+            info = _rank(bot, nick, chan)
+            items.append(_fmt_rank(f"📺 {chan}", info) if info else f"📺 no moos in {chan} yet")
+    except Exception:
+        logger.exception("Moo rank error")
+        bot.say("⚠️ Moo rank error.")
+        return
+
+    budget = _text_budget(bot, trigger.sender)
+    for line in pack_lines(items, budget, head=f"🏅 {target}: ", cont="🏅 … "):
+        bot.say(line)
+
+
 # --------------------------------------------------------------
 # .totalmoo / .moostats
 # --------------------------------------------------------------
 @plugin.commands("totalmoo", "moostats")
+@_timed
 def totalmoo(bot, trigger):
     """Global total & optionally this-channel total (for .moostats)."""
     try:
-        if hasattr(bot.db, "session"):
-            with bot.db.session() as s:
-                total_global = s.execute(
-                    text("SELECT SUM(count) FROM moo_counts")
-                ).scalar() or 0
-        else:
-            conn = bot.db.connect()
-            cur = conn.cursor()
-            cur.execute("SELECT SUM(count) FROM moo_counts")
-            row = cur.fetchone()
-            total_global = (row[0] or 0) if row else 0
-            conn.close()
+        total_global = _read_total(bot, GLOBAL_SCOPE)
     except Exception:
         logger.exception("Failed to calculate total moos")
         bot.say("⚠️ Failed to calculate total moos.")
@@ -683,25 +4664,7 @@ def totalmoo(bot, trigger):
 
     if cmd == "moostats" and is_channel:
         try:
-            if hasattr(bot.db, "session"):
-                with bot.db.session() as s:
-                    total_chan = s.execute(
-                        text(
-                            "SELECT SUM(count) FROM moo_counts_chan "
-                            "WHERE channel = :c"
-                        ),
-                        {"c": chan}
-                    ).scalar() or 0
-            else:
-                conn = bot.db.connect()
-                cur = conn.cursor()
-                cur.execute(
-                    "SELECT SUM(count) FROM moo_counts_chan WHERE channel = ?",
-                    (chan,)
-                )
-                row = cur.fetchone()
-                total_chan = (row[0] or 0) if row else 0
-                conn.close()
+            total_chan = _read_total(bot, chan)
 
             bot.say(
                 f"📊 Moo stats — 🌐 total: {total_global:,} | "
@@ -713,104 +4676,952 @@ def totalmoo(bot, trigger):
         bot.say(f"📊 Total moos (🌐 network-wide): {total_global:,}.")
 
 
+def _read_total(bot, scope):
+    """Running total for a scope (channel or GLOBAL_SCOPE), unflushed moos included."""
+    return _with_unflushed(
+        lambda: _store(bot).total(scope) or 0,
+        lambda stored, settled: (_INFLIGHT_TOTAL_BASES.get(scope, stored)
+                                 + _INFLIGHT_TOTALS.get(scope, 0) + _PENDING_TOTALS.get(scope, 0)),
+    )
+
+
+# --------------------------------------------------------------
+# .mooreconcile (admin only)
+# --------------------------------------------------------------
+RECONCILE_CHUNK = 5000   # rows (global) or channels per query
+
+
+@plugin.commands("mooreconcile")
+@plugin.require_admin()
+@_timed
+def mooreconcile(bot, trigger):
+    """Recompute the running totals from the count tables and fix any drift."""
+    bot.say("🧮 Reconciling moo totals…")
+    try:
+        drift = _reconcile_totals(bot)
+    except Exception:
+        logger.exception("Moo reconcile failed")
+        bot.say("⚠️ Moo reconcile failed.")
+        return
+
+    if not drift:
+        bot.say("🧮 Moo totals are consistent. No drift found.")
+        return
+
+    shown = ", ".join(
+        f"{scope or 'global'} {d:+,}" for scope, d in sorted(drift.items())[:10]
+    )
+    more = f" (+{len(drift) - 10} more)" if len(drift) > 10 else ""
+    bot.say(f"🧮 Fixed moo total drift in {len(drift)} scope(s): {shown}{more}")
+
+
+def _reconcile_totals(bot):
+    """
+    Recompute every running total in chunks and store the corrected values.
+
+    Each scope is recomputed while holding the flush lock (after a flush),
+    so no increment lands between summing and storing. Returns
+    {scope: stored - actual} for the scopes that had drifted.
+    """
+    drift = {}
+    moo_store = _store(bot)
+
+    def store(actual):
+        stored = moo_store.totals()
+        fixes = {}
+        for scope, total in actual.items():
+            if stored.get(scope, 0) != total:
+                drift[scope] = stored.get(scope, 0) - total
+                fixes[scope] = total
+        if fixes:
+            moo_store.set_totals(fixes)
+
+    # Global scope: sum moo_counts by nick ranges
+    with _FLUSH_LOCK:
+        _flush_pending(bot)
+        store({GLOBAL_SCOPE: moo_store.sum_global()})
+
+    # Channel scopes, a chunk of channels at a time
+    seen, after = set(), ""
+    while True:
+        with _FLUSH_LOCK:
+            _flush_pending(bot)
+            rows = moo_store.sum_channels(after, RECONCILE_CHUNK)
+            if not rows:
+                break
+            store(dict(rows))
+        seen.update(channel for channel, _ in rows)
+        after = rows[-1][0]
+
+    # Totals left behind for channels that no longer have any rows
+    for scope in moo_store.totals():
+        if scope == GLOBAL_SCOPE or scope in seen:
+            continue
+        with _FLUSH_LOCK:
+            _flush_pending(bot)
+            store({scope: moo_store.sum_channel(scope)})
+    return drift
+
+
 # --------------------------------------------------------------
 # .mooreset (admin only)
 # --------------------------------------------------------------
+# A reset runs on its own thread, one chunk (see RESET_CHUNK) per flush-lock
+# hold, so moos keep being counted and answered while a big one works
+# through the tables. A nick's moos count from zero again once its chunk
+# is done.
+RESET_PAUSE = 0.05   # seconds between chunks
+RESET_STOP_TIMEOUT = 10   # seconds shutdown waits for the current chunk
+
+_RESET_STOP = threading.Event()   # set by shutdown() to end a running reset
+_RESET_THREAD = None
+
+
+def reset_counts(bot, target=None, progress=None):
+    """
+    Delete the counts and history of target (or everyone) in chunks.
+
+    Each chunk is written after a flush and under the flush lock, which is
+    only let go once the leaderboard indexes and count cache have dropped
+    the deleted counts; the store fixes the totals in the same transaction.
+    progress, if given, is called with the running row count after each
+    chunk. Returns the number of rows deleted, or None if shutdown stopped
+    the reset part way.
+    """
+    steps = _store(bot).reset_chunks(target.lower() if target else None)
+    deleted = 0
+    try:
+        while True:
+            with _FLUSH_LOCK:
+                _flush_pending(bot)
+                step = next(steps, None)
+                if step is not None:
+                    _reset_forget(step[1])
+            if step is None:
+                break
+            deleted += step[0]
+            METRICS.inc("moo_reset_rows_total", n=step[0])
+            if progress:
+                progress(deleted)
+            if _RESET_STOP.wait(RESET_PAUSE):
+                logger.warning("Moo reset stopped by shutdown after %d rows", deleted)
+                deleted = None
+                break
+    finally:
+        steps.close()
+        if SETTINGS.node_id:
+            _node_reset(bot)
+    return deleted
+
+
 @plugin.commands("mooreset")
 @plugin.require_admin()
+@_timed
 def mooreset(bot, trigger):
+    """Reset moo stats for one nick (or everyone) in the background."""
+    global _RESET_THREAD
     target = (trigger.group(2) or "").strip() or None
+    if not _BULK_LOCK.acquire(blocking=False):
+        bot.say("⏳ A moo export, import or reset is already running.")
+        return
+    try:
+        # Acknowledge first: a small reset can finish before this line is sent
+        bot.say(f"🧹 Resetting moo stats for {target or 'everyone'}…")
+        _RESET_THREAD = threading.Thread(target=_reset_job, args=(bot, target),
+                                         name="moo-reset", daemon=True)
+        _RESET_THREAD.start()
+    except Exception:
+        _BULK_LOCK.release()
+        raise
+
 
+def _reset_job(bot, target):
+    start = _time()
     try:
-        if hasattr(bot.db, "session"):
-            with bot.db.session() as s:
-                if target:
-                    low = target.lower()
-                    s.execute(
-                        text("DELETE FROM moo_counts WHERE nick = :n"),
-                        {"n": low}
-                    )
-                    s.execute(
-                        text("DELETE FROM moo_counts_chan WHERE nick = :n"),
-                        {"n": low}
-                    )
-                else:
-                    s.execute(text("DELETE FROM moo_counts"))
-                    s.execute(text("DELETE FROM moo_counts_chan"))
-                s.commit()
-        else:
-            conn = bot.db.connect()
-            if target:
-                low = target.lower()
-                conn.execute(
-                    "DELETE FROM moo_counts WHERE nick = ?",
-                    (low,)
-                )
-                conn.execute(
-                    "DELETE FROM moo_counts_chan WHERE nick = ?",
-                    (low,)
-                )
+        rows = reset_counts(bot, target, _bulk_progress(bot, "Reset", "🧹"))
+        if rows is None:
+            return
+        done = f"Moo stats reset for {target}" if target else "All moo stats have been reset"
+        bot.say(f"🧹 {done} ({rows:,} rows in {_time() - start:.1f}s).")
+    except Exception:
+        logger.exception("Moo reset failed")
+        bot.say("⚠️ Moo reset failed part way; run .mooreset again to finish it.")
+    finally:
+        _BULK_LOCK.release()
+
+
+# --------------------------------------------------------------
+# Bulk export / import (.mooexport, .mooimport, python moo.py …)
+# --------------------------------------------------------------
+# Dumps hold one record per count row: {"nick", "count"} for global counts,
+# plus "channel" for per-channel ones (CSV: nick,channel,count with an empty
+# channel for global rows). Rows are read in keyset pages rather than through
+# one long cursor, so an export never holds a read transaction open (which
+# would stall writers on a rollback-journal sqlite), and written in chunks of
+# one transaction each. Memory use doesn't depend on the number of rows.
+BULK_CHUNK = 5000            # rows per page (export) or transaction (import)
+BULK_PROGRESS_INTERVAL = 15  # seconds between progress messages in channel
+IMPORT_MODES = ("merge", "overwrite")
+CSV_FIELDS = ("nick", "channel", "count")
+
+_BULK_LOCK = threading.Lock()   # one export, import or reset at a time
+
+
+def _dump_format(path):
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def export_counts(bot, path, progress=None):
+    """
+    Write every global and per-channel count to path (.csv or JSONL).
+
+    The file is written next to path and renamed into place when complete.
+    progress, if given, is called with the running row count after each
+    page. Returns the number of rows written.
+    """
+    fmt = _dump_format(path)
+    tmp = f"{path}.tmp"
+    written = 0
+    _flush_pending(bot)
+    try:
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            if fmt == "csv":
+                writer = csv.DictWriter(f, CSV_FIELDS)
+                writer.writeheader()
+                write = writer.writerow
             else:
-                conn.execute("DELETE FROM moo_counts")
-                conn.execute("DELETE FROM moo_counts_chan")
-            conn.commit()
-            conn.close()
+                def write(record):
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
 
-        if target:
-            bot.say(f"🧹 Moo stats reset for {target}.")
-        else:
-            bot.say("🧹 All moo stats have been reset.")
+            for record in _store(bot).iter_counts():
+                write(record)
+                written += 1
+                if progress and written % BULK_CHUNK == 0:
+                    progress(written)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return written
+
+
+def _read_dump(f, fmt):
+    """Yield (nick, channel or '', count) per record; None for a bad one."""
+    if fmt == "csv":
+        records = csv.DictReader(f)
+    else:
+        records = (_json_record(line) for line in f if line.strip())
+
+    for record in records:
+        try:
+            nick = str(record["nick"]).strip().lower()
+            channel = str(record.get("channel") or "").strip().lower()
+            count = int(record["count"])
+        except (TypeError, KeyError, ValueError, AttributeError):
+            yield None
+            continue
+        yield (nick, channel, count) if nick else None
+
+
+def _json_record(line):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+def _import_chunk(bot, g_rows, c_rows, mode):
+    """Write one chunk of imported rows in a single transaction."""
+    # Flushed first, so in overwrite mode the file's value replaces moos
+    # counted before the import instead of having them added on top later.
+    with _FLUSH_LOCK:
+        _flush_pending(bot)
+        _store(bot).load(g_rows, c_rows, mode)
+
+
+def import_counts(bot, path, mode="merge", progress=None):
+    """
+    Load a dump written by export_counts (or by hand) into the count tables.
+
+    merge adds each row's count to the stored one; overwrite replaces it.
+    Rows not in the dump are left alone either way. Running totals and the
+    leaderboard indexes are rebuilt afterwards. progress, if given, is called
+    with the running row count after each chunk. Returns (rows, skipped).
+    """
+    if mode not in IMPORT_MODES:
+        raise ValueError(f"mode must be one of {', '.join(IMPORT_MODES)}")
+
+    imported = skipped = 0
+    g_rows, c_rows = [], []
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in _read_dump(f, _dump_format(path)):
+            if row is None:
+                skipped += 1
+                continue
+            nick, channel, count = row
+            if channel:
+                c_rows.append({"n": nick, "c": channel, "v": count})
+            else:
+                g_rows.append({"n": nick, "v": count})
+            if len(g_rows) + len(c_rows) >= BULK_CHUNK:
+                _import_chunk(bot, g_rows, c_rows, mode)
+                imported += len(g_rows) + len(c_rows)
+                g_rows, c_rows = [], []
+                if progress:
+                    progress(imported)
+    if g_rows or c_rows:
+        _import_chunk(bot, g_rows, c_rows, mode)
+        imported += len(g_rows) + len(c_rows)
+
+    _reconcile_totals(bot)
+    _top_forget()
+    _load_top(bot)
+    if SETTINGS.node_id:
+        _node_reset(bot)
+    return imported, skipped
+
+
+def _bulk_path(bot, raw):
+    """Resolve an admin-given path; relative ones are under the bot's homedir."""
+    path = os.path.expanduser(raw)
+    homedir = getattr(getattr(bot.config, "core", None), "homedir", None)
+    if homedir and not os.path.isabs(path):
+        path = os.path.join(homedir, path)
+    return path
+
+
+def _bulk_progress(bot, verb, icon="📦"):
+    """A progress callback that reports to the channel at most every so often."""
+    last = _time()
+
+    def report(rows):
+        nonlocal last
+        if _time() - last >= BULK_PROGRESS_INTERVAL:
+            last = _time()
+            bot.say(f"{icon} {verb} {rows:,} rows so far…")
+
+    return report
+
+
+@plugin.commands("mooexport")
+@plugin.require_admin()
+@_timed
+def mooexport(bot, trigger):
+    """Dump all moo counts to a .csv or .jsonl file."""
+    raw = (trigger.group(2) or "").strip()
+    if not raw:
+        bot.say("Usage: .mooexport <file.jsonl|file.csv>")
+        return
+    if not _BULK_LOCK.acquire(blocking=False):
+        bot.say("⏳ A moo export, import or reset is already running.")
+        return
+    try:
+        path = _bulk_path(bot, raw)
+        start = _time()
+        rows = export_counts(bot, path, _bulk_progress(bot, "Exported"))
+        bot.say(f"📦 Exported {rows:,} moo count rows to {path} in {_time() - start:.1f}s.")
     except Exception:
-        logger.exception("Moo reset failed")
-        bot.say("⚠️ Moo reset failed.")
+        logger.exception("Moo export failed")
+        bot.say("⚠️ Moo export failed.")
+    finally:
+        _BULK_LOCK.release()
+
+
+@plugin.commands("mooimport")
+@plugin.require_admin()
+@_timed
+def mooimport(bot, trigger):
+    """Load moo counts from a .csv or .jsonl dump (merge or overwrite)."""
+    raw = (trigger.group(2) or "").strip()
+    mode = "merge"
+    head, _, last = raw.rpartition(" ")
+    if last.lower() in IMPORT_MODES:
+        raw, mode = head.strip(), last.lower()
+    if not raw:
+        bot.say("Usage: .mooimport <file.jsonl|file.csv> [merge|overwrite]")
+        return
+    if not _BULK_LOCK.acquire(blocking=False):
+        bot.say("⏳ A moo export, import or reset is already running.")
+        return
+    try:
+        path = _bulk_path(bot, raw)
+        start = _time()
+        rows, skipped = import_counts(bot, path, mode, _bulk_progress(bot, "Imported"))
+        bad = f" Skipped {skipped:,} bad records." if skipped else ""
+        bot.say(f"📦 Imported {rows:,} moo count rows ({mode}) in {_time() - start:.1f}s.{bad}")
+    except OSError as e:
+        bot.say(f"⚠️ Can't read {e.filename or raw}: {e.strerror}")
+    except Exception:
+        logger.exception("Moo import failed")
+        bot.say("⚠️ Moo import failed.")
+    finally:
+        _BULK_LOCK.release()
+
+
+# --------------------------------------------------------------
+# .mooreload (admin only) + config file watcher
+# --------------------------------------------------------------
+@plugin.commands("mooreload")
+@plugin.require_admin()
+@_timed
+def mooreload(bot, trigger):
+    """Re-read the [moo] config section and swap in the new settings."""
+    try:
+        changed = _reload_settings(bot)
+    except MooConfigError as e:
+        bot.say(f"⚠️ Moo config not reloaded: {e}")
+        return
+    except Exception:
+        logger.exception("Moo config reload failed")
+        bot.say("⚠️ Moo config reload failed.")
+        return
+
+    if changed:
+        shown = ", ".join(f"{name}={getattr(SETTINGS, name)}" for name in changed)
+        bot.say(f"🔄 Moo settings reloaded: {shown}")
+    else:
+        bot.say("🔄 Moo settings reloaded. Nothing changed.")
+
+
+@plugin.interval(CONFIG_WATCH_INTERVAL)
+def moo_config_watch(bot):
+    """Reload the settings when the config file's mtime changes."""
+    global _CONFIG_MTIME
+    filename = _config_filename(bot)
+    mtime = _config_mtime(filename)
+    if mtime is None or mtime == _CONFIG_MTIME:
+        return
+    try:
+        _reload_settings(bot)
+    except MooConfigError as e:
+        _CONFIG_MTIME = mtime  # don't re-log the same broken file every tick
+        logger.error("Moo config change ignored: %s", e)
+    except Exception:
+        logger.exception("Moo config reload failed")
+
+
+# --------------------------------------------------------------
+# SQLite tuning + .moomaint (admin only)
+# --------------------------------------------------------------
+# sqlite_profile picks the pragmas every moo connection gets and whether the
+# database is switched to WAL, so leaderboard reads don't wait for the writer
+# thread's commits. WAL is a property of the file: it is switched on at
+# setup and retried by each maintenance run, and only sticks where sqlite
+# allows it (not for in-memory databases, not while another connection holds
+# a lock). Use safe for a database on a network filesystem, where WAL doesn't
+# work. synchronous = NORMAL is only used once WAL is on; with a rollback
+# journal it could corrupt the file on power loss.
+#
+# Maintenance runs at setup (on its own thread) and every
+# MAINTENANCE_INTERVAL: statistics for the query planner, an incremental
+# vacuum, and an integrity check once a day. Every task is timed into
+# moo_maintenance_seconds and logged. None of it holds the flush lock, except
+# .moomaint rebuild.
+SQLITE_PROFILES = {
+    # name: (switch to WAL, pragmas for every connection)
+    "off": (False, ()),
+    "safe": (False, (
+        "PRAGMA synchronous = FULL",
+        "PRAGMA cache_size = -16384",
+        "PRAGMA temp_store = MEMORY",
+    )),
+    "balanced": (True, (
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA cache_size = -16384",
+        "PRAGMA temp_store = MEMORY",
+    )),
+    "fast": (True, (
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA cache_size = -65536",
+        "PRAGMA temp_store = MEMORY",
+        "PRAGMA mmap_size = 268435456",
+    )),
+}
+SYNC_NORMAL = "PRAGMA synchronous = NORMAL"
+SYNC_FULL = "PRAGMA synchronous = FULL"
+
+MAINTENANCE_INTERVAL = 3600   # seconds between scheduled runs
+INTEGRITY_INTERVAL = 86400    # seconds between scheduled integrity checks
+ANALYSIS_LIMIT = 1000         # rows sampled per index by scheduled ANALYZE
+VACUUM_STEP = 1000            # free pages given back per incremental_vacuum
+VACUUM_MIN_FREE = 2560        # free pages before a scheduled run vacuums
+VACUUM_PAUSE = 0.05           # seconds between vacuum steps
+MAINT_STOP_TIMEOUT = 10       # seconds shutdown waits for a running task
+MAINT_TASKS = ("optimize", "analyze", "vacuum", "check", "rebuild")
+MAINT_DEFAULT = ("optimize", "vacuum", "check")
+
+# PRAGMA optimize only looks at every table (mask 0x10000) from 3.46 on
+_SQLITE_OPTIMIZE_ALL = sqlite3.sqlite_version_info >= (3, 46, 0)
+
+_WAL_ON = False      # this process saw the database in WAL mode
+_LAST_CHECK = None   # monotonic time of the last integrity check
+_MAINT_LOCK = threading.Lock()    # one maintenance run at a time
+_MAINT_STOP = threading.Event()   # set by shutdown() to end a running vacuum
+
+
+def _apply_pragmas(cur):
+    for pragma in SQLITE_PROFILES[SETTINGS.sqlite_profile][1]:
+        if pragma == SYNC_NORMAL and not _WAL_ON:
+            pragma = SYNC_FULL
+        cur.execute(pragma)
+
+
+def _tune_connection(conn):
+    """Apply the sqlite_profile pragmas to a new DB-API connection."""
+    cur = conn.cursor()
+    try:
+        _apply_pragmas(cur)
+    except sqlite3.Error as e:
+        logger.warning("Moo sqlite pragmas not applied: %s", e)
+    finally:
+        cur.close()
+
+
+def _on_checkout(dbapi_conn, record, proxy):
+    # SQLAlchemy pool event: tune each connection once per profile/WAL state
+    key = (SETTINGS.sqlite_profile, _WAL_ON)
+    if record.info.get("moo_tuned") != key:
+        _tune_connection(dbapi_conn)
+        record.info["moo_tuned"] = key
+
+
+def _pragma(cur, name):
+    return cur.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def _set_journal(cur):
+    """Switch to WAL if the profile wants it; returns the journal mode in effect."""
+    global _WAL_ON
+    mode = _pragma(cur, "journal_mode")
+    if SQLITE_PROFILES[SETTINGS.sqlite_profile][0] and mode not in ("wal", "memory"):
+        try:
+            mode = _pragma(cur, "journal_mode = WAL")
+        except sqlite3.Error as e:
+            logger.warning("Moo database not switched to WAL yet: %s", e)
+    if (mode == "wal") != _WAL_ON:
+        _WAL_ON = mode == "wal"
+        _apply_pragmas(cur)   # synchronous depends on it
+    return mode
+
+
+def _tune_db(bot):
+    """Set up per-connection pragmas and the journal mode (sqlite databases only)."""
+    if SETTINGS.sqlite_profile == "off":
+        return
+    store = _store(bot)
+    with store.sqlite_connection() as conn:
+        if conn is None:
+            return
+        cur = conn.cursor()
+        try:
+            mode = _set_journal(cur)
+        finally:
+            cur.close()
+    store.tune()
+    logger.info("Moo database: sqlite_profile %s, journal mode %s", SETTINGS.sqlite_profile, mode)
+
+
+def _maint_journal(bot, cur, scheduled):
+    return _set_journal(cur)
+
+
+def _maint_optimize(bot, cur, scheduled):
+    # Sampled statistics: a few ms even on a big database. Without the 3.46
+    # mask, PRAGMA optimize skips tables this connection hasn't queried.
+    cur.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+    if _SQLITE_OPTIMIZE_ALL:
+        cur.execute("PRAGMA optimize(0x10002)")
+        return "optimized"
+    cur.execute("ANALYZE")
+    return "analyzed (sampled)"
+
+
+def _maint_analyze(bot, cur, scheduled):
+    cur.execute("PRAGMA analysis_limit = 0")
+    cur.execute("ANALYZE")
+    return "analyzed"
+
+
+def _maint_vacuum(bot, cur, scheduled):
+    free = _pragma(cur, "freelist_count")
+    if _pragma(cur, "auto_vacuum") != 2:
+        return f"{free:,} free pages, incremental vacuum off (.moomaint rebuild turns it on)"
+    if scheduled and free < VACUUM_MIN_FREE:
+        return f"{free:,} free pages"
+    before = free
+    # One short write transaction per step, so the writer thread gets in
+    # between. executescript steps the pragma to the end; execute frees one page.
+    while free and not _MAINT_STOP.is_set():
+        cur.executescript(f"PRAGMA incremental_vacuum({VACUUM_STEP})")
+        left = _pragma(cur, "freelist_count")
+        if left >= free:
+            break
+        free = left
+        if free:
+            _MAINT_STOP.wait(VACUUM_PAUSE)
+    return f"{before - free:,} pages released, {free:,} free"
+
+
+def _maint_check(bot, cur, scheduled):
+    global _LAST_CHECK
+    # quick_check skips comparing indexes to their tables; an admin gets the full check
+    pragma = "quick_check(10)" if scheduled else "integrity_check(10)"
+    problems = [row[0] for row in cur.execute(f"PRAGMA {pragma}").fetchall()]
+    _LAST_CHECK = _time()
+    if problems == ["ok"]:
+        return "ok"
+    METRICS.inc("moo_errors_total", (("where", "integrity_check"),))
+    logger.error("Moo database integrity check failed: %s", "; ".join(problems))
+    more = f" (+{len(problems) - 1} more)" if len(problems) > 1 else ""
+    return f"FAILED: {problems[0]}{more}"
+
+
+def _maint_rebuild(bot, cur, scheduled):
+    # auto_vacuum can only change with a full VACUUM, which rewrites the file
+    # under a write lock. Moos keep buffering and reads keep being answered
+    # from the caches (the rest wait on the database); flushes wait until
+    # it's done.
+    before = _pragma(cur, "page_count")
+    with _FLUSH_LOCK:
+        _flush_pending(bot)
+        cur.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        cur.execute("VACUUM")
+    return f"rebuilt, {before:,} → {_pragma(cur, 'page_count'):,} pages"
+
+
+_MAINT_RUNNERS = {
+    "journal": _maint_journal,
+    "optimize": _maint_optimize,
+    "analyze": _maint_analyze,
+    "vacuum": _maint_vacuum,
+    "check": _maint_check,
+    "rebuild": _maint_rebuild,
+}
+
+
+def _maint_task(bot, cur, task, scheduled):
+    start = _perf()
+    try:
+        outcome = _MAINT_RUNNERS[task](bot, cur, scheduled)
+    except Exception as e:
+        METRICS.inc("moo_errors_total", (("where", f"maintenance_{task}"),))
+        logger.exception("Moo maintenance %s failed", task)
+        outcome = f"failed ({e})"
+    seconds = _perf() - start
+    METRICS.observe("moo_maintenance_seconds", seconds, (("task", task),))
+    logger.info("Moo maintenance %s: %s in %.3fs", task, outcome, seconds)
+    return task, seconds, outcome
+
+
+def run_maintenance(bot, tasks, scheduled=False):
+    """
+    Check the journal mode, then run tasks (names from MAINT_TASKS) in order
+    on one connection. Returns [(task, seconds, outcome)], journal first;
+    [] for an in-memory database, or None if the store isn't sqlite. A failed
+    task is logged and reported; the ones after it still run. Callers hold
+    _MAINT_LOCK.
+    """
+    with _store(bot).sqlite_connection() as conn:
+        if conn is None:
+            return None
+        cur = conn.cursor()
+        try:
+            if not cur.execute("PRAGMA database_list").fetchone()[2]:
+                return []   # no file: nothing to analyze, vacuum or check
+            return [_maint_task(bot, cur, task, scheduled) for task in ("journal",) + tuple(tasks)]
+        finally:
+            cur.close()
+
+
+def _maintenance_job(bot, tasks):
+    """Run scheduled tasks unless a run is already going (setup thread, interval)."""
+    if not _MAINT_LOCK.acquire(blocking=False):
+        logger.info("Moo maintenance skipped: another run is still going")
+        return
+    try:
+        run_maintenance(bot, tasks, scheduled=True)
+    except Exception:
+        METRICS.inc("moo_errors_total", (("where", "maintenance"),))
+        logger.exception("Moo maintenance failed")
+    finally:
+        _MAINT_LOCK.release()
+
+
+@plugin.interval(MAINTENANCE_INTERVAL)
+def moo_maintenance(bot):
+    """Refresh planner statistics, vacuum, and check integrity once a day."""
+    if not SETTINGS.db_maintenance:
+        return
+    tasks = ["optimize", "vacuum"]
+    if _LAST_CHECK is None or _time() - _LAST_CHECK >= INTEGRITY_INTERVAL:
+        tasks.append("check")
+    _maintenance_job(bot, tasks)
+
+
+@plugin.commands("moomaint")
+@plugin.require_admin()
+@_timed
+def moomaint(bot, trigger):
+    """Run database maintenance now: .moomaint [optimize|analyze|vacuum|check|rebuild …]."""
+    args = (trigger.group(2) or "").lower().split()
+    unknown = [a for a in args if a not in MAINT_TASKS]
+    if unknown:
+        bot.say(f"⚠️ Unknown maintenance task {unknown[0]!r}. Pick from: {', '.join(MAINT_TASKS)}.")
+        return
+    tasks = list(dict.fromkeys(args)) or list(MAINT_DEFAULT)
+
+    if not _MAINT_LOCK.acquire(blocking=False):
+        bot.say("⚠️ Moo database maintenance is already running.")
+        return
+    try:
+        if "rebuild" in tasks:
+            bot.say("🛠️ Rebuilding the moo database; counts and leaderboards wait until it's done…")
+        results = run_maintenance(bot, tasks)
+    except Exception:
+        logger.exception("Moo maintenance failed")
+        bot.say("⚠️ Moo database maintenance failed.")
+        return
+    finally:
+        _MAINT_LOCK.release()
+
+    if results is None:
+        bot.say(f"🛠️ Nothing to maintain: the {_store(bot).name} backend has no sqlite database.")
+        return
+    if not results:
+        bot.say("🛠️ Nothing to maintain: the moo database is in memory.")
+        return
+    items = [f"{task}: {outcome} ({_fmt_seconds(seconds)})" for task, seconds, outcome in results]
+    for line in pack_lines(items, _text_budget(bot, trigger.sender), head="🛠️ Moo DB ", cont="🛠️ "):
+        bot.say(line)
+
+
+# --------------------------------------------------------------
+# .moometrics (admin only) + Prometheus textfile export
+# --------------------------------------------------------------
+def _fmt_seconds(seconds):
+    if seconds == float("inf"):
+        return f">{LATENCY_BUCKETS[-1]:g}s"
+    if seconds < 0.001:
+        return f"{seconds * 1e6:.0f}µs"
+    if seconds < 1:
+        return f"{seconds * 1e3:.1f}ms"
+    return f"{seconds:.2f}s"
+
+
+def _fmt_histogram(label, hist):
+    return (f"{label} ×{hist.count:,} p50≤{_fmt_seconds(hist.quantile(0.5))} "
+            f"p99≤{_fmt_seconds(hist.quantile(0.99))}")
+
+
+@plugin.commands("moometrics")
+@plugin.require_admin()
+@_timed
+def moometrics(bot, trigger):
+    """Show call counts, latencies, cooldown and count cache hit rates, and error counts."""
+    counters = METRICS.counters()
+    histograms = METRICS.histograms()
+    gauges = _gauges()
+    stat_counters = _stat_counters()
+    budget = _text_budget(bot, trigger.sender)
+
+    handlers = [
+        _fmt_histogram(dict(labels)["handler"], hist)
+        for (name, labels), hist in sorted(histograms.items())
+        if name == "moo_handler_seconds"
+    ]
+    db = [
+        _fmt_histogram("{scope}/{op}".format(**dict(labels)), hist)
+        for (name, labels), hist in sorted(histograms.items())
+        if name == "moo_db_seconds"
+    ]
+    increment = histograms.get(("moo_increment_seconds", ()))
+    if increment:
+        db.insert(0, _fmt_histogram("increment", increment))
+
+    cooldowns = []
+    for kind in ("moo", "sudo"):
+        allowed = counters.get(("moo_cooldown_checks_total", (("kind", kind), ("result", "allowed"))), 0)
+        blocked = counters.get(("moo_cooldown_checks_total", (("kind", kind), ("result", "blocked"))), 0)
+        checks = allowed + blocked
+        rate = f"{100 * blocked / checks:.1f}%" if checks else "n/a"
+        cooldowns.append(f"{kind} {blocked:,}/{checks:,} blocked ({rate})")
+    cooldowns.extend(
+        f"{dict(labels)['kind']} entries {value:,}" for labels, value in gauges["moo_cooldown_entries"]
+    )
+
+    cache = dict((dict(labels)["kind"], value) for labels, value in stat_counters["moo_count_cache_events_total"])
+    lookups = cache["hits"] + cache["misses"]
+    rate = f"{100 * cache['hits'] / lookups:.1f}%" if lookups else "n/a"
+    cache = [
+        f"hits {cache['hits']:,}/{lookups:,} ({rate})",
+        f"entries {gauges['moo_count_cache_entries'][0][1]:,}",
+        f"evicted {cache['evicted']:,}",
+        f"expired {cache['expired']:,}",
+    ]
+
+    replies = [f"{dict(labels)['kind']} {value:,}" for labels, value in stat_counters["moo_replies_total"]]
+    replies.append(f"pending writes {gauges['moo_pending_keys'][0][1]:,}")
+
+    errors = [
+        f"{dict(labels).get('where') or dict(labels).get('handler')} {value:,}"
+        for (name, labels), value in sorted(counters.items())
+        if name == "moo_errors_total"
+    ] or ["none"]
+
+    for head, items in (
+        ("⏱️ Handlers: ", handlers or ["no calls yet"]),
+        ("🗄️ DB: ", db or ["no queries yet"]),
+        ("⏳ Cooldowns: ", cooldowns),
+        ("🗃️ Count cache: ", cache),
+        ("📨 Replies: ", replies),
+        ("⚠️ Errors: ", errors),
+    ):
+        for line in pack_lines(items, budget, head=head, cont=head):
+            bot.say(line)
+
+
+@plugin.interval(METRICS_EXPORT_INTERVAL)
+def moo_metrics_export(bot):
+    """Rewrite the Prometheus textfile, if one is configured."""
+    path = SETTINGS.metrics_file
+    if not path:
+        return
+    try:
+        _write_metrics_file(path)
+    except Exception:
+        logger.exception("Could not write moo metrics to %s", path)
 
 
 # --------------------------------------------------------------
 # moohelp / aboutmoo (PM-only)
 # --------------------------------------------------------------
+def _fmt_duration(seconds):
+    if seconds and seconds % 3600 == 0:
+        hours = seconds // 3600
+        return f"{hours} hour" + ("s" if hours != 1 else "")
+    if seconds >= 60 and seconds % 60 == 0:
+        return f"{seconds // 60} min"
+    return f"{seconds}s"
+
+
 @plugin.commands("moohelp", "aboutmoo")
+@_timed
 def moohelp(bot, trigger):
     """Send help ONLY to user privately (no channel spam)."""
     target = trigger.nick
-    leet = "ON" if get_config(bot, "leet_moo", True) else "OFF"
-
-    lines = [
-        "🐄 Moo Plugin v3.8 – Legendary Edition",
-        f"• Leet-moo: {leet}",
-        "",
-        "🔔 Automatic moo replies:",
-        "   • moo / mooo / m000 → random moo (+1) or LEGENDARY (+20)",
-        "",
-        "🎭 /me moos (CTCP ACTION):",
-        "   • Counts as a moo (+1 or LEGENDARY) with NO cooldown",
-        "",
-        "⏳ Cooldowns:",
-        f"   • moo → {MOO_COOLDOWN}s per user per channel",
-        f"   • sudo moo → {SUDO_COOLDOWN // 3600} hour per user per channel",
-        "",
-        "📊 Stats & Commands:",
-        "   • .moocount /.mymoo [nick]",
-        "       → Show moo count 🎯 in this channel + 🌐 total",
-        "   • .mootop /.topmoo [N]",
-        "       → 🏆 Top mooers (network-wide)",
-        "   • .mootopchan /.chanmootop /.topmoochan [N]",
-        "       → 🏆 Top mooers in this channel",
-        "   • .totalmoo",
-        "       → 📊 Total moos (network-wide)",
-        "   • .moostats",
-        "       → 📊 Total moos (network-wide + this channel)",
-        "   • .mooreset [nick] (admin)",
-        "       → 🧹 Reset moo stats (global + per-channel) for one user or everyone",
-        "   • .moohelp /.aboutmoo",
-        "       → This help message (PM only)",
-        "",
-        "💥 Extra:",
-        "   • sudo moo → 🐄⚡ Super Cow Powers (+10 moos), once/hour per user per channel",
-        "",
-        "Tip: Start by mooing in any channel. The herd is listening. 🐄✨",
+    settings = SETTINGS
+    leet = "ON" if settings.leet_moo else "OFF"
+
+    sections = [
+        ("🐄 Moo Plugin v3.8 – Legendary Edition:", [
+            f"Leet-moo: {leet}",
+        ]),
+        ("🔔 Automatic moo replies:", [
+            "moo / mooo / m000 → random moo (+1) or LEGENDARY (+20)",
+        ]),
+        ("🎭 /me moos (CTCP ACTION):", [
+            "Counts as a moo (+1 or LEGENDARY) with NO cooldown",
+        ]),
+        ("⏳ Cooldowns:", [
+            f"moo → {settings.moo_cooldown}s per user per channel",
+            f"sudo moo → {_fmt_duration(settings.sudo_cooldown)} per user per channel",
+        ]),
+        ("📊 Stats & Commands:", [
+            ".moocount /.mymoo [nick …] [day|week|month] → Show moo count 🎯 in this channel + 🌐 total",
+            ".moowho [#channel] → 👥 Moo counts for everyone in the channel",
+            ".mootop /.topmoo [N] [page P] [day|week|month] → 🏆 Top mooers (network-wide)",
+            ".mootopchan /.chanmootop /.topmoochan [N] [page P] [day|week|month] → 🏆 Top mooers in this channel",
+            ".moorank [nick] → 🏅 Rank (network-wide + this channel) and the mooers either side",
+            ".totalmoo → 📊 Total moos (network-wide)",
+            ".moostats → 📊 Total moos (network-wide + this channel)",
+            ".mooreset [nick] (admin) → 🧹 Reset moo stats (global + per-channel) for one user or everyone, in the background",
+            ".mooreconcile (admin) → 🧮 Recompute running totals and fix any drift",
+            ".mooexport <file> (admin) → 📦 Dump all moo counts to .jsonl or .csv",
+            ".mooimport <file> [merge|overwrite] (admin) → 📦 Load moo counts from a dump",
+            ".mooreload (admin) → 🔄 Re-read the [moo] config section",
+            ".moometrics (admin) → ⏱️ Latency, cooldown and error metrics",
+            ".moomaint [optimize|analyze|vacuum|check|rebuild] (admin) → 🛠️ Database maintenance now",
+            ".moohelp /.aboutmoo → This help message (PM only)",
+        ]),
+        ("💥 Extra:", [
+            "sudo moo → 🐄⚡ Super Cow Powers (+10 moos), once/hour per user per channel",
+        ]),
+        ("Tip:", [
+            "Start by mooing in any channel. The herd is listening. 🐄✨",
+        ]),
     ]
 
-    for line in lines:
+    # Section headings ride on their first entry; entries are never split
+    items = []
+    for heading, entries in sections:
+        items.append(f"{heading} {entries[0]}")
+        items.extend(entries[1:])
+
+    for line in pack_lines(items, _text_budget(bot, target), sep=" • "):
         bot.notice(line, target)
 
 
+# --------------------------------------------------------------
+# Command line: python moo.py export|import FILE (--db F | --config F)
+# --------------------------------------------------------------
+class _FileDB:
+    """Just enough of a Sopel 6 style DB for the legacy code path."""
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def connect(self):
+        return sqlite3.connect(self.filename)
+
+
+def _cli(argv=None):
+    global STORE
+    import argparse
+    from types import SimpleNamespace
+
+    parser = argparse.ArgumentParser(
+        prog="moo.py", description="Export or import moo counts without the bot."
+    )
+    parser.add_argument("action", choices=("export", "import"))
+    parser.add_argument("file", help="dump file; .csv for CSV, anything else is JSONL")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--db", help="the bot's sqlite database file")
+    source.add_argument("--config", help="the bot's Sopel config (uses its database)")
+    parser.add_argument("--mode", choices=IMPORT_MODES, default="merge",
+                        help="import: add to stored counts, or replace them")
+    args = parser.parse_args(argv)
+
+    if args.config:
+        from sopel.config import Config
+        from sopel.db import SopelDB
+        db = SopelDB(Config(args.config))
+    else:
+        db = _FileDB(args.db)
+    bot = SimpleNamespace(db=db, nick="", config=None)
+
+    def progress(rows):
+        print(f"{rows:,} rows…", file=sys.stderr)
+
+    # One store for the whole run, as setup() does for the bot
+    STORE = _open_store(bot, "auto")
+    try:
+        _migrate(bot)
+        start = _time()
+        if args.action == "export":
+            rows = export_counts(bot, args.file, progress)
+            print(f"Exported {rows:,} rows to {args.file} in {_time() - start:.1f}s")
+        else:
+            rows, skipped = import_counts(bot, args.file, args.mode, progress)
+            print(f"Imported {rows:,} rows ({args.mode}) in {_time() - start:.1f}s, "
+                  f"skipped {skipped:,} bad records")
+    finally:
+        STORE.close()
+        STORE = None
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_cli())
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""Fixtures shared by the moo tests: fresh plugin state and the databases to run on."""
+
+import importlib
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import moo  # noqa: E402
+from bench.fakes import FakeBot, ScratchSessionDB, PostgresSessionDB  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_moo():
+    """Every test starts from a freshly imported moo (settings, caches, STORE)."""
+    importlib.reload(moo)
+    yield moo
+    if moo.STORE is not None:
+        moo.STORE.close()
+
+
+@pytest.fixture
+def bot():
+    """A set-up bot on a fresh scratch sqlite database, shut down afterwards."""
+    bot = FakeBot(ScratchSessionDB(), moo_options={"history_days": 0})
+    moo.setup(bot)
+    yield bot
+    moo.shutdown(bot)
+
+
+@pytest.fixture
+def postgres_db():
+    """A new PostgreSQL database on the MOO_TEST_POSTGRES server, dropped afterwards."""
+    url = os.environ.get("MOO_TEST_POSTGRES")
+    if not url:
+        pytest.skip("set MOO_TEST_POSTGRES to a PostgreSQL URL to run this")
+    db = PostgresSessionDB(url)
+    yield db
+    db.drop()
+
+
+@pytest.fixture
+def migrated():
+    """migrated(db, upto): a SqlAlchemyStore on db with the migrations up to upto applied (twice)."""
+    def migrate(db, upto):
+        store = moo.SqlAlchemyStore(FakeBot(db))
+        migrations = moo.MIGRATIONS
+        moo.MIGRATIONS = [m for m in migrations if m[0] <= upto]
+        try:
+            store.migrate()
+            store.migrate()
+        finally:
+            moo.MIGRATIONS = migrations
+        assert store.query(moo.SQL_GET_SCHEMA_VERSION) == [(upto,)]
+        return store
+    return migrate
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Many threads mooing at once on both DB styles: no increment is lost, and
+every moo gets its own new count (see bench/bench_concurrency.py).
+"""
+
+import dataclasses
+import threading
+from collections import Counter, defaultdict
+
+import pytest
+
+from bench import bench_concurrency
+from bench.fakes import FakeBot
+
+import moo
+
+THREADS = 8
+MOOS = 150
+
+
+def _bot(style, **options):
+    bot = FakeBot(bench_concurrency.DB_STYLES[style](),
+                  moo_options={"db_maintenance": "false", "history_days": 0, **options})
+    moo.setup(bot)
+    return bot
+
+
+@pytest.mark.parametrize("returning", [True, False], ids=["returning", "write then read"])
+@pytest.mark.parametrize("style", sorted(bench_concurrency.DB_STYLES))
+def test_direct_increments_lose_nothing(style, returning):
+    bot = _bot(style, write_behind="false")
+    try:
+        store = moo._store(bot)
+        store.returning = store.returning and returning
+        sent, returned = bench_concurrency.hammer(bot, THREADS, MOOS)
+        assert sum(sent.values()) == THREADS * MOOS
+        assert bench_concurrency.check(store, sent, returned) == []
+    finally:
+        moo.shutdown(bot)
+
+
+@pytest.mark.parametrize("style", sorted(bench_concurrency.DB_STYLES))
+def test_write_behind_loses_nothing(style):
+    bot = _bot(style, write_behind="true")
+    moo.SETTINGS = dataclasses.replace(moo.SETTINGS, writer_backpressure="block")
+    barrier = threading.Barrier(THREADS)
+    sent = [Counter() for _ in range(THREADS)]
+    futures = [defaultdict(list) for _ in range(THREADS)]
+
+    def worker(k):
+        barrier.wait()
+        for i in range(MOOS):
+            nick = bench_concurrency.NICKS[(k + i) % len(bench_concurrency.NICKS)]
+            channel = bench_concurrency.CHANNELS[i % len(bench_concurrency.CHANNELS)]
+            futures[k][nick].append(moo.WRITER.submit(bot, nick, channel, 1))
+            sent[k][nick, channel] += 1
+
+    try:
+        workers = [threading.Thread(target=worker, args=(k,)) for k in range(THREADS)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        # Every future resolves once its moo is written
+        returned, total = defaultdict(list), Counter()
+        for part in futures:
+            for nick, pending in part.items():
+                returned[nick].extend(f.result(timeout=10) for f in pending)
+        for part in sent:
+            total.update(part)
+        assert bench_concurrency.check(moo._store(bot), total, returned) == []
+    finally:
+        moo.shutdown(bot)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""CooldownStore: deadlines, expiry-ordered pruning, the size cap and snapshot restores."""
+
+import threading
+
+import moo
+
+
+def test_a_running_cooldown_blocks_until_it_ends():
+    store = moo.CooldownStore()
+    key = moo.CooldownStore.key("#moo", "alice")
+    assert store.hit(key, 100.0, 30) == 0
+    assert store.hit(key, 110.0, 30) == 20.0
+    assert store.hit(moo.CooldownStore.key("#cows", "alice"), 110.0, 30) == 0
+    assert store.hit(key, 130.0, 30) == 0   # over: a new one starts
+    assert store.hit(key, 159.0, 30) == 1.0
+
+
+def test_keys_are_interned():
+    nick = "".join(["al", "ice"])
+    a, b = moo.CooldownStore.key("#moo", nick), moo.CooldownStore.key("#moo", "alice")
+    assert a == b and a[1] is b[1]
+
+
+def test_pruning_only_pops_expired_entries():
+    store = moo.CooldownStore(stripes=1)
+    for i in range(100):
+        store.hit(("#moo", f"n{i}"), float(i), 10)
+    stats = store.stats()
+    # Each hit pops what expired by then: n0..n89, one at a time
+    assert stats["expired"] == 90 and stats["prune_pops"] == 90
+    assert len(store) == 10
+    assert sorted(k[1] for k, _ in store.entries(99.5)) == [f"n{i}" for i in range(90, 100)]
+
+
+def test_superseded_heap_entries_are_skipped_and_compacted():
+    store = moo.CooldownStore(stripes=1)
+    key = ("#moo", "alice")
+    for i in range(500):
+        store.hit(key, float(i), 0.5)
+    stats = store.stats()
+    assert stats["entries"] == 1
+    assert stats["heap_entries"] <= 2 + 64
+    assert stats["expired"] == 499
+
+
+def test_full_stripes_evict_the_next_to_expire():
+    store = moo.CooldownStore(max_entries=3, stripes=1)
+    store.hit(("#moo", "a"), 0.0, 50)
+    store.hit(("#moo", "b"), 0.0, 10)
+    store.hit(("#moo", "c"), 0.0, 30)
+    store.hit(("#moo", "d"), 1.0, 40)
+    assert sorted(k[1] for k, _ in store.entries(1.0)) == ["a", "c", "d"]
+    assert store.stats()["evicted"] == 1
+
+
+def test_restore_keeps_the_later_deadline_and_the_cap():
+    store = moo.CooldownStore(max_entries=2, stripes=1)
+    store.hit(("#moo", "alice"), 0.0, 30)
+    store.restore(("#moo", "alice"), 10.0)
+    store.restore(("#moo", "bob"), 20.0)
+    store.restore(("#moo", "carol"), 40.0)   # full
+    assert sorted(store.entries(0.0)) == [(("#moo", "alice"), 30.0), (("#moo", "bob"), 20.0)]
+    store.restore(("#moo", "alice"), 45.0)
+    assert store.hit(("#moo", "alice"), 40.0, 30) == 5.0
+    store.clear()
+    assert len(store) == 0 and store.stats()["heap_entries"] == 0
+
+
+def test_one_winner_per_key_across_threads():
+    store = moo.CooldownStore()
+    keys = [moo.CooldownStore.key("#moo", f"n{i}") for i in range(50)]
+    barrier, wins = threading.Barrier(8), []
+
+    def worker():
+        barrier.wait()
+        wins.extend(key for key in keys for _ in range(20) if store.hit(key, 100.0, 60) == 0)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(wins) == sorted(keys)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""CountCache: LRU eviction, TTL expiry, and forgetting one nick without scanning the rest."""
+
+import dataclasses
+import random
+
+import moo
+
+
+def _settings(size=10000, ttl=300):
+    moo.SETTINGS = dataclasses.replace(moo.SETTINGS, count_cache_size=size, count_cache_ttl=ttl)
+
+
+def _by_nick(cache):
+    """The per-nick index, rebuilt from the entries the slow way."""
+    keys = {}
+    for key in cache._entries:
+        keys.setdefault(key[0] if type(key) is tuple else key, set()).add(key)
+    return keys
+
+
+def test_least_recently_used_goes_first():
+    _settings(size=2)
+    cache = moo.CountCache()
+    cache.put("alice", 5, 0)
+    cache.put("bob", 3, 0)
+    assert cache.get("alice", 1) == 5
+    cache.put(("carol", "#moo"), 1, 1)
+    assert cache.get("bob", 1) is None
+    assert cache.stats() == {"entries": 2, "hits": 1, "misses": 1, "evicted": 1, "expired": 0}
+    assert cache._keys == _by_nick(cache)
+
+
+def test_entries_expire_after_the_ttl():
+    _settings(ttl=10)
+    cache = moo.CountCache()
+    cache.put("alice", 5, 0)
+    cache.add("alice", 2)
+    cache.refresh("bob", 1, 0)   # not cached: left out
+    assert cache.get("alice", 9) == 7
+    assert cache.get("alice", 10) is None
+    assert cache.get("bob", 0) is None
+    assert cache.stats()["expired"] == 1
+    assert cache._keys == {}
+
+
+def test_forget_drops_only_that_nicks_counts():
+    _settings()
+    cache = moo.CountCache()
+    for key in ("alice", ("alice", "#moo"), ("alice", "#cows"), "bob", ("bob", "#moo"), ("carol", "alice")):
+        cache.put(key, 1, 0)
+    cache.forget("alice")
+    assert set(cache._entries) == {"bob", ("bob", "#moo"), ("carol", "alice")}
+    assert cache._keys == _by_nick(cache)
+    cache.forget("nobody")
+    cache.forget()
+    assert cache.stats()["entries"] == 0 and cache._keys == {}
+
+
+def test_turning_the_cache_off_empties_it():
+    _settings()
+    cache = moo.CountCache()
+    cache.put("alice", 1, 0)
+    _settings(size=0)
+    assert cache.get("alice", 0) is None
+    cache.put("alice", 1, 0)
+    assert cache.stats()["entries"] == 0 and cache._keys == {}
+
+
+def test_the_nick_index_follows_every_change():
+    _settings(size=20, ttl=50)
+    rng = random.Random(20)
+    cache = moo.CountCache()
+    nicks = [f"n{i}" for i in range(10)]
+    for now in range(3000):
+        nick = rng.choice(nicks)
+        key = nick if rng.random() < 0.4 else (nick, rng.choice(["#moo", "#cows", "#barn"]))
+        r = rng.random()
+        if r < 0.5:
+            cache.put(key, now, now)
+        elif r < 0.8:
+            cache.get(key, now)
+        elif r < 0.95:
+            cache.discard(key)
+        else:
+            cache.forget(nick)
+            assert not any(k == nick or (type(k) is tuple and k[0] == nick) for k in cache._entries)
+        assert cache._keys == _by_nick(cache)
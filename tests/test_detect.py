@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""classify_moo: what counts as a moo, agreement with the old rule regex, and linear time."""
+
+import random
+import re
+import time
+
+import pytest
+
+import moo
+
+# The rule moo_response used before classify_moo (see bench/bench_detect.py)
+OLD_RULE = re.compile(r"(?i)^(?!\s*sudo\s+moo\s*$).*?\b(m[0o]+)\b")
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("moo", (moo.MOO_PLAIN, "moo")),
+    ("MOOOO!", (moo.MOO_PLAIN, "moooo")),
+    ("well, mo then", (moo.MOO_PLAIN, "mo")),
+    ("cows go moo🐄", (moo.MOO_PLAIN, "moo")),
+    ("m000 and then moo", (moo.MOO_PLAIN, "moo")),
+    ("m0o", (moo.MOO_LEET, "m0o")),
+    ("M0O m00", (moo.MOO_LEET, "m0o")),
+    ("sudo moo", (moo.MOO_SUDO, "moo")),
+    ("  SUDO   Moo ", (moo.MOO_SUDO, "moo")),
+    ("sudo moo please", (moo.MOO_PLAIN, "moo")),
+    ("", (None, None)),
+    ("no cows here", (None, None)),
+    ("mooing", (None, None)),
+    ("smoo", (None, None)),
+    ("moo_cow", (None, None)),
+    ("m", (None, None)),
+])
+def test_classify(line, expected):
+    assert moo.classify_moo(line) == expected
+
+
+def test_agrees_with_the_old_rule():
+    rng = random.Random(8)
+    gate = re.compile(moo.moo_response.search_rules[0], re.IGNORECASE)
+    for _ in range(20000):
+        line = "".join(rng.choice("mMoO0 s.x") for _ in range(rng.randrange(12)))
+        kind, token = moo.classify_moo(line)
+        counted = kind in (moo.MOO_PLAIN, moo.MOO_LEET)
+        assert counted == bool(OLD_RULE.match(line)), line
+        if kind is not None:
+            assert gate.search(line), line   # Sopel calls the handler for it
+            assert token == token.lower()
+
+
+@pytest.mark.parametrize("line", [
+    ("m" + "o" * 60 + "x ") * 3000,
+    "m" + "o" * 200000 + "x",
+    "m" * 200000,
+    "x" * 200000 + " moo",
+])
+def test_adversarial_lines_take_linear_time(line):
+    start = time.perf_counter()
+    moo.classify_moo(line)
+    assert time.perf_counter() - start < 1.0
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""pack_lines and its helpers: as few lines as fit, never over the byte budget."""
+
+import random
+
+import pytest
+
+from bench.fakes import FakeBot
+
+import moo
+
+
+def _size(text):
+    return len(text.encode("utf-8"))
+
+
+def test_items_share_lines_up_to_the_budget():
+    items = [f"n{i}: {i * 7}" for i in range(12)]
+    head, cont = "🏆 Top: ", "🏆 … "
+    lines = moo.pack_lines(items, 40, head=head, cont=cont)
+    assert lines[0].startswith(head) and all(line.startswith(cont) for line in lines[1:])
+    assert all(_size(line) <= 40 for line in lines)
+    body = [lines[0][len(head):]] + [line[len(cont):] for line in lines[1:]]
+    assert " | ".join(body) == " | ".join(items)
+    # Every line is full: the next one's first item wouldn't have fitted
+    for line, following in zip(lines, body[1:]):
+        assert _size(line + " | " + following.split(" | ")[0]) > 40
+
+
+def test_an_oversize_item_is_split_at_spaces():
+    item = "word " * 30
+    lines = moo.pack_lines(["short", item.strip(), "tail"], 32)
+    assert lines[0] == "short"
+    assert lines[-1] == "tail"
+    assert all(_size(line) <= 32 for line in lines)
+    assert all(not line.startswith(" ") and not line.endswith(" ") for line in lines)
+    assert " ".join(lines[1:-1]).split() == item.split()
+
+
+def test_multibyte_text_is_never_cut_inside_a_character():
+    pieces = moo._split_oversize("🐄" * 50, 30)
+    assert all(_size(piece) <= 30 for piece in pieces)
+    assert "".join(pieces) == "🐄" * 50
+
+
+@pytest.mark.parametrize("head, expected", [
+    ("", [""]),
+    ("🏆 Top: ", ["🏆 Top: "]),
+])
+def test_no_items_gives_just_the_head(head, expected):
+    assert moo.pack_lines([], 40, head=head) == expected
+
+
+def test_an_oversize_head_is_split_even_without_items():
+    head = "header " * 20
+    lines = moo.pack_lines([], 32, head=head)
+    assert len(lines) > 1
+    assert all(_size(line) <= 32 for line in lines)
+    assert " ".join(lines).split() == head.split()
+
+
+def test_random_items_fit_the_budget():
+    rng = random.Random(11)
+    words = ["moo", "🐄", "alice: 12", "x" * 40, "ünïcödé", "a b c d e f g h"]
+    for _ in range(500):
+        budget = rng.randrange(16, 80)
+        items = [rng.choice(words) for _ in range(rng.randrange(8))]
+        head, cont = rng.choice(["", "🏆 ", "head " * 6]), rng.choice(["", "… "])
+        lines = moo.pack_lines(items, budget, head=head, cont=cont)
+        assert lines
+        assert all(_size(line) <= budget for line in lines), (items, budget, head, lines)
+        for item in items:
+            if _size(item) + max(_size(head), _size(cont)) <= budget:
+                assert any(item in line for line in lines)
+
+
+def test_text_budget():
+    bot = FakeBot(None)
+    estimate = moo._text_budget(bot, "#moo")
+    assert estimate == (moo.IRC_LINE_BYTES - (1 + len("MooBot") + 1 + 1 + 9 + 1 + 63)
+                        - _size(" PRIVMSG #moo :") - 2)
+    bot.safe_text_length = lambda target: 400
+    assert moo._text_budget(bot, "#moo") == 400
+    bot.safe_text_length = lambda target: 3
+    assert moo._text_budget(bot, "#moo") == moo._MIN_TEXT_BYTES
+
+    def broken(target):
+        raise ValueError(target)
+    bot.safe_text_length = broken
+    assert moo._text_budget(bot, "#moo") == estimate
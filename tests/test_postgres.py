@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+The SQL stores on PostgreSQL, and databases moo refuses.
+
+The PostgreSQL tests need a server: set MOO_TEST_POSTGRES to a URL whose
+user may create databases (each test gets its own), e.g.
+postgresql://postgres@localhost/postgres. They're skipped otherwise.
+"""
+
+import dataclasses
+
+import pytest
+
+from bench.fakes import FakeBot
+
+import moo
+
+
+class _MySQLDB:
+    """bot.db on a MySQL server; never connected to."""
+
+    def __init__(self):
+        from sqlalchemy import create_mock_engine
+
+        self.engine = create_mock_engine("mysql://", executor=None)
+
+    def session(self):
+        from sqlalchemy.orm import Session
+
+        return Session(bind=self.engine)
+
+
+def test_insert_or_ignore_spelling():
+    assert moo._postgres("INSERT OR IGNORE INTO t (a) VALUES (:a)") == \
+        "INSERT INTO t (a) VALUES (:a) ON CONFLICT DO NOTHING"
+
+
+def test_other_databases_refused():
+    with pytest.raises(moo.MooConfigError, match="not mysql"):
+        moo.SqlAlchemyStore(FakeBot(_MySQLDB()))
+    with pytest.raises(moo.MooConfigError, match="not mysql"):
+        moo.setup(FakeBot(_MySQLDB()))
+
+
+@pytest.mark.parametrize("returning", [True, False])
+def test_totals_on_postgres(postgres_db, migrated, returning):
+    store = migrated(postgres_db, 3)
+    store.returning = returning
+    assert store.add({"alice": 3, "bob": 1}, {}, {moo.GLOBAL_SCOPE: 4}) == ({"alice": 3, "bob": 1}, {})
+    assert store.add({"alice": 2}, {}, {moo.GLOBAL_SCOPE: 2}) == ({"alice": 5}, {})
+    assert store.total(moo.GLOBAL_SCOPE) == 6
+    assert store.sum_global() == 6
+
+    store.set_totals({moo.GLOBAL_SCOPE: 9, "#moo": 1})
+    assert store.totals() == {moo.GLOBAL_SCOPE: 9, "#moo": 1}
+    store.load([{"n": "alice", "v": 7}], [], "overwrite")
+    store.load([{"n": "bob", "v": 1}], [], "merge")
+    assert store.get_many(["alice", "bob", "carol"]) == {"alice": 7, "bob": 2}
+    assert store.top(None, 5) == [("alice", 7), ("bob", 2)]
+
+
+def test_history_on_postgres(postgres_db, migrated):
+    store = migrated(postgres_db, 4)
+    day = 20000
+    for hour, channel, nick, v in [(day * 24 + 1, "#moo", "alice", 2), (day * 24 + 1, "#moo", "alice", 1),
+                                   (day * 24 + 30, "#moo", "bob", 4), (day * 24 + 30, "", "alice", 1)]:
+        store.add({nick: v}, {}, {}, hourly={(hour, channel, nick): v})
+    # Day `day` is rolled up; day + 1 stays hourly
+    assert store.rollup((day + 1) * 24, day) == 1
+    window = {"h": day * 24, "d": day, "l": 10}
+    assert store.query(moo.SQL_WINDOW_TOP_GLOBAL, window) == [("alice", 4), ("bob", 4)]
+    assert store.query(moo.SQL_WINDOW_TOP_CHAN, {**window, "c": "#moo"}) == [("bob", 4), ("alice", 3)]
+    assert store.query(moo.SQL_WINDOW_NICK, {**window, "n": "alice"}) == [(4,)]
+    assert store.query(moo.SQL_WINDOW_NICK_CHAN, {**window, "n": "alice", "c": "#moo"}) == [(3,)]
+
+
+@pytest.mark.parametrize("upsert", [True, False])
+def test_node_counts_on_postgres(postgres_db, migrated, upsert):
+    store = migrated(postgres_db, 5)
+    store.upsert = upsert
+    moo.SETTINGS = dataclasses.replace(moo.SETTINGS, node_id="north")
+    store.add({"alice": 2}, {}, {}, node=[("alice", "", 2)])
+    store.add({"alice": 1}, {}, {}, node=[("alice", "", 1), ("bob", "", 1)])
+    store.node_reset()
+    assert store.query(moo.SQL_ALL_NODES) == [("north", 2, 1)]
+    assert sorted(store.query(moo.SQL_NODE_CHANGES, {"o": "north", "q": 1})) == [("alice", ""), ("bob", "")]
+    rows = store.query(moo._sql("SELECT nick, count FROM moo_node_counts ORDER BY nick"))
+    assert rows == [("alice", 3), ("bob", 1)]
+
+
+@pytest.mark.parametrize("upsert", [True, False])
+def test_channel_counts_on_postgres(postgres_db, migrated, upsert):
+    moo.SETTINGS = dataclasses.replace(moo.SETTINGS, node_id="north")
+    store = migrated(postgres_db, moo.MIGRATIONS[-1][0])
+    store.upsert = upsert
+    # moo_nodes is new here, so there's no older node to keep moo_counts_chan for
+    assert store.query(moo.SQL_OLD_NODES, {"v": 6}) == [(0,)]
+    chan = {("alice", "#moo"): 3, ("bob", "#moo"): 1, ("alice", "#cow"): 2}
+    assert store.add({"alice": 5, "bob": 1}, chan, {}, reads=chan) == ({"alice": 5, "bob": 1}, chan)
+    store.add({}, {("bob", "#moo"): 3}, {})
+    assert store.get("bob", "#moo") == 4
+    assert store.get_many(["alice", "bob", "carol"], "#moo") == {"alice": 3, "bob": 4}
+    assert store.top("#moo", 5) == [("bob", 4), ("alice", 3)]
+    assert store.page("#moo", 3, 5) == [("alice", 3)]
+    assert store.nick_at("#moo", 4, last=False) == "bob"
+    assert store.sum_channels("", 10) == [("#cow", 2), ("#moo", 7)]
+
+    store.load([], [{"n": "carol", "c": "#moo", "v": 9}, {"n": "alice", "c": "#moo", "v": 1}], "overwrite")
+    assert store.top("#moo", 5) == [("carol", 9), ("bob", 4), ("alice", 1)]
+    for _ in store.reset_chunks("alice"):
+        pass
+    assert sorted((r["nick"], r.get("channel", ""), r["count"]) for r in store.iter_counts()) == \
+        [("bob", "", 1), ("bob", "#moo", 4), ("carol", "#moo", 9)]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""The hot statements' sqlite plans use the indexes the migrations add (see bench/explain_plans.py)."""
+
+import pytest
+
+from bench import explain_plans
+
+
+@pytest.fixture(scope="module")
+def conn(tmp_path_factory):
+    conn = explain_plans.build(str(tmp_path_factory.mktemp("plans") / "moo.db"))
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize("sql", list(explain_plans.EXPECTED),
+                         ids=lambda sql: " ".join(sql.split())[:60])
+def test_reads_use_an_index_without_sorting(conn, sql):
+    plan, ok = explain_plans.check(conn, sql)
+    assert ok, plan
+
+
+@pytest.mark.parametrize("sql", list(explain_plans.AGGREGATES),
+                         ids=["window top global", "window top channel"])
+def test_window_tops_search_their_indexes(conn, sql):
+    plan, ok = explain_plans.check(conn, sql)
+    assert ok, plan
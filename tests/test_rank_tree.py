@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Rank tree order statistics against a sorted list of counts, then rank
+trees and leaderboard indexes built from the tables while moos keep coming.
+"""
+
+import random
+import threading
+
+import moo
+
+
+def _check(tree, counts):
+    """Compare every order statistic of tree with the sorted counts."""
+    ranked = sorted(counts.values(), reverse=True)
+    assert len(tree) == len(ranked)
+    for k, count in enumerate(ranked, 1):
+        assert tree.count_at(k) == count
+    for count in set(ranked) | {min(ranked, default=0) - 1, max(ranked, default=0) + 1}:
+        assert tree.above(count) == sum(c > count for c in ranked)
+        assert tree.tied(count) == ranked.count(count)
+
+
+def test_rank_tree_order_statistics():
+    tree = moo._RankTree([("alice", 5), ("bob", 3), ("carol", 3), ("dave", -2)])
+    assert tree.above(3) == 1 and tree.tied(3) == 2
+    assert [tree.count_at(k) for k in range(1, 5)] == [5, 3, 3, -2]
+    assert tree.above(-2) == 3 and tree.above(100) == 0 and tree.tied(4) == 0
+    tree.add("dave", 10)
+    tree.remove("alice")
+    tree.set("erin", 0)
+    assert tree.counts == {"bob": 3, "carol": 3, "dave": 8, "erin": 0}
+    _check(tree, tree.counts)
+
+
+def test_rank_tree_clamps_huge_counts_to_the_ends():
+    big = moo.RANK_OFFSET + 5
+    tree = moo._RankTree([("alice", big), ("bob", -big), ("carol", 1)])
+    assert tree.above(1) == 1
+    assert tree.above(-big) == 2
+    assert tree.tied(big) == 1
+    assert tree.count_at(1) == moo.RANK_OFFSET - 1
+    assert tree.count_at(3) == 1 - moo.RANK_OFFSET
+
+
+def test_rank_tree_random_updates():
+    rng = random.Random(17)
+    nicks = [f"n{i}" for i in range(40)]
+    counts = {nick: rng.randrange(-5, 50) for nick in rng.sample(nicks, 20)}
+    tree = moo._RankTree(counts.items())
+    _check(tree, counts)
+    for step in range(2000):
+        nick = rng.choice(nicks)
+        r = rng.random()
+        if r < 0.6:
+            delta = rng.choice((1, 1, 2, 20, -3))
+            counts[nick] = counts.get(nick, 0) + delta
+            tree.add(nick, delta)
+        elif r < 0.8:
+            counts[nick] = rng.randrange(-5, 80)
+            tree.set(nick, counts[nick])
+        else:
+            counts.pop(nick, None)
+            tree.remove(nick)
+        if step % 50 == 0:
+            _check(tree, counts)
+    _check(tree, counts)
+    assert tree.counts == counts
+
+
+def _during(store, method, action):
+    """Make store.method run action on another thread part way through its first call; returns the calls."""
+    original, calls = getattr(store, method), []
+
+    def wrapped(*args):
+        calls.append(args)
+        rows = list(original(*args))
+        if len(calls) == 1:
+            thread = threading.Thread(target=action)
+            thread.start()
+            thread.join(5)
+            assert not thread.is_alive(), "the build held up a write"
+        return rows
+
+    setattr(store, method, wrapped)
+    return calls
+
+
+def test_rank_tree_replays_writes_made_during_the_scan(bot):
+    moo._db_increment(bot, "alice", "#moo", 3)
+    moo._db_increment(bot, "bob", "#moo", 1)
+
+    def write():
+        moo._db_increment(bot, "bob", "#moo", 5)
+        moo._db_increment(bot, "carol", "#moo", 1)
+
+    calls = _during(moo._store(bot), "scan", write)
+    assert moo._rank_tree(bot, "#moo").counts == {"alice": 3, "bob": 6, "carol": 1}
+    assert moo._rank_tree(bot).counts == {"alice": 3, "bob": 6, "carol": 1}
+    assert calls == [("#moo",), (None,)]
+    assert moo._BUILDS == {}
+
+
+def test_index_replays_writes_made_during_the_read(bot):
+    moo._db_increment(bot, "alice", "#moo", 3)
+    moo._db_increment(bot, "bob", "#moo", 1)
+    _during(moo._store(bot), "top", lambda: moo._db_increment(bot, "bob", "#moo", 5))
+    assert moo._load_top(bot, "#moo").top(5) == [("bob", 6), ("alice", 3)]
+    moo._db_increment(bot, "alice", "#moo", 4)
+    assert moo._leaderboard(bot, "#moo", 5) == [("alice", 7), ("bob", 6)]
+
+
+def test_reset_during_the_scan(bot):
+    moo._db_increment(bot, "alice", "#moo", 3)
+
+    def reset():
+        moo.reset_counts(bot)
+        moo._db_increment(bot, "bob", "#moo", 2)
+
+    _during(moo._store(bot), "scan", reset)
+    assert moo._rank_tree(bot).counts == {"bob": 2}
+
+
+def test_scan_thrown_away_when_everything_is_forgotten(bot):
+    moo._db_increment(bot, "alice", "#moo", 3)
+
+    def overwrite():
+        with moo._FLUSH_LOCK:
+            moo._store(bot).load([{"n": "alice", "v": 9}], [], "overwrite")
+            moo._top_forget()
+
+    calls = _during(moo._store(bot), "scan", overwrite)
+    assert moo._rank_tree(bot).counts == {"alice": 9}
+    assert calls == [(None,), (None,)]
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""Handler reads answered from the stored counts plus the unflushed moos, never waiting for a flush."""
+
+import threading
+
+from bench.fakes import FakeBot, ScratchSessionDB
+
+import moo
+
+
+def _while_flushing(check):
+    """Run check on a thread while another holds the flush lock; fails if check waits for it."""
+    held, done, errors = threading.Event(), threading.Event(), []
+
+    def hold():
+        with moo._FLUSH_LOCK:
+            held.set()
+            done.wait(10)
+
+    def run():
+        try:
+            check()
+        except BaseException as e:
+            errors.append(e)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    held.wait(5)
+    reader = threading.Thread(target=run)
+    reader.start()
+    reader.join(5)
+    done.set()
+    holder.join()
+    assert not reader.is_alive(), "a read waited for the flush lock"
+    if errors:
+        raise errors[0]
+
+
+def _observe(bot):
+    rank = moo._rank(bot, "bob", "#moo")
+    return {
+        "alice": moo.db_helper(bot, "alice"),
+        "bob #moo": moo.db_helper_chan(bot, "bob", "#moo"),
+        "counts": moo._read_counts(bot, ["alice", "bob"], "#moo"),
+        "total": moo._read_total(bot, "#moo"),
+        "top": moo._leaderboard(bot, "#moo", 5),
+        "page 2": moo._leaderboard_page(bot, None, 1, 2),
+        "rank": (rank["count"], rank["rank"], rank["above"]),
+    }
+
+
+def test_reads_dont_wait_for_the_flush_lock(bot):
+    moo.WRITER.stop()
+    moo._db_increment(bot, "alice", "#moo", 3)
+    moo._db_increment(bot, "bob", "#moo", 5)
+    moo._load_top(bot, "#moo")
+    for _ in range(4):
+        moo._buffer_increment(bot, "alice", "#moo", 1)
+
+    seen = []
+    _while_flushing(lambda: seen.append(_observe(bot)))
+    assert seen == [{
+        "alice": 7,
+        "bob #moo": 5,
+        "counts": {"alice": 7, "bob": 5},
+        "total": 12,
+        "top": [("alice", 7), ("bob", 5)],
+        "page 2": [("bob", 5)],
+        "rank": (5, 2, ("alice", 7)),
+    }]
+    moo._flush_pending(bot)
+    assert _observe(bot) == seen[0]
+
+
+def test_reads_during_a_flush_count_the_moos_being_written(bot):
+    moo.WRITER.stop()
+    moo._db_increment(bot, "alice", "#moo", 3)
+    moo._load_top(bot, "#moo")
+    moo._rank_tree(bot, "#moo")
+    moo._buffer_increment(bot, "alice", "#moo", 2)
+    moo._buffer_increment(bot, "bob", "#moo", 4)
+
+    store, seen = moo._store(bot), []
+    original = store.add
+
+    def observe():
+        thread = threading.Thread(target=lambda: seen.append(_observe(bot)))
+        thread.start()
+        thread.join(5)
+
+    def add(*args, **kwargs):
+        if seen:
+            return original(*args, **kwargs)
+        # Still in flight, and one more moo buffered behind them; then
+        # committed but not yet published
+        moo._buffer_increment(bot, "bob", "#moo", 1)
+        observe()
+        result = original(*args, **kwargs)
+        observe()
+        return result
+
+    store.add = add
+    moo._flush_pending(bot)
+    assert seen == 2 * [{
+        "alice": 5,
+        "bob #moo": 5,
+        "counts": {"alice": 5, "bob": 5},
+        "total": 10,
+        "top": [("alice", 5), ("bob", 5)],
+        "page 2": [("bob", 5)],
+        "rank": (5, 1, None),
+    }]
+    assert _observe(bot) == seen[0]
+    moo._flush_pending(bot)
+    assert _observe(bot) == seen[0]
+
+
+def test_windows_count_unflushed_moos():
+    bot = FakeBot(ScratchSessionDB())
+    moo.setup(bot)
+    try:
+        moo.WRITER.stop()
+        moo._db_increment(bot, "alice", "#moo", 3)
+        moo._db_increment(bot, "bob", "#cows", 2)
+        moo._buffer_increment(bot, "bob", "#moo", 2)
+        moo._buffer_increment(bot, "carol", "#moo", 1)
+
+        def check():
+            assert moo._window_top(bot, None, 5, "day") == [("bob", 4), ("alice", 3), ("carol", 1)]
+            assert moo._window_top(bot, "#moo", 2, "week") == [("alice", 3), ("bob", 2)]
+            assert moo._window_count(bot, "bob", None, "day") == 4
+            assert moo._window_count(bot, "Bob", "#moo", "month") == 2
+
+        _while_flushing(check)
+        moo._flush_pending(bot)
+        check()
+    finally:
+        moo.shutdown(bot)
+
+
+def test_nicks_mooing_from_outside_the_index_are_looked_up(bot, monkeypatch):
+    monkeypatch.setattr(moo, "LEADERBOARD_KEEP", 2)
+    moo.WRITER.stop()
+    for nick, count in (("alice", 5), ("bob", 4), ("carol", 3)):
+        moo._db_increment(bot, nick, "#moo", count)
+    index = moo._load_top(bot, "#moo")
+    assert not index.complete
+
+    moo._buffer_increment(bot, "carol", "#moo", 3)
+    assert index.unsure == {"carol"}
+    seen = []
+    _while_flushing(lambda: seen.append(moo._leaderboard(bot, "#moo", 2)))
+    assert seen == [[("carol", 6), ("alice", 5)]]
+    assert index.unsure == set()
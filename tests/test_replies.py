@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""ReplyScheduler: per-channel reply budgets, flood summaries and important replies."""
+
+import dataclasses
+
+import pytest
+
+from bench.fakes import FakeBot
+
+import moo
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(moo, "_time", clock)
+    return clock
+
+
+def _rate(rate):
+    moo.SETTINGS = dataclasses.replace(moo.SETTINGS, max_rate_per_15sec=rate)
+
+
+def _said(bot):
+    said = [(target, text) for _, target, text in bot.sent]
+    bot.sent.clear()
+    return said
+
+
+def test_replies_over_budget_become_one_summary(clock):
+    _rate(2)
+    bot, replies = FakeBot(None), moo.ReplyScheduler()
+    for nick in ("alice", "bob", "carol", "bob"):
+        replies.say(bot, "#moo", nick, f"moo from {nick}")
+    assert _said(bot) == [(None, "moo from alice"), (None, "moo from bob")]
+
+    # Half a window refills one token: the summary goes out in the next reply's place
+    clock.now += 7.5
+    replies.say(bot, "#moo", "dave", "moo from dave")
+    assert _said(bot) == [(None, "🐄 ×3 (carol, bob, dave)")]
+    assert replies.stats() == {"sent": 2, "priority": 0, "dropped": 3, "merged": 1,
+                               "channels": 1, "pending": 0}
+
+
+def test_channels_have_their_own_budgets(clock):
+    _rate(1)
+    bot, replies = FakeBot(None), moo.ReplyScheduler()
+    replies.say(bot, "#moo", "alice", "one")
+    replies.say(bot, "#cows", "alice", "two")
+    replies.say(bot, "#moo", "alice", "three")
+    assert _said(bot) == [(None, "one"), (None, "two")]
+    assert replies.stats()["pending"] == 1
+
+
+def test_summaries_name_the_first_few_nicks(clock):
+    _rate(1)
+    bot, replies = FakeBot(None), moo.ReplyScheduler()
+    replies.say(bot, "#moo", "first", "moo")
+    for i in range(moo.REPLY_SUMMARY_NICKS + 2):
+        replies.say(bot, "#moo", f"n{i}", "moo")
+    clock.now += moo.REPLY_WINDOW
+    replies.flush(bot)
+    names = ", ".join(f"n{i}" for i in range(moo.REPLY_SUMMARY_NICKS))
+    assert _said(bot) == [(None, "moo"), ("#moo", f"🐄 ×{moo.REPLY_SUMMARY_NICKS + 2} ({names}, …)")]
+
+
+def test_flush_waits_for_a_token_then_forgets_idle_channels(clock):
+    _rate(1)
+    bot, replies = FakeBot(None), moo.ReplyScheduler()
+    replies.say(bot, "#moo", "alice", "moo")
+    replies.say(bot, "#moo", "bob", "moo")
+    _said(bot)
+    replies.flush(bot)
+    assert _said(bot) == []
+
+    clock.now += moo.REPLY_WINDOW
+    replies.flush(bot)
+    assert _said(bot) == [("#moo", "🐄 ×1 (bob)")]
+    clock.now += moo.REPLY_WINDOW
+    replies.flush(bot)
+    assert replies.stats()["channels"] == 0
+
+
+def test_important_replies_always_go_out_but_spend_tokens(clock):
+    _rate(2)
+    bot, replies = FakeBot(None), moo.ReplyScheduler()
+    for i in range(5):
+        replies.say(bot, "#moo", "alice", f"milestone {i}", important=True)
+    assert len(_said(bot)) == 5
+
+    # Borrowed at most one window ahead: two windows later there's a token again
+    replies.say(bot, "#moo", "bob", "moo")
+    assert _said(bot) == []
+    clock.now += 2 * moo.REPLY_WINDOW
+    replies.say(bot, "#moo", "carol", "moo")
+    assert _said(bot) == [(None, "🐄 ×2 (bob, carol)")]
+    assert replies.stats()["priority"] == 5
+
+
+def test_private_replies_and_no_limit_are_never_held(clock):
+    bot, replies = FakeBot(None), moo.ReplyScheduler()
+    _rate(1)
+    for _ in range(3):
+        replies.say(bot, "alice", "alice", "moo")
+    _rate(0)
+    for _ in range(3):
+        replies.say(bot, "#moo", "alice", "moo")
+    assert len(_said(bot)) == 6
+    assert replies.stats()["channels"] == 0
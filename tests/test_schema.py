@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Schema version 6 next to nodes still on version 5: the old channel table is
+mirrored both ways until the last node upgrades, then dropped.
+"""
+
+import dataclasses
+
+from bench.fakes import SessionDB
+
+import moo
+
+# How version 5 wrote channel counts (registered with moo._sql when run,
+# since every test reloads moo)
+OLD_UPSERT = """
+    INSERT INTO moo_counts_chan (nick, channel, count) VALUES (:n, :c, :v)
+    ON CONFLICT(nick, channel) DO UPDATE SET count = count + excluded.count
+"""
+OLD_SEED = "INSERT OR IGNORE INTO moo_counts_chan (nick, channel, count) VALUES (:n, :c, 0)"
+OLD_ADD = "UPDATE moo_counts_chan SET count = count + :v WHERE nick = :n AND channel = :c"
+OLD_SET = "INSERT OR REPLACE INTO moo_counts_chan (nick, channel, count) VALUES (:n, :c, :v)"
+OLD_ROWS = "SELECT nick, channel, count FROM moo_counts_chan ORDER BY nick, channel"
+SCHEMA = "SELECT type, name FROM sqlite_master WHERE name LIKE 'moo_counts_chan%' ORDER BY name"
+
+
+def _write(store, *statements):
+    with store.transaction() as tx:
+        for sql, params in statements:
+            tx.run(moo._sql(sql), params)
+        tx.commit()
+
+
+def _rows(store, sql, params=None):
+    return store.query(moo._sql(sql), params)
+
+
+def _as_node(node_id):
+    moo.SETTINGS = dataclasses.replace(moo.SETTINGS, node_id=node_id)
+
+
+def test_old_channel_table_mirrored_until_last_node_upgrades(tmp_path, migrated):
+    db = SessionDB(str(tmp_path / "moo.db"))
+    # Two nodes on version 5, one of them with channel counts
+    store = migrated(db, 5)
+    _write(store, (OLD_UPSERT, {"n": "alice", "c": "#moo", "v": 3}),
+           (moo.SQL_SEED_NODE, {"o": "north"}), (moo.SQL_SEED_NODE, {"o": "south"}))
+
+    _as_node("north")
+    store = migrated(db, 6)
+    assert store.get("alice", "#moo") == 3
+    assert store.query(moo.SQL_OLD_NODES, {"v": 6}) == [(1,)]
+
+    # south, still on version 5, keeps writing the old table...
+    _write(store, (OLD_UPSERT, {"n": "alice", "c": "#moo", "v": 2}),
+           (OLD_SEED, {"n": "carol", "c": "#new"}), (OLD_ADD, {"n": "carol", "c": "#new", "v": 1}),
+           (OLD_SET, {"n": "dave", "c": "#moo", "v": 7}), (OLD_SET, {"n": "alice", "c": "#moo", "v": 5}))
+    assert store.get_many(["alice", "dave"], "#moo") == {"alice": 5, "dave": 7}
+    assert store.top("#new", 5) == [("carol", 1)]
+
+    # ...and reads what north writes
+    store.add({}, {("alice", "#moo"): 1, ("erin", "#new"): 2}, {})
+    store.load([], [{"n": "carol", "c": "#new", "v": 4}], "overwrite")
+    assert _rows(store, OLD_ROWS) == [("alice", "#moo", 6), ("carol", "#new", 4),
+                                     ("dave", "#moo", 7), ("erin", "#new", 2)]
+    for _ in store.reset_chunks("dave"):
+        pass
+    assert _rows(store, OLD_ROWS) == [("alice", "#moo", 6), ("carol", "#new", 4), ("erin", "#new", 2)]
+    _write(store, ("DELETE FROM moo_counts_chan WHERE nick = :n", {"n": "erin"}))
+    assert store.get("erin", "#new") == 0
+
+    # The old table outlives a restart while south is behind; once south is
+    # upgraded too, it goes
+    store.migrate()
+    assert ("table", "moo_counts_chan") in _rows(store, SCHEMA)
+    _as_node("south")
+    store.migrate()
+    assert _rows(store, SCHEMA) == []
+    assert store.query(moo.SQL_OLD_NODES, {"v": 6}) == [(0,)]
+    assert store.top("#moo", 5) == [("alice", 6)]
+    store.add({}, {("alice", "#moo"): 1}, {})
+    assert store.get("alice", "#moo") == 7
+
+
+def test_old_channel_table_dropped_without_other_nodes(tmp_path, migrated):
+    db = SessionDB(str(tmp_path / "moo.db"))
+    store = migrated(db, 5)
+    _write(store, (OLD_UPSERT, {"n": "alice", "c": "#moo", "v": 3}))
+    store = migrated(db, 6)
+    assert _rows(store, SCHEMA) == []
+    assert store.get("alice", "#moo") == 3
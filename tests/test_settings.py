@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""The [moo] settings parser: typed values, defaults for bad ones, and .mooreload's stricter reload."""
+
+import configparser
+import os
+
+import pytest
+
+from bench.fakes import FakeBot, ScratchSessionDB
+
+import moo
+
+
+def _parser(**options):
+    parser = configparser.RawConfigParser()
+    parser.add_section("moo")
+    for name, value in options.items():
+        parser.set("moo", name, value)
+    return parser
+
+
+def test_defaults_without_a_section():
+    assert moo.MooSettings.from_parser(None) == (moo.MooSettings(), [])
+    assert moo.MooSettings.from_parser(configparser.RawConfigParser()) == (moo.MooSettings(), [])
+
+
+def test_values_are_typed():
+    settings, errors = moo.MooSettings.from_parser(_parser(
+        leet_moo="Off",
+        moo_cooldown="  12  ",
+        legendary_chance="0.5   ; half the time",
+        max_rate_per_15sec="4 # per channel",
+        writer_backpressure="DROP",
+        metrics_file="~/moo.prom",
+        node_id="north-1",
+        backend="Memory",
+        sqlite_profile="safe",
+        shoe_size="44",   # not ours: ignored
+    ))
+    assert errors == []
+    assert settings == moo.MooSettings(
+        leet_moo=False, moo_cooldown=12, legendary_chance=0.5, max_rate_per_15sec=4,
+        writer_backpressure="drop", metrics_file=os.path.expanduser("~/moo.prom"),
+        node_id="north-1", backend="memory", sqlite_profile="safe",
+    )
+
+
+@pytest.mark.parametrize("name, raw, message", [
+    ("leet_moo", "maybe", "expected true/false"),
+    ("moo_cooldown", "-1", "expected a whole number of seconds >= 0"),
+    ("moo_cooldown", "1.5", "expected a whole number of seconds >= 0"),
+    ("write_behind_max", "0", "expected a whole number >= 1"),
+    ("legendary_chance", "1.5", "expected a number between 0.0 and 1.0"),
+    ("legendary_chance", "nan", "expected a number between 0.0 and 1.0"),
+    ("writer_backpressure", "panic", "expected one of block, drop, spill"),
+    ("node_id", "north pole", "expected up to 32 letters, digits, '.', '_' or '-'"),
+    ("node_id", "n" * 33, "expected up to 32 letters, digits, '.', '_' or '-'"),
+])
+def test_invalid_values_keep_their_defaults(name, raw, message):
+    settings, errors = moo.MooSettings.from_parser(_parser(**{name: raw}))
+    assert settings == moo.MooSettings()
+    assert errors == [f"{name} = {raw!r}: {message}"]
+
+
+def test_settings_are_frozen():
+    with pytest.raises(AttributeError):
+        moo.SETTINGS.moo_cooldown = 1
+
+
+def test_from_file_is_strict(tmp_path):
+    path = tmp_path / "bot.cfg"
+    path.write_text("[moo]\nmoo_cooldown = 9\n", encoding="utf-8")
+    assert moo.MooSettings.from_file(str(path)).moo_cooldown == 9
+
+    path.write_text("[moo]\nmoo_cooldown = soon\nleet_moo = perhaps\n", encoding="utf-8")
+    with pytest.raises(moo.MooConfigError, match="moo_cooldown = 'soon'.*; leet_moo = 'perhaps'"):
+        moo.MooSettings.from_file(str(path))
+    with pytest.raises(moo.MooConfigError, match="cannot read"):
+        moo.MooSettings.from_file(str(tmp_path / "missing.cfg"))
+
+
+def test_setup_falls_back_to_defaults_for_bad_values():
+    bot = FakeBot(ScratchSessionDB(), moo_options={"moo_cooldown": "soon", "sudo_cooldown": "60"})
+    moo.setup(bot)
+    try:
+        assert moo.SETTINGS.moo_cooldown == moo.MooSettings.moo_cooldown
+        assert moo.SETTINGS.sudo_cooldown == 60
+    finally:
+        moo.shutdown(bot)
+
+
+def test_reload_swaps_in_the_file_or_keeps_the_current_settings(bot, tmp_path):
+    with pytest.raises(moo.MooConfigError, match="no file"):
+        moo._reload_settings(bot)
+
+    path = tmp_path / "bot.cfg"
+    bot.config.filename = str(path)
+    path.write_text("[moo]\nmoo_cooldown = 9\nhistory_days = 0\nleet_moo = off\n", encoding="utf-8")
+    before = moo.SETTINGS
+    assert moo._reload_settings(bot) == ["leet_moo", "moo_cooldown"]
+    assert moo.SETTINGS == moo.MooSettings(moo_cooldown=9, history_days=0, leet_moo=False)
+    assert before.moo_cooldown == moo.MooSettings.moo_cooldown   # the old object is untouched
+
+    path.write_text("[moo]\nmoo_cooldown = -9\n", encoding="utf-8")
+    current = moo.SETTINGS
+    with pytest.raises(moo.MooConfigError):
+        moo._reload_settings(bot)
+    assert moo.SETTINGS is current
+
+
+def test_options_the_memory_store_cant_honour_are_turned_off():
+    settings = moo._fit_settings(moo.MooSettings(node_id="north"), moo.MemoryStore(FakeBot(None)))
+    assert (settings.write_behind, settings.history_days, settings.node_id,
+            settings.count_cache_size) == (False, 0, "", 0)
@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+Every storage backend gives the same answers: each MooStore call on its
+own, the memory store's save file, then one seeded script played through
+the plugin on every backend and compared against sqlalchemy.
+"""
+
+import dataclasses
+import importlib
+import json
+import os
+import random
+
+import pytest
+
+from bench.fakes import FakeBot, ScratchLegacyDB, ScratchSessionDB
+
+import moo
+
+G = moo.GLOBAL_SCOPE
+CHANNELS = ["#moo", "#cows", "#barn"]
+DBS = {"sqlalchemy": ScratchSessionDB, "sqlite": ScratchLegacyDB, "memory": ScratchLegacyDB}
+SCRIPT_STEPS = 1500
+CHECK_EVERY = 100
+
+
+@pytest.fixture(params=sorted(DBS))
+def backend(request):
+    return request.param
+
+
+@pytest.fixture
+def store(backend, tmp_path):
+    """A migrated store of each backend, on its own database."""
+    store = moo.STORES[backend](FakeBot(DBS[backend](), homedir=str(tmp_path)))
+    store.migrate()
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def backend_bot(backend, tmp_path):
+    """A set-up bot on each backend, writing straight through."""
+    bot = FakeBot(DBS[backend](), homedir=str(tmp_path),
+                  moo_options={"backend": backend, "write_behind": "false", "history_days": 0})
+    moo.setup(bot)
+    assert moo.STORE.name == backend
+    yield bot
+    moo.shutdown(bot)
+
+
+def _seed(store):
+    store.add({"alice": 5, "bob": 2},
+              {("alice", "#moo"): 3, ("alice", "#cows"): 2, ("bob", "#moo"): 2},
+              {G: 7, "#moo": 5, "#cows": 2})
+
+
+def _export(store):
+    return sorted(json.dumps(r, sort_keys=True) for r in store.iter_counts())
+
+
+# --------------------------------------------------------------
+# MooStore calls
+# --------------------------------------------------------------
+def test_add_returns_the_new_counts(store):
+    g_new, c_new = store.add({"alice": 3, "bob": 1}, {("alice", "#moo"): 2, ("bob", "#cows"): 1},
+                             {G: 4, "#moo": 2, "#cows": 1}, reads=[("alice", "#moo")])
+    assert g_new == {"alice": 3, "bob": 1}
+    assert c_new == {("alice", "#moo"): 2}
+
+    g_new, c_new = store.add({"alice": -5}, {("alice", "#moo"): 1}, {G: -5, "#moo": 1},
+                             reads=[("alice", "#moo")])
+    assert g_new == {"alice": -2}
+    assert c_new == {("alice", "#moo"): 3}
+
+
+def test_get(store):
+    _seed(store)
+    assert store.get("alice") == 5
+    assert store.get("alice", "#cows") == 2
+    assert store.get("carol") == 0
+    assert store.get("carol", "#moo") == 0
+    assert store.get("alice", "#nowhere") == 0
+    assert store.get_many(["alice", "bob", "carol"]) == {"alice": 5, "bob": 2}
+    assert store.get_many(["alice", "bob"], "#cows") == {"alice": 2}
+    assert store.get_many(["alice"], "#nowhere") == {}
+
+
+def test_totals(store):
+    assert store.total("#moo") is None
+    _seed(store)
+    assert store.totals() == {G: 7, "#moo": 5, "#cows": 2}
+    assert store.total(G) == 7
+    assert store.sum_global() == 7
+    assert store.sum_channel("#moo") == 5
+    assert store.sum_channel("#nowhere") == 0
+    assert store.sum_channels("", 10) == [("#cows", 2), ("#moo", 5)]
+    assert store.sum_channels("#cows", 10) == [("#moo", 5)]
+    store.set_totals({"#moo": 9})
+    assert store.total("#moo") == 9
+
+
+def test_leaderboards(store):
+    counts = {"alice": 5, "bob": 3, "carol": 3, "dave": 3, "erin": 1}
+    store.add(counts, {(nick, "#moo"): v for nick, v in counts.items()}, {})
+    for channel in (None, "#moo"):
+        assert store.top(channel, 3) == [("alice", 5), ("bob", 3), ("carol", 3)]
+        assert store.page(channel, 3, 2) == [("bob", 3), ("carol", 3)]
+        assert store.page(channel, 2, 5) == [("erin", 1)]
+        assert sorted(store.scan(channel)) == sorted(counts.items())
+        assert store.nick_at(channel, 3, last=False) == "bob"
+        assert store.nick_at(channel, 3, last=True) == "dave"
+        assert store.nick_at(channel, 3, last=True, skip={"dave", "carol"}) == "bob"
+        assert store.nick_at(channel, 3, last=False, skip={"bob", "carol", "dave"}) is None
+        assert store.nick_at(channel, 4, last=False) is None
+    assert store.top("#nowhere", 3) == []
+    assert store.page("#nowhere", 3, 3) == []
+    assert list(store.scan("#nowhere")) == []
+    assert store.nick_at("#nowhere", 3, last=False) is None
+
+
+def test_reset_one_nick(store):
+    _seed(store)
+    steps = list(store.reset_chunks("alice", limit=1))
+    assert {key for _, keys in steps for key in keys} == {
+        ("alice", None), ("alice", "#cows"), ("alice", "#moo")}
+    assert store.get("alice") == 0
+    assert store.get("alice", "#moo") == 0
+    assert store.get("bob", "#moo") == 2
+    assert {s: v for s, v in store.totals().items() if v} == {G: 2, "#moo": 2}
+    assert sum(deleted for deleted, _ in store.reset_chunks("carol")) == 0
+
+
+def test_reset_everyone(store):
+    _seed(store)
+    steps = list(store.reset_chunks(limit=2))
+    assert len(steps) > 1
+    assert {key for _, keys in steps for key in keys} == {
+        ("alice", None), ("alice", "#cows"), ("alice", "#moo"), ("bob", None), ("bob", "#moo")}
+    assert sum(deleted for deleted, _ in steps) == 5
+    assert _export(store) == []
+    assert store.totals() == {}
+    assert store.top(None, 5) == []
+
+
+def test_load(store):
+    _seed(store)
+    g_rows = [{"n": "alice", "v": 1}, {"n": "carol", "v": 4}]
+    c_rows = [{"n": "alice", "c": "#moo", "v": 1}, {"n": "carol", "c": "#barn", "v": 4}]
+    store.load(g_rows, c_rows, "merge")
+    assert store.get_many(["alice", "bob", "carol"]) == {"alice": 6, "bob": 2, "carol": 4}
+    assert store.get("alice", "#moo") == 4
+    store.load(g_rows, c_rows, "overwrite")
+    assert store.get_many(["alice", "bob", "carol"]) == {"alice": 1, "bob": 2, "carol": 4}
+    assert store.get("alice", "#moo") == 1
+    assert store.get("carol", "#barn") == 4
+    assert _export(store) == sorted(json.dumps(r, sort_keys=True) for r in [
+        {"nick": "alice", "count": 1}, {"nick": "bob", "count": 2}, {"nick": "carol", "count": 4},
+        {"nick": "alice", "channel": "#moo", "count": 1},
+        {"nick": "alice", "channel": "#cows", "count": 2},
+        {"nick": "bob", "channel": "#moo", "count": 2},
+        {"nick": "carol", "channel": "#barn", "count": 4},
+    ])
+
+
+@pytest.mark.parametrize("suffix", [".jsonl", ".csv"])
+def test_export_then_import(backend_bot, tmp_path, suffix):
+    bot = backend_bot
+    moo._db_increment(bot, "alice", "#moo", 5)
+    moo._db_increment(bot, "bob", "#cows", 2)
+    store = moo._store(bot)
+    path = str(tmp_path / f"moo{suffix}")
+    assert moo.export_counts(bot, path) == 4
+    exported = _export(store)
+
+    moo.import_counts(bot, path, "merge")
+    assert moo.db_helper(bot, "alice") == 10
+    assert moo.db_helper_chan(bot, "bob", "#cows") == 4
+    assert moo._read_total(bot, G) == 14
+    assert moo._leaderboard(bot, "#moo", 5) == [("alice", 10)]
+
+    moo.import_counts(bot, path, "overwrite")
+    assert _export(store) == exported
+    assert moo._read_total(bot, "#cows") == 2
+    assert moo._leaderboard(bot, None, 5) == [("alice", 5), ("bob", 2)]
+
+
+# --------------------------------------------------------------
+# Memory store save file
+# --------------------------------------------------------------
+def test_memory_store_save_round_trip(tmp_path):
+    bot = FakeBot(ScratchLegacyDB(), homedir=str(tmp_path))
+    store = moo.MemoryStore(bot)
+    store.migrate()
+    assert store.path == str(tmp_path / "default.moo-memory.json")
+    assert not store.save()   # nothing to save yet
+    _seed(store)
+    list(store.reset_chunks("bob"))
+    assert store.save()
+    assert not store.save()
+
+    loaded = moo.MemoryStore(bot)
+    loaded.migrate()
+    assert _export(loaded) == _export(store)
+    assert loaded.totals() == store.totals()
+    assert loaded.top("#moo", 5) == [("alice", 3)]
+    assert loaded.nick_at(None, 5, last=False) == "alice"
+
+
+def test_memory_store_keeps_an_unreadable_save(tmp_path):
+    bot = FakeBot(ScratchLegacyDB(), homedir=str(tmp_path))
+    path = tmp_path / "default.moo-memory.json"
+    path.write_text('{"counts": {"": {"alice": "many"}}', encoding="utf-8")
+    store = moo.MemoryStore(bot)
+    store.migrate()
+    assert _export(store) == []
+    assert not path.exists()
+    assert (tmp_path / "default.moo-memory.json.bad").exists()
+
+
+def test_memory_store_without_a_home_directory_saves_nothing():
+    store = moo.MemoryStore(FakeBot(ScratchLegacyDB()))
+    store.migrate()
+    _seed(store)
+    assert store.path is None
+    assert not store.save()
+
+
+def test_memory_backend_survives_a_restart(tmp_path):
+    def start():
+        importlib.reload(moo)
+        bot = FakeBot(ScratchLegacyDB(), homedir=str(tmp_path), moo_options={"backend": "memory"})
+        moo.setup(bot)
+        return bot
+
+    bot = start()
+    moo._db_increment(bot, "alice", "#moo", 4)
+    moo._db_increment(bot, "bob", "#moo", 6)
+    moo.shutdown(bot)
+    assert os.path.exists(tmp_path / "default.moo-memory.json")
+
+    bot = start()
+    try:
+        assert moo.db_helper_chan(bot, "alice", "#moo") == 4
+        assert moo._read_total(bot, G) == 10
+        assert moo._leaderboard(bot, "#moo", 5) == [("bob", 6), ("alice", 4)]
+        assert moo._rank(bot, "alice", "#moo")["rank"] == 2
+    finally:
+        moo.shutdown(bot)
+
+
+# --------------------------------------------------------------
+# One script, every backend
+# --------------------------------------------------------------
+def _fresh_bot(backend, write_behind):
+    """Reload the plugin (clean module state) and set it up on a new DB."""
+    importlib.reload(moo)
+    bot = FakeBot(DBS[backend](), moo_options={
+        "backend": backend, "write_behind": write_behind, "history_days": 0})
+    moo.setup(bot)
+    assert moo.STORE.name == backend
+    moo.SETTINGS = dataclasses.replace(
+        moo.SETTINGS, moo_cooldown=0, sudo_cooldown=0, max_rate_per_15sec=0
+    )
+    return bot
+
+
+def _observe(bot, nicks):
+    """Everything a user could see right now, as plain data."""
+    seen = {
+        "counts": [moo.db_helper(bot, n) for n in nicks],
+        "chan_counts": [moo.db_helper_chan(bot, n, c) for n in nicks for c in CHANNELS],
+        "totals": [moo._read_total(bot, s) for s in [G] + CHANNELS],
+        "top": [moo._leaderboard(bot, c, 10) for c in [None] + CHANNELS],
+        "pages": [moo._leaderboard_page(bot, c, 5, 3) for c in [None] + CHANNELS],
+        "ranks": [moo._rank(bot, n, c) for n in nicks[:8] for c in (None, CHANNELS[0])],
+    }
+    return json.loads(json.dumps(seen))
+
+
+def _import(bot, rng, nicks, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for nick in rng.sample(nicks, 20):
+            f.write(json.dumps({"nick": nick, "count": rng.randrange(100)}) + "\n")
+            f.write(json.dumps({"nick": nick, "channel": rng.choice(CHANNELS),
+                                "count": rng.randrange(50)}) + "\n")
+    for mode in moo.IMPORT_MODES:
+        moo.import_counts(bot, path, mode)
+
+
+def _script(bot, scratch, seed=7):
+    """
+    Play the seeded script (moos, resets, an import and a reconcile);
+    returns what a user could see every CHECK_EVERY steps, then the export.
+    """
+    rng = random.Random(seed)
+    nicks = [f"n{i}" for i in range(60)]
+    observed = []
+    for step in range(SCRIPT_STEPS):
+        nick = rng.choice(nicks)
+        r = rng.random()
+        if r < 0.004:
+            moo.reset_counts(bot, nick)
+        elif r < 0.005:
+            moo.reset_counts(bot)
+        else:
+            chan = rng.choice(CHANNELS + ["alice"])   # a nick: moo in private
+            moo._handle_moo_increment(bot, nick, chan, legendary=False, say_response=False,
+                                      inc_override=rng.choice((1, 1, 1, 2, 20, -3)))
+        if step == SCRIPT_STEPS // 2:
+            _import(bot, rng, nicks, str(scratch / "import.jsonl"))
+            moo._reconcile_totals(bot)
+        if step % CHECK_EVERY == CHECK_EVERY - 1:
+            observed.append(_observe(bot, nicks))
+
+    store = moo._store(bot)
+    observed.append({"export": _export(store), "totals": store.totals()})
+    return observed
+
+
+def _run(backend, write_behind, scratch):
+    bot = _fresh_bot(backend, write_behind)
+    try:
+        return _script(bot, scratch)
+    finally:
+        moo.shutdown(bot)
+
+
+@pytest.fixture(scope="module")
+def reference(tmp_path_factory):
+    """The script's observations on sqlalchemy, writing straight through."""
+    return _run("sqlalchemy", "false", tmp_path_factory.mktemp("reference"))
+
+
+@pytest.mark.parametrize("backend, write_behind", [
+    ("sqlalchemy", "true"),
+    ("sqlite", "false"),
+    ("sqlite", "true"),
+    ("memory", "false"),
+])
+def test_script_matches_sqlalchemy(reference, backend, write_behind, tmp_path):
+    observed = _run(backend, write_behind, tmp_path)
+    assert len(observed) == len(reference)
+    for i, (want, got) in enumerate(zip(reference, observed)):
+        assert got == want, f"check {i} differs in {[k for k in want if got.get(k) != want[k]]}"
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""_TopIndex against a plain dict of every count: always the true top of the scope, save for unsure nicks."""
+
+import random
+
+import moo
+
+
+def _true_top(counts, unsure, n):
+    return sorted(((-c, nick) for nick, c in counts.items() if nick not in unsure))[:n]
+
+
+def test_keeps_the_best_rows_in_leaderboard_order():
+    index = moo._TopIndex([("carol", 2), ("alice", 5), ("bob", 2), ("dave", 1)], keep=3)
+    assert not index.complete
+    assert index.top(5) == [("alice", 5), ("bob", 2), ("carol", 2)]
+    assert index.covers(3) and not index.covers(4)
+
+    small = moo._TopIndex([("alice", 5)], keep=3)
+    assert small.complete and small.covers(10)
+
+
+def test_a_nick_from_outside_is_unsure_until_set():
+    index = moo._TopIndex([("alice", 5), ("bob", 4), ("carol", 3)], keep=2)
+    index.add("carol", 4)
+    assert index.unsure == {"carol"}
+    assert index.top(2) == [("alice", 5), ("bob", 4)]
+    index.add("dave", -2)   # can only fall further behind
+    assert index.unsure == {"carol"}
+
+    index.set("carol", 7)
+    assert index.unsure == set()
+    assert index.top(2) == [("carol", 7), ("alice", 5)]
+
+
+def test_a_nick_that_falls_past_the_last_row_is_dropped():
+    index = moo._TopIndex([("alice", 5), ("bob", 4), ("carol", 3)], keep=2)
+    index.add("alice", -3)
+    assert index.top(5) == [("bob", 4)]
+    assert not index.covers(2)
+    index.remove("bob")
+    index.set("dave", 1)    # nothing left to rank it against
+    assert index.top(5) == []
+
+
+def test_a_complete_index_takes_every_nick():
+    index = moo._TopIndex([("alice", 5)], keep=3)
+    index.add("bob", 2)
+    index.set("carol", -1)
+    assert index.top(5) == [("alice", 5), ("bob", 2), ("carol", -1)]
+    index.add("dave", 9)
+    assert not index.complete
+    assert index.top(5) == [("dave", 9), ("alice", 5), ("bob", 2)]
+
+
+def test_random_updates_match_the_table():
+    rng = random.Random(4)
+    for keep in (1, 3, 10):
+        nicks = [f"n{i}" for i in range(30)]
+        counts = {nick: rng.randrange(-3, 20) for nick in rng.sample(nicks, 12)}
+        index = moo._TopIndex(list(counts.items()), keep)
+        for _ in range(3000):
+            nick = rng.choice(nicks)
+            r = rng.random()
+            if r < 0.5:
+                delta = rng.choice((1, 1, 2, 20, -3))
+                counts[nick] = counts.get(nick, 0) + delta
+                index.add(nick, delta)
+            elif r < 0.8:
+                counts[nick] = rng.randrange(-3, 40)
+                index.set(nick, counts[nick])
+            else:
+                counts.pop(nick, None)
+                index.remove(nick)
+            assert len(index.keys) <= keep
+            assert index.keys == _true_top(counts, index.unsure, len(index.keys))
+            assert index.counts == {nick: -c for c, nick in index.keys}
+            if index.complete:
+                assert len(index.keys) == len(counts)